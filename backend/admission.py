@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from starlette.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the moving average of service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """Bounds concurrent requests to one endpoint, with a bounded and time-limited wait queue.
+
+    Requests beyond max_concurrent wait up to queue_timeout seconds for a slot.
+    When max_queue requests are already waiting, new ones are rejected at once
+    with 429; requests that time out in the queue get 503. Both carry a
+    Retry-After estimate derived from the recent service time.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.service_time = 1.0
+
+    @classmethod
+    def from_env(cls, name: str, max_concurrent: int, max_queue: int, queue_timeout: float) -> "AdmissionController":
+        """Read ADMISSION_<NAME>_CONCURRENCY / _QUEUE / _TIMEOUT, falling back to the given defaults."""
+        prefix = f"ADMISSION_{name.upper()}"
+        return cls(
+            name,
+            int(os.getenv(f"{prefix}_CONCURRENCY", str(max_concurrent))),
+            int(os.getenv(f"{prefix}_QUEUE", str(max_queue))),
+            float(os.getenv(f"{prefix}_TIMEOUT", str(queue_timeout)))
+        )
+
+    def retry_after(self) -> int:
+        backlog = (self.waiting + self.active) / self.max_concurrent
+        return max(1, math.ceil(backlog * self.service_time))
+
+    async def acquire(self) -> float:
+        """Wait for a slot and return the admission time, or raise Overloaded."""
+        if self.active + self.waiting >= self.max_concurrent + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(429, self.retry_after(), f"{self.name} queue is full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded(503, self.retry_after(), f"{self.name} timed out waiting for capacity")
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        return time.monotonic()
+
+    def release(self, admitted_at: float):
+        elapsed = time.monotonic() - admitted_at
+        self.service_time += SERVICE_TIME_SMOOTHING * (elapsed - self.service_time)
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def admit(self):
+        admitted_at = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    def stats(self) -> Dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "service_time": round(self.service_time, 3)
+        }
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """StreamingResponse that holds an admission slot until the response is done.
+
+    The slot is released however the response ends, including when it is
+    cancelled before the body generator ever starts, which a finally in the
+    generator would miss.
+    """
+
+    def __init__(self, content, controller: AdmissionController, admitted_at: float, **kwargs):
+        super().__init__(content, **kwargs)
+        self.controller = controller
+        self.admitted_at = admitted_at
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.controller.release(self.admitted_at)
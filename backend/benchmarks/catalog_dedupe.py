@@ -0,0 +1,64 @@
+"""Dedupe ratio and lookup latency of the MinHash/LSH item catalog.
+
+    python benchmarks/catalog_dedupe.py [restaurant_menus.json] [sweeps]
+
+Each sweep re-adds every item with light rewording (case, punctuation and a
+suffix on the description), the way repeated scrapes of the same menus differ.
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from catalog import ItemCatalog
+
+
+def reworded(item, rng):
+    name = item["name"]
+    if rng.random() < 0.5:
+        name = name.upper()
+    if rng.random() < 0.5:
+        name = name + "!"
+    description = item.get("description", "")
+    if rng.random() < 0.5:
+        description = description + " Served fresh daily."
+    return {**item, "name": name, "description": description}
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(BACKEND_DIR, "restaurant_menus.json")
+    sweeps = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with open(path) as f:
+        restaurants = json.load(f)
+    items = [item for restaurant in restaurants for item in restaurant.get("menu_items", [])]
+
+    rng = random.Random(0)
+    corpus = list(items)
+    for _ in range(sweeps - 1):
+        corpus.extend(reworded(item, rng) for item in items)
+
+    catalog = ItemCatalog()
+    start = time.perf_counter()
+    for item in corpus:
+        catalog.add(item["name"], item.get("description", ""), item.get("restrictions", ["NONE"]))
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    for item in corpus:
+        start = time.perf_counter()
+        catalog.match(item["name"], item.get("description", ""))
+        latencies.append(time.perf_counter() - start)
+
+    print(f"{len(corpus)} items ({len(items)} distinct x {sweeps} sweeps) -> {len(catalog)} canonical items")
+    print(f"dedupe ratio: {len(corpus) / max(len(catalog), 1):.2f}x")
+    print(f"build: {build_seconds * 1000:.1f} ms, lookup: median {statistics.median(latencies) * 1e6:.0f} us, "
+          f"p99 {sorted(latencies)[int(len(latencies) * 0.99)] * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
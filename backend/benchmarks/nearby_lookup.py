@@ -0,0 +1,64 @@
+"""Latency of nearby lookups served from the local place index.
+
+    python benchmarks/nearby_lookup.py [places] [queries]
+
+Sweeps a synthetic ~2km x 2km area with 100m searches, then times radius
+queries at random points inside it. Uses a throwaway cache database.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from cache import Cache
+from place_index import PlaceIndex
+
+ORIGIN = (43.4723, -80.5449)
+SPAN = 0.018
+STEP = 0.001
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(0)
+    places = [{
+        "place_id": f"place-{i}", "name": f"Place {i}", "address": "", "rating": 4.0, "price_level": 2, "website": "",
+        "lat": ORIGIN[0] + rng.uniform(0, SPAN), "lng": ORIGIN[1] + rng.uniform(0, SPAN)
+    } for i in range(count)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = PlaceIndex(Cache(os.path.join(tmp, "cache.sqlite3")))
+        start = time.perf_counter()
+        steps = int(SPAN / STEP) + 1
+        for i in range(steps):
+            for j in range(steps):
+                lat, lng = ORIGIN[0] + i * STEP, ORIGIN[1] + j * STEP
+                index.add_sweep(lat, lng, 100, [p for p in places if abs(p["lat"] - lat) < STEP and abs(p["lng"] - lng) < STEP])
+        print(f"Indexed {index.stats()} in {time.perf_counter() - start:.2f}s")
+
+        points = [
+            (ORIGIN[0] + rng.uniform(0.002, SPAN - 0.002), ORIGIN[1] + rng.uniform(0.002, SPAN - 0.002))
+            for _ in range(queries)
+        ]
+        # The first pass reads each cell from the cache once; the second is memory only
+        for label in ("cold", "warm"):
+            timings, served, found = [], 0, 0
+            for lat, lng in points:
+                start = time.perf_counter()
+                result = index.lookup(lat, lng, 100)
+                timings.append(time.perf_counter() - start)
+                if result is not None:
+                    served += 1
+                    found += len(result)
+            timings.sort()
+            print(f"{label}: {served}/{queries} lookups served locally, {found / max(served, 1):.1f} places each, "
+                  f"median {statistics.median(timings) * 1e6:.0f}us, p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f}us")
+
+if __name__ == "__main__":
+    main()
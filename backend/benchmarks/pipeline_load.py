@@ -0,0 +1,56 @@
+"""Drive the full menu + planning pipeline against the offline fake providers.
+
+    PROVIDERS=fake FAKE_LATENCY_MS=200 FAKE_FAILURE_RATE=0.05 python benchmarks/pipeline_load.py [events] [locations]
+
+Uses a throwaway cache and menu snapshot, so nothing is read from or written
+to the real ones.
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("PROVIDERS", "fake")
+os.environ["CACHE_PATH"] = os.path.join(_tmp, "cache.sqlite3")
+os.environ["MENU_SNAPSHOT_PATH"] = os.path.join(_tmp, "restaurant_menus.snap")
+
+from googlemap import get_restaurant_menus
+from planner import GenerateMealResponse, Restrictions, generate_batch
+from providers import get_providers
+
+
+def make_events(count: int, locations: int):
+    rng = random.Random(0)
+    centers = [(43.0 + rng.uniform(-0.05, 0.05), -81.27 + rng.uniform(-0.05, 0.05)) for _ in range(locations)]
+    for _ in range(count):
+        lat, long = rng.choice(centers)
+        yield GenerateMealResponse(
+            restrictions=Restrictions(GLUTEN=rng.randint(0, 5), LACTOSE=rng.randint(0, 5), VEGAN=rng.randint(0, 5),
+                                      VEGETARIAN=rng.randint(0, 5), HALAL=rng.randint(0, 3), NUT=rng.randint(0, 3),
+                                      NORMAL=rng.randint(10, 50)),
+            days=rng.randint(1, 5), long=long, lat=lat
+        )
+
+
+async def run(count: int, locations: int):
+    events = list(make_events(count, locations))
+    latencies = []
+    start = time.perf_counter()
+    async for _ in generate_batch(get_providers().llm, events, get_restaurant_menus):
+        latencies.append(time.perf_counter() - start)
+    total = time.perf_counter() - start
+
+    print(f"{count} events over {locations} locations in {total:.2f}s ({count / total:.1f} events/s)")
+    print(f"completion time: median {statistics.median(latencies):.2f}s, max {max(latencies):.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+                    int(sys.argv[2]) if len(sys.argv) > 2 else 10))
@@ -0,0 +1,70 @@
+"""Compare cold-start loading of a city-sized menu set: JSON file vs menu snapshot.
+
+    python benchmarks/snapshot_load.py [restaurants] [items per restaurant]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from snapshot import RESTRICTION_BITS, MenuSnapshot, restaurant_key
+
+
+def synthetic_restaurants(count: int, items: int):
+    rng = random.Random(0)
+    for i in range(count):
+        yield {
+            'name': f"Restaurant {i}",
+            'address': f"{i} Main St",
+            'rating': round(rng.uniform(3, 5), 1),
+            'price_level': rng.randint(0, 4),
+            'website': f"https://restaurant{i}.example.com",
+            'place_id': f"place-{i}",
+            'menu_items': [{
+                'name': f"Dish {j}",
+                'description': "Seasonal vegetables, rice and house sauce",
+                'price': round(rng.uniform(5, 40), 2),
+                'category': rng.choice(["Mains", "Appetizers", "Desserts", "Drinks"]),
+                'restrictions': rng.sample(RESTRICTION_BITS[:-1], rng.randint(1, 3))
+            } for j in range(items)]
+        }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    restaurants = list(synthetic_restaurants(count, items))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "restaurant_menus.json")
+        snap_path = os.path.join(tmp, "restaurant_menus.snap")
+        with open(json_path, 'w') as f:
+            json.dump(restaurants, f, indent=2)
+        MenuSnapshot(snap_path).append(restaurants)
+
+        start = time.perf_counter()
+        with open(json_path) as f:
+            json.load(f)
+        json_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        snapshot = MenuSnapshot(snap_path)
+        open_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, count, max(count // 100, 1)):
+            snapshot.get(restaurant_key(restaurants[i]))
+        lookup_seconds = (time.perf_counter() - start) / len(range(0, count, max(count // 100, 1)))
+
+        print(f"{count} restaurants x {items} items")
+        print(f"json:     {os.path.getsize(json_path) / 1e6:8.1f} MB  load {json_seconds * 1000:8.1f} ms")
+        print(f"snapshot: {os.path.getsize(snap_path) / 1e6:8.1f} MB  open {open_seconds * 1000:8.1f} ms"
+              f"  lookup {lookup_seconds * 1e6:.0f} us/restaurant")
+
+
+if __name__ == "__main__":
+    main()
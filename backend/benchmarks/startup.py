@@ -0,0 +1,54 @@
+"""Measure backend cold start in fresh interpreters: import time and time to first response.
+
+    python benchmarks/startup.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+client.get("/plans/startup-probe")
+responded = time.perf_counter()
+heavy = [m for m in ("pandas", "openai", "haystack", "bs4", "cloudscraper", "fake_useragent", "googlemap", "llm") if m in sys.modules]
+print(json.dumps({"import": imported - start, "first_response": responded - start, "heavy": heavy}))
+"""
+
+DEFERRED = """
+import time
+start = time.perf_counter()
+import googlemap, llm, pandas, openai
+print(time.perf_counter() - start)
+"""
+
+
+def run(code: str) -> str:
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "startup-benchmark"))
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    samples = [json.loads(run(PROBE)) for _ in range(runs)]
+    deferred = [float(run(DEFERRED)) for _ in range(runs)]
+
+    print(f"{runs} runs, median")
+    print(f"import main:          {statistics.median(s['import'] for s in samples) * 1000:8.1f} ms")
+    print(f"first response:       {statistics.median(s['first_response'] for s in samples) * 1000:8.1f} ms")
+    print(f"deferred heavy stack: {statistics.median(deferred) * 1000:8.1f} ms (paid by the first scrape/CSV request)")
+    print(f"heavy modules loaded at startup: {samples[0]['heavy'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache.sqlite3"))
+LEASE_TIMEOUT = float(os.getenv("CACHE_LEASE_TIMEOUT", "60"))
+LEASE_POLL_INTERVAL = 0.1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+"""
+
+
+class Cache:
+    """Namespaced key/value store shared by every worker process through a SQLite database in WAL mode.
+
+    Each write is a single autocommitted statement, so readers never see partial
+    values and never block on writers.
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return None
+        return json.loads(value)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, separators=(',', ':')), expires_at)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Error writing cache entry {namespace}/{key}: {e}")
+
+    def set_many(self, namespace: str, values: Dict[str, Any], ttl: Optional[float] = None):
+        """Write several entries in one transaction."""
+        expires_at = time.time() + ttl if ttl is not None else None
+        rows = [(namespace, key, json.dumps(value, separators=(',', ':')), expires_at) for key, value in values.items()]
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error(f"Error writing {len(rows)} cache entries to {namespace}: {e}")
+
+    def scan(self, namespace: str, prefix: str = "") -> List[Tuple[str, Any]]:
+        """Live entries of a namespace whose key starts with prefix."""
+        rows = self._conn().execute(
+            "SELECT key, value FROM cache WHERE namespace = ? AND key >= ? AND key < ? "
+            "AND (expires_at IS NULL OR expires_at >= ?)",
+            (namespace, prefix, prefix + "\uffff", time.time())
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def delete(self, namespace: str, key: str):
+        self._conn().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def _acquire_lease(self, namespace: str, key: str, owner: str, timeout: float) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "DELETE FROM leases WHERE namespace = ? AND key = ? AND expires_at < ?",
+            (namespace, key, now)
+        )
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO leases (namespace, key, owner, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, owner, now + timeout)
+        )
+        return cursor.rowcount == 1
+
+    def _release_lease(self, namespace: str, key: str, owner: str):
+        self._conn().execute(
+            "DELETE FROM leases WHERE namespace = ? AND key = ? AND owner = ?",
+            (namespace, key, owner)
+        )
+
+    def get_or_compute(self, namespace: str, key: str, compute: Callable[[], Any],
+                       ttl: Optional[float] = None, lease_timeout: float = LEASE_TIMEOUT) -> Any:
+        """Return the cached value, computing it at most once across all workers.
+
+        The first caller takes a lease and runs compute(); concurrent callers in
+        any process wait for its result instead of repeating the upstream work.
+        """
+        value = self.get(namespace, key)
+        if value is not None:
+            return value
+
+        owner = uuid.uuid4().hex
+        deadline = time.time() + lease_timeout
+        while not self._acquire_lease(namespace, key, owner, lease_timeout):
+            time.sleep(LEASE_POLL_INTERVAL)
+            value = self.get(namespace, key)
+            if value is not None:
+                return value
+            if time.time() > deadline:
+                logger.warning(f"Lease wait timed out for {namespace}/{key}, computing locally")
+                return compute()
+
+        try:
+            value = self.get(namespace, key)
+            if value is None:
+                value = compute()
+                if value is not None:
+                    self.set(namespace, key, value, ttl)
+            return value
+        finally:
+            self._release_lease(namespace, key, owner)
+
+
+class LRUCache:
+    """In-process cache with a per-entry TTL, evicting the least recently used entry beyond max_entries."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[Cache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Cache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = Cache()
+    return _cache
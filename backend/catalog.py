@@ -0,0 +1,211 @@
+import logging
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 4
+MATCH_THRESHOLD = 0.75
+# Word overlap two descriptions need before one item may reuse the other's classification
+DESCRIPTION_MATCH_THRESHOLD = 0.9
+
+# Words that make a dish a different dietary variant ("Chocolate Cake" vs "Chocolate
+# Cake GF"); items only match when they carry exactly the same qualifiers
+DIETARY_QUALIFIERS = {
+    "GLUTEN": r"\b(gf|gluten free|gluten less|celiac|coeliac|no gluten)\b",
+    "LACTOSE": r"\b(df|dairy free|lactose free|non dairy|no dairy)\b",
+    "VEGAN": r"\b(vegan|plant based)\b",
+    "VEGETARIAN": r"\b(vegetarian|veggie|meatless)\b",
+    "NUT": r"\b(nut free|peanut free|tree nut free|no nuts?)\b",
+    "HALAL": r"\bhalal\b",
+    "KOSHER": r"\bkosher\b",
+}
+# Allergen and meat ingredients; "Pad Thai" with and without peanuts are different dishes
+# to the classifier however close their names are, so these must agree as well
+INGREDIENT_QUALIFIERS = {
+    "PEANUT": r"\b(peanuts?|satay)\b",
+    "TREE_NUT": r"\b(almonds?|cashews?|walnuts?|pecans?|pistachios?|hazelnuts?|macadamias?|pine nuts?|praline|pesto)\b",
+    "PORK": r"\b(pork|bacon|ham|pepperoni|prosciutto|pancetta|chorizo|salami|sausages?|lard)\b",
+    "BEEF": r"\b(beef|steak|brisket|veal|burger patty)\b",
+    "POULTRY": r"\b(chicken|turkey|duck)\b",
+    "SHELLFISH": r"\b(shrimps?|prawns?|crabs?|lobsters?|clams?|mussels?|oysters?|scallops?|squid|calamari)\b",
+    "FISH": r"\b(fish|salmon|tuna|cod|anchov(y|ies)|sardines?|tilapia|halibut)\b",
+    "DAIRY": r"\b(cheese|mozzarella|parmesan|cheddar|feta|cream|butter|milk|yogurt|yoghurt|ghee)\b",
+    "EGG": r"\b(eggs?|mayo|mayonnaise|aioli)\b",
+}
+_QUALIFIER_PATTERNS = {
+    tag: re.compile(pattern) for tag, pattern in {**DIETARY_QUALIFIERS, **INGREDIENT_QUALIFIERS}.items()
+}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed permutation coefficients so signatures are stable across processes
+_PERMUTATIONS = [
+    ((i * 0x9E3779B1 + 0x7F4A7C15) % _MERSENNE_PRIME | 1, (i * 0x85EBCA77 + 0xC2B2AE3D) % _MERSENNE_PRIME)
+    for i in range(1, NUM_PERM + 1)
+]
+
+
+def normalize(text: str) -> str:
+    text = re.sub(r"[^a-z0-9 ]+", " ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def shingles(name: str, description: str = "") -> Set[str]:
+    """Character shingles of the name plus word shingles of the description.
+
+    The name dominates, so the same dish with a reworded description still
+    lands close to its canonical entry; reusing that entry's classification
+    additionally needs the descriptions to agree (see description_similarity).
+    """
+    normalized_name = normalize(name)
+    result = {normalized_name[i:i + SHINGLE_SIZE] for i in range(max(len(normalized_name) - SHINGLE_SIZE + 1, 1))}
+    words = normalize(description).split()
+    result.update(f"{words[i]} {words[i + 1]}" for i in range(len(words) - 1))
+    return result
+
+
+def qualifiers(name: str, description: str = "") -> FrozenSet[str]:
+    text = f"{normalize(name)} {normalize(description)}"
+    return frozenset(tag for tag, pattern in _QUALIFIER_PATTERNS.items() if pattern.search(text))
+
+
+def description_similarity(left: str, right: str) -> float:
+    """1.0 for descriptions equal after normalizing, else the Jaccard overlap of their words."""
+    left, right = normalize(left), normalize(right)
+    if left == right:
+        return 1.0
+    left_words, right_words = set(left.split()), set(right.split())
+    return len(left_words & right_words) / len(left_words | right_words)
+
+
+def signature(tokens: Iterable[str]) -> Tuple[int, ...]:
+    hashes = [zlib.crc32(token.encode("utf-8")) for token in tokens] or [0]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    return sum(1 for a, b in zip(left, right) if a == b) / NUM_PERM
+
+
+@dataclass
+class CanonicalItem:
+    id: int
+    name: str
+    description: str
+    restrictions: List[str]
+    signature: Tuple[int, ...] = field(repr=False)
+    qualifiers: FrozenSet[str] = frozenset()
+    count: int = 1
+
+
+class ItemCatalog:
+    """Canonical menu items indexed with MinHash/LSH for near-duplicate lookup.
+
+    A match also needs the same dietary and ingredient qualifiers in the name
+    and description, so a "GF" variant or the pepperoni pizza never lines up
+    with the plain dish. With match_restrictions set, the restriction sets
+    must be identical too. Only classified() matches may reuse a canonical
+    item's restrictions; plain matches are for dedupe.
+    """
+
+    def __init__(self, threshold: float = MATCH_THRESHOLD, match_restrictions: bool = False):
+        self.threshold = threshold
+        self.match_restrictions = match_restrictions
+        self.items: List[CanonicalItem] = []
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _bands(self, sig: Tuple[int, ...]):
+        for band in range(BANDS):
+            yield (band, sig[band * ROWS:(band + 1) * ROWS])
+
+    def _match(self, sig: Tuple[int, ...], item_qualifiers: FrozenSet[str],
+               restrictions: Optional[List[str]] = None, description: Optional[str] = None) -> Optional[CanonicalItem]:
+        candidates = set()
+        for bucket in self._bands(sig):
+            candidates.update(self._buckets.get(bucket, ()))
+        best, best_score = None, self.threshold
+        for item_id in candidates:
+            candidate = self.items[item_id]
+            if candidate.qualifiers != item_qualifiers:
+                continue
+            if self.match_restrictions and set(candidate.restrictions) != set(restrictions or []):
+                continue
+            if description is not None and \
+                    description_similarity(description, candidate.description) < DESCRIPTION_MATCH_THRESHOLD:
+                continue
+            score = similarity(sig, candidate.signature)
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def match(self, name: str, description: str = "") -> Optional[CanonicalItem]:
+        return self._match(signature(shingles(name, description)), qualifiers(name, description))
+
+    def classified(self, name: str, description: str = "") -> Optional[CanonicalItem]:
+        """A near-duplicate whose description says the same thing, so its classification can be reused."""
+        return self._match(signature(shingles(name, description)), qualifiers(name, description),
+                           description=description)
+
+    def add(self, name: str, description: str, restrictions: List[str]) -> CanonicalItem:
+        """Return the canonical entry for this item, creating one if no near-duplicate exists."""
+        sig = signature(shingles(name, description))
+        item_qualifiers = qualifiers(name, description)
+        with self._lock:
+            existing = self._match(sig, item_qualifiers, restrictions)
+            if existing is not None:
+                existing.count += 1
+                return existing
+            item = CanonicalItem(len(self.items), name, description, list(restrictions), sig, item_qualifiers)
+            self.items.append(item)
+            for bucket in self._bands(sig):
+                self._buckets.setdefault(bucket, []).append(item.id)
+            return item
+
+
+def dedupe_items(items: List[Dict], threshold: float = MATCH_THRESHOLD) -> List[Dict]:
+    """Collapse near-duplicate menu item dicts with identical restrictions, keeping the first of each group."""
+    catalog = ItemCatalog(threshold, match_restrictions=True)
+    kept = []
+    for item in items:
+        size = len(catalog)
+        catalog.add(item.get("name", ""), item.get("description", ""), item.get("restrictions", []))
+        if len(catalog) > size:
+            kept.append(item)
+    return kept
+
+
+_catalog: Optional[ItemCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> ItemCatalog:
+    """Process-wide catalog, seeded from every menu item in the menu snapshot."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                from snapshot import get_snapshot
+
+                start = time.perf_counter()
+                catalog = ItemCatalog()
+                for restaurant in get_snapshot().restaurants():
+                    for item in restaurant.get("menu_items", []):
+                        catalog.add(item.get("name", ""), item.get("description", ""), item.get("restrictions", ["NONE"]))
+                logger.info(f"Built item catalog with {len(catalog)} canonical items in {time.perf_counter() - start:.2f}s")
+                _catalog = catalog
+    return _catalog
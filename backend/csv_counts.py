@@ -0,0 +1,142 @@
+import logging
+import os
+from typing import Dict, IO, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from profiling import timed
+
+logger = logging.getLogger(__name__)
+
+CSV_CHUNK_SIZE = int(os.getenv("CSV_CHUNK_SIZE", "50000"))
+
+RESTRICTION_GROUPS = ["GLUTEN", "LACTOSE", "VEGAN", "VEGETARIAN", "HALAL", "KOSHER", "NUT"]
+# Restrictions a diet already covers: vegan meals are also vegetarian and
+# lactose-free, so a vegan who ticks those too is planned as just VEGAN
+IMPLIED_BY = {"VEGAN": ["VEGETARIAN", "LACTOSE"]}
+TRUTHY_VALUES = {"1", "1.0", "true", "t", "yes", "y", "x"}
+
+_NUM_MASKS = 1 << len(RESTRICTION_GROUPS)
+_SINGLE_FIELD_PATTERNS = {group: rf"\b{group}S?\b" for group in RESTRICTION_GROUPS}
+
+
+def mask_label(mask: int) -> str:
+    groups = [group for bit, group in enumerate(RESTRICTION_GROUPS) if mask & (1 << bit)]
+    return "+".join(sorted(groups)) or "NORMAL"
+
+
+def planner_group(mask: int) -> str:
+    """The Restrictions group a person with this mask is planned under.
+
+    Several restrictions make a combined group ("NUT+VEGAN") whose meals must
+    satisfy every one of them.
+    """
+    for group, implied in IMPLIED_BY.items():
+        if mask & (1 << RESTRICTION_GROUPS.index(group)):
+            for other in implied:
+                mask &= ~(1 << RESTRICTION_GROUPS.index(other))
+    return mask_label(mask)
+
+
+_PLANNER_GROUP = [planner_group(mask) for mask in range(_NUM_MASKS)]
+
+
+def truthy(column: pd.Series) -> np.ndarray:
+    """Vectorized yes/no parsing of a boolean, numeric or text column."""
+    if pd.api.types.is_bool_dtype(column):
+        return column.fillna(False).to_numpy(dtype=bool)
+    if pd.api.types.is_numeric_dtype(column):
+        return column.fillna(0).to_numpy() != 0
+    return column.astype(str).str.strip().str.lower().isin(TRUTHY_VALUES).to_numpy()
+
+
+class RestrictionCounter:
+    """Aggregates attendees' restriction combinations as bitmasks, one chunk at a time.
+
+    Either single_field names one column holding restriction words
+    ("VEGAN", "NUT, GLUTEN", ...), or dietary_fields maps each lower-case
+    group to a boolean/yes-no column.
+    """
+
+    def __init__(self, dietary_fields: Optional[Dict[str, Optional[str]]] = None, single_field: Optional[str] = None):
+        self.single_field = single_field
+        self.columns = {
+            group: (dietary_fields or {}).get(group.lower())
+            for group in RESTRICTION_GROUPS
+        }
+        self.mask_counts = np.zeros(_NUM_MASKS, dtype=np.int64)
+        self.column_counts = {group: 0 for group in RESTRICTION_GROUPS}
+
+    def add(self, chunk: pd.DataFrame):
+        masks = np.zeros(len(chunk), dtype=np.int64)
+        if self.single_field:
+            if self.single_field not in chunk:
+                raise KeyError(f"Column {self.single_field!r} not found")
+            values = chunk[self.single_field].fillna("").astype(str).str.upper()
+            for bit, group in enumerate(RESTRICTION_GROUPS):
+                hits = values.str.contains(_SINGLE_FIELD_PATTERNS[group], regex=True).to_numpy()
+                self.column_counts[group] += int(hits.sum())
+                masks |= hits.astype(np.int64) << bit
+        else:
+            for bit, group in enumerate(RESTRICTION_GROUPS):
+                column = self.columns[group]
+                if not column or column not in chunk:
+                    continue
+                hits = truthy(chunk[column])
+                self.column_counts[group] += int(hits.sum())
+                masks |= hits.astype(np.int64) << bit
+        self.mask_counts += np.bincount(masks, minlength=_NUM_MASKS)
+
+    @property
+    def people(self) -> int:
+        return int(self.mask_counts.sum())
+
+    def restrictions(self) -> Dict[str, int]:
+        """People per planner group, each person counted exactly once.
+
+        Every single group is present; combined groups only when someone has
+        that combination.
+        """
+        counts = {group: 0 for group in RESTRICTION_GROUPS + ["NORMAL"]}
+        for mask in np.flatnonzero(self.mask_counts):
+            group = _PLANNER_GROUP[mask]
+            counts[group] = counts.get(group, 0) + int(self.mask_counts[mask])
+        return counts
+
+    def combinations(self) -> Dict[str, int]:
+        return {
+            mask_label(mask): int(self.mask_counts[mask])
+            for mask in np.flatnonzero(self.mask_counts)
+        }
+
+    def breakdown(self) -> Dict:
+        return {
+            "people": self.people,
+            "restrictions": self.restrictions(),
+            "columns": {
+                group: {"column": self.single_field or self.columns[group], "count": self.column_counts[group]}
+                for group in RESTRICTION_GROUPS
+            },
+            "combinations": self.combinations()
+        }
+
+
+@timed()
+def count_restrictions(source: Union[str, IO], diet_columns: Dict, chunk_size: int = CSV_CHUNK_SIZE) -> RestrictionCounter:
+    """Stream a CSV in chunks through a RestrictionCounter configured from find_diet_columns output."""
+    if diet_columns.get("is_single_dietary_field"):
+        counter = RestrictionCounter(single_field=diet_columns.get("single_dietary_field"))
+    else:
+        counter = RestrictionCounter(dietary_fields=diet_columns.get("dietary_fields"))
+    for chunk in pd.read_csv(source, chunksize=chunk_size):
+        counter.add(chunk)
+    logger.info(f"Counted restrictions for {counter.people} people")
+    return counter
+
+
+def read_columns(source: IO) -> pd.Index:
+    """Header row only; rewinds the file so it can be streamed afterwards."""
+    columns = pd.read_csv(source, nrows=0).columns
+    source.seek(0)
+    return columns
@@ -1,19 +1,26 @@
-import requests
-from bs4 import BeautifulSoup
 from typing import Dict, List, Optional, Set
 import re
 from dataclasses import dataclass
 import json
+import hashlib
 import time
-import openai
-from fake_useragent import UserAgent
 import logging
 from concurrent.futures import ThreadPoolExecutor
-import cloudscraper
 import concurrent.futures
 import os
+import threading
 from dotenv import load_dotenv
 from enum import Enum
+from pydantic import BaseModel
+from cache import get_cache
+from catalog import get_catalog
+from snapshot import get_snapshot
+from place_index import get_place_index
+from place_details import DETAIL_FIELDS, field_value, get_place_details_store
+from planner import item_satisfies
+from providers import Providers, get_providers
+from usage import in_context
+from profiling import timed
 
 load_dotenv()
 
@@ -53,111 +60,285 @@ class Restaurant:
     price_level: int
     website: str
     menu_items: List[MenuItem] = None
+    place_id: str = ""
+
+class GeneratedMenuItem(BaseModel):
+    name: str
+    description: str
+    price: float
+    category: str
+    dietary_info: List[str]
+    restrictions: List[DietaryRestriction]
+
+class GeneratedMenu(BaseModel):
+    items: List[GeneratedMenuItem]
+
+GENERATED_MENU_NAMESPACE = "generated_menus"
+NEARBY_NAMESPACE = "nearby_places"
+SCRAPED_MENU_NAMESPACE = "scraped_menus"
+CLASSIFICATION_NAMESPACE = "classifications"
+NEARBY_TTL = float(os.getenv("NEARBY_TTL", str(24 * 3600)))
+SCRAPED_MENU_TTL = float(os.getenv("SCRAPED_MENU_TTL", str(7 * 24 * 3600)))
+GENERATION_BACKOFF_BASE = float(os.getenv("GENERATION_BACKOFF_BASE", "2"))
+GENERATION_BACKOFF_MAX = float(os.getenv("GENERATION_BACKOFF_MAX", "300"))
+# Seconds a website scrape runs alone before a generated menu races it; negative disables hedging
+MENU_HEDGE_DELAY = float(os.getenv("MENU_HEDGE_DELAY", "4"))
+MENU_HEDGE_WORKERS = int(os.getenv("MENU_HEDGE_WORKERS", "32"))
+MENU_GENERATE_WORKERS = int(os.getenv("MENU_GENERATE_WORKERS", "16"))
+
+BASE_PRICE = {
+    "appetizer": {"low-cost": 8, "mid-range": 12, "high-end": 18},
+    "main": {"low-cost": 15, "mid-range": 25, "high-end": 40},
+    "dessert": {"low-cost": 6, "mid-range": 10, "high-end": 15},
+    "drink": {"low-cost": 4, "mid-range": 8, "high-end": 12}
+}
+
+# System prompts hold every static instruction and the user message only the
+# per-call data, so each call site shares one stable prefix that providers
+# can serve from their prompt cache.
+MENU_GENERATION_SYSTEM_PROMPT = """You are a menu generation expert. Generate a realistic menu with diverse dietary options for the restaurant and price range given by the user.
+Include items that meet various dietary restrictions, and tag every item with ALL restrictions it satisfies:
+- GLUTEN: Gluten-free options
+- LACTOSE: Dairy-free options
+- VEGAN: No animal products
+- VEGETARIAN: No meat products
+- HALAL: Follows Islamic dietary laws
+- KOSHER: Follows Jewish dietary laws
+- NUT: Contains nuts (mark for allergy awareness)
+- NONE: No special dietary considerations
+
+Guidelines:
+1. Include 8-10 items across different categories
+2. Include at least 2 vegetarian options, at least 1 vegan option and at least 1 gluten-free option
+3. Give clear ingredient listings in descriptions for allergen identification
+4. Only use ["NONE"] as restrictions when no other restriction applies
+5. Keep prices within the ranges for the restaurant's price range:
+""" + "\n".join(
+    f"- {price_range}: " + ", ".join(
+        f"{course.title()}s ${prices[price_range]}-${prices[price_range] + (15 if course == 'main' else 4)}"
+        for course, prices in BASE_PRICE.items()
+    )
+    for price_range in ("low-cost", "mid-range", "high-end")
+)
+
+CLASSIFICATION_SYSTEM_PROMPT = """You are an expert at identifying dietary restrictions in food items.
+For the menu item given by the user, carefully analyze ingredients and preparation methods to determine ALL applicable dietary restrictions.
+Consider:
+- GLUTEN: Items that are gluten-free
+- LACTOSE: Items that are dairy-free
+- VEGAN: No animal products
+- VEGETARIAN: No meat products
+- HALAL: Follows Islamic dietary laws
+- KOSHER: Follows Jewish dietary laws
+- NUT: Contains nuts or nut products
+- NONE: No special dietary considerations
+
+If multiple restrictions apply (e.g. an item is both vegan and gluten-free), include all of them.
+Only return ["NONE"] if no restrictions apply.
+
+Return ONLY a JSON array, for example:
+["VEGAN", "GLUTEN"] or ["VEGETARIAN", "NUT"] or ["NONE"]"""
+
+MENU_EXTRACTION_SYSTEM_PROMPT = """You are an expert at identifying menu items from restaurant websites.
+Extract clear menu items with detailed information from the website text given by the user.
+Format as a JSON array with:
+- name: Item name
+- description: Description
+- price: Number (0 if unknown)
+- category: Category name
+- dietary_info: Array of dietary notes"""
+
+def restaurant_from_place(place: Dict) -> Restaurant:
+    return Restaurant(
+        name=place['name'],
+        address=place['address'],
+        rating=place['rating'],
+        price_level=place['price_level'],
+        website=place['website'],
+        place_id=place.get('place_id', '')
+    )
+
+def price_range_for(price_level: int) -> str:
+    return "low-cost" if price_level <= 1 else "mid-range" if price_level == 2 else "high-end"
+
+def menu_item_to_dict(item: MenuItem) -> Dict:
+    return {
+        'name': item.name,
+        'description': item.description,
+        'price': item.price,
+        'category': item.category,
+        'dietary_info': item.dietary_info,
+        'restrictions': [r.name for r in item.restrictions] if item.restrictions else ["NONE"]
+    }
+
+def generated_menu_key(restaurant_name: str, price_level: int, place_id: str = "") -> str:
+    return f"{place_id or restaurant_name}:{price_level}"
+
+def coverage_met(coverage: Dict[str, int], counts: Dict[str, int]) -> bool:
+    return all(counts.get(group, 0) >= needed for group, needed in coverage.items())
+
+def classification_key(item_name: str, description: str, dietary_info: List[str]) -> str:
+    raw = "\x1f".join([item_name.strip().lower(), description.strip().lower(), ",".join(sorted(dietary_info or []))])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def menu_item_from_dict(data: Dict) -> MenuItem:
+    return MenuItem(
+        name=data.get('name', ''),
+        description=data.get('description', ''),
+        price=float(data.get('price', 0)),
+        category=data.get('category', 'Uncategorized'),
+        dietary_info=data.get('dietary_info', []),
+        restrictions={DietaryRestriction(r) for r in data.get('restrictions', ["NONE"])}
+    )
+
+def json_array(content: str) -> list:
+    """The JSON array in an LLM reply, tolerating code fences and surrounding prose."""
+    content = content.replace('```json', '').replace('```', '').strip()
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        match = re.search(r'\[.*\]', content, re.DOTALL)
+        if not match:
+            raise
+        data = json.loads(match.group())
+    if not isinstance(data, list):
+        raise ValueError(f"expected a JSON array, got {type(data).__name__}")
+    return data
+
+def parse_restrictions(content: str) -> Set[DietaryRestriction]:
+    restrictions = {DietaryRestriction(r) for r in json_array(content)}
+    if not restrictions:
+        raise ValueError("no restrictions in reply")
+    return restrictions
+
+def parse_menu_items(content: str) -> List[Dict]:
+    items = json_array(content)
+    if not all(isinstance(item, dict) and item.get('name') for item in items):
+        raise ValueError("menu items must be objects with a name")
+    return items
+
+def require_items(generated: GeneratedMenu):
+    if not generated.items:
+        raise ValueError("empty generated menu")
+
+_generation_backoff: Dict[str, tuple] = {}
+_generation_backoff_lock = threading.Lock()
+
+# Hedged scrapes and hedge generations get separate pools: losing scrapes can
+# sit blocked on the network for a long time, and a generation queued behind
+# them would stop bounding latency. Nothing running in either pool waits on
+# them, so they can't deadlock.
+_scrape_executor = ThreadPoolExecutor(max_workers=MENU_HEDGE_WORKERS, thread_name_prefix="menu-scrape")
+_generate_executor = ThreadPoolExecutor(max_workers=MENU_GENERATE_WORKERS, thread_name_prefix="menu-generate")
+
+def scrape_result(future: concurrent.futures.Future, restaurant: Restaurant) -> Optional[List[Dict]]:
+    try:
+        return future.result()
+    except Exception as e:
+        logger.error(f"Error scraping menu for {restaurant.name}: {e}")
+        return None
 
 class RestaurantMenuFinder:
-    def __init__(self, google_api_key: str, openai_api_key: str):
-        self.google_api_key = google_api_key
-        self.openai_api_key = openai_api_key
-        openai.api_key = openai_api_key
-        self.scraper = cloudscraper.create_scraper()
-        self.session = requests.Session()
-        self.user_agent = UserAgent()
-
-    def get_place_details(self, place_id: str) -> Dict:
-        base_url = "https://maps.googleapis.com/maps/api/place/details/json"
-        params = {
-            'place_id': place_id,
-            'key': self.google_api_key,
-            'fields': 'name,rating,formatted_phone_number,website,price_level,reviews,editorial_summary'
-        }
-        
+    def __init__(self, providers: Optional[Providers] = None):
+        providers = providers or get_providers()
+        self.places = providers.places
+        self.fetcher = providers.fetcher
+        self.llm = providers.llm
+
+    def get_place_details(self, place_id: str, fields: List[str] = DETAIL_FIELDS) -> Dict:
         try:
-            response = requests.get(base_url, params=params)
-            response.raise_for_status()
-            return response.json()
+            return self.places.place_details(place_id, fields=",".join(fields))
         except Exception as e:
             logger.error(f"Error fetching place details: {e}")
             return {}
 
+    def refresh_place_details(self, place_id: str) -> Optional[Dict]:
+        """Stored details with only the stale fields re-fetched; None if this place's details were never fetched."""
+        store = get_place_details_store()
+        record = store.get(place_id)
+        stale = store.stale_fields(record, DETAIL_FIELDS)
+        if not stale:
+            store.note_skipped()
+            return record
+        details = self.get_place_details(place_id, stale)
+        if 'result' not in details:
+            # Stale details beat dropping the place
+            return record if all(field in record for field in DETAIL_FIELDS) else None
+        return store.update(place_id, details['result'], stale)
+
+    @timed()
     def get_nearby_restaurants(self, latitude: float, longitude: float, radius: int = 100) -> List[Restaurant]:
-        base_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-        params = {
-            'location': f"{latitude},{longitude}",
-            'radius': radius,
-            'type': 'restaurant',
-            'key': self.google_api_key
-        }
-        
+        index = get_place_index()
+        places = index.lookup(latitude, longitude, radius)
+        if places is None:
+            places = get_cache().get_or_compute(
+                NEARBY_NAMESPACE,
+                f"{latitude:.4f},{longitude:.4f}:{radius}",
+                lambda: self.search_nearby_places(latitude, longitude, radius),
+                ttl=NEARBY_TTL
+            )
+            if places is not None:
+                index.add_sweep(latitude, longitude, radius, places)
+        else:
+            logger.info(f"Serving {len(places)} nearby places from the local index")
+        return [restaurant_from_place(place) for place in places or []]
+
+    def search_nearby_places(self, latitude: float, longitude: float, radius: int) -> Optional[List[Dict]]:
         try:
-            response = requests.get(base_url, params=params)
-            response.raise_for_status()
-            results = response.json()
+            results = self.places.nearby_search(latitude, longitude, radius)
             
+            if results['status'] == 'ZERO_RESULTS':
+                return []
             if results['status'] != 'OK':
                 logger.error(f"API Error: {results['status']}")
-                return []
+                return None
             
-            restaurants = []
+            places = []
             with ThreadPoolExecutor(max_workers=10) as executor:
                 future_to_place = {
-                    executor.submit(self.get_place_details, place['place_id']): place 
+                    executor.submit(self.refresh_place_details, place['place_id']): place
                     for place in results['results']
                 }
                 
                 for future in concurrent.futures.as_completed(future_to_place):
                     place = future_to_place[future]
+                    location = place.get('geometry', {}).get('location', {})
                     try:
                         details = future.result()
-                        if 'result' in details:
-                            restaurant = Restaurant(
-                                name=place.get('name', 'Unknown'),
-                                address=place.get('vicinity', 'N/A'),
-                                rating=float(place.get('rating', 0.0)),
-                                price_level=int(place.get('price_level', 0)),
-                                website=details['result'].get('website', '')
-                            )
-                            restaurants.append(restaurant)
+                        if details is not None:
+                            places.append({
+                                'name': place.get('name', 'Unknown'),
+                                'address': place.get('vicinity', 'N/A'),
+                                'rating': float(place.get('rating', 0.0)),
+                                'price_level': int(place.get('price_level', 0)),
+                                'website': field_value(details, 'website', ''),
+                                'place_id': place['place_id'],
+                                'lat': location.get('lat', latitude),
+                                'lng': location.get('lng', longitude)
+                            })
                     except Exception as e:
                         logger.error(f"Error processing place: {e}")
             
-            return restaurants
+            return places
             
         except Exception as e:
             logger.error(f"Error fetching nearby restaurants: {e}")
-            return []
+            return None
 
+    @timed()
     def fetch_website_content(self, url: str, restaurant_name: str) -> str:
         if not url:
             return ""
 
-        clean_url = url.split('?')[0]
-        headers = {
-            'User-Agent': self.user_agent.random,
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
-        }
-
-        try:
-            response = self.scraper.get(clean_url, headers=headers, timeout=15)
-            if response.status_code == 200:
-                return response.text
-
-            response = self.session.get(clean_url, headers=headers, timeout=15)
-            if response.status_code == 200:
-                return response.text
-
-        except Exception as e:
-            logger.error(f"Error fetching website {clean_url}: {e}")
-        
-        return ""
+        return self.fetcher.fetch(url.split('?')[0])
 
+    @timed()
     def extract_menu_content(self, html_content: str, restaurant_name: str) -> str:
         if not html_content:
             return ""
-            
+
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(html_content, 'html.parser')
         
         for element in soup.find_all(['script', 'style', 'footer', 'header', 'nav']):
@@ -203,76 +384,63 @@ class RestaurantMenuFinder:
 
         return "\n".join(menu_content)
 
+    @timed()
     def analyze_dietary_restrictions(self, item_name: str, description: str, dietary_info: List[str]) -> Set[DietaryRestriction]:
-        try:
-            system_prompt = """You are an expert at identifying dietary restrictions in food items.
-            For each menu item, carefully analyze ingredients and preparation methods to determine ALL applicable dietary restrictions.
-            Consider:
-            - GLUTEN: Items that are gluten-free
-            - LACTOSE: Items that are dairy-free
-            - VEGAN: No animal products
-            - VEGETARIAN: No meat products
-            - HALAL: Follows Islamic dietary laws
-            - KOSHER: Follows Jewish dietary laws
-            - NUT: Contains nuts or nut products
-            - NONE: No special dietary considerations
-            
-            Return ONLY a JSON array of applicable restrictions."""
+        cache = get_cache()
+        key = classification_key(item_name, description, dietary_info)
+        cached_restrictions = cache.get(CLASSIFICATION_NAMESPACE, key)
+        if cached_restrictions:
+            return {DietaryRestriction(r) for r in cached_restrictions}
 
-            user_prompt = f"""
-            Analyze this menu item and return ALL applicable dietary restrictions:
-            Name: {item_name}
-            Description: {description}
-            Dietary Info: {', '.join(dietary_info) if dietary_info else 'None'}
-            
-            Consider all ingredients and preparation methods carefully.
-            If multiple restrictions apply (e.g. an item is both vegan and gluten-free), include all of them.
-            Only return ["NONE"] if no restrictions apply.
-            
-            Return ONLY a JSON array, for example:
-            ["VEGAN", "GLUTEN"] or ["VEGETARIAN", "NUT"] or ["NONE"]"""
-
-            response = openai.chat.completions.create(
-                model="gpt-4o",  # Fixed model name from "gpt-4o"
-                messages=[
-                    {"role": "system", "content": system_prompt},
+        try:
+            user_prompt = f"""Name: {item_name}
+Description: {description}
+Dietary Info: {', '.join(dietary_info) if dietary_info else 'None'}"""
+
+            content = self.llm.complete(
+                "classify_item",
+                [
+                    {"role": "system", "content": CLASSIFICATION_SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt}
                 ],
+                validate=parse_restrictions,
                 temperature=0.3,
                 max_tokens=100
             )
-
-            content = response.choices[0].message.content.strip()
-            # Clean the response to ensure valid JSON
-            content = content.replace('```json', '').replace('```', '').strip()
-            if not content.startswith('['):
-                match = re.search(r'\[.*\]', content, re.DOTALL)
-                if match:
-                    content = match.group()
-            
-            restrictions = json.loads(content)
-            return {DietaryRestriction(r) for r in restrictions}
+            restrictions = parse_restrictions(content)
+            cache.set(CLASSIFICATION_NAMESPACE, key, [r.name for r in restrictions])
+            return restrictions
 
         except Exception as e:
             logger.error(f"Error analyzing dietary restrictions: {e}")
             return {DietaryRestriction.NONE}
 
+    @timed()
     def process_menu_items_with_restrictions(self, items: List[dict]) -> List[MenuItem]:
+        catalog = get_catalog()
         with ThreadPoolExecutor(max_workers=10) as executor:
             futures = []
             for item in items:
-                future = executor.submit(
-                    self.analyze_dietary_restrictions,
-                    item.get('name', ''),
-                    item.get('description', ''),
-                    item.get('dietary_info', [])
-                )
-                futures.append((item, future))
+                canonical = catalog.classified(item.get('name', ''), item.get('description', ''))
+                if canonical is not None:
+                    # Same dish with the same description: inherit its classification
+                    future = concurrent.futures.Future()
+                    future.set_result({DietaryRestriction(r) for r in canonical.restrictions})
+                else:
+                    future = executor.submit(
+                        in_context(self.analyze_dietary_restrictions),
+                        item.get('name', ''),
+                        item.get('description', ''),
+                        item.get('dietary_info', [])
+                    )
+                futures.append((item, future, canonical))
             
             menu_items = []
-            for item, future in futures:
+            for item, future, canonical in futures:
                 try:
                     restrictions = future.result()
+                    if canonical is None:
+                        catalog.add(item.get('name', ''), item.get('description', ''), [r.name for r in restrictions])
                     menu_items.append(MenuItem(
                         name=item.get('name', ''),
                         description=item.get('description', ''),
@@ -286,248 +454,271 @@ class RestaurantMenuFinder:
             
             return menu_items
 
-    def generate_menu_with_ai(self, restaurant_name: str, price_level: int) -> List[MenuItem]:
-        """Generate menu items using AI with comprehensive dietary restriction handling."""
-        try:
-            system_prompt = """You are a menu generation expert. Generate a realistic menu with diverse dietary options.
-            Include items that meet various dietary restrictions:
-            - GLUTEN: Gluten-free options
-            - LACTOSE: Dairy-free options
-            - VEGAN: No animal products
-            - VEGETARIAN: No meat products
-            - HALAL: Follows Islamic dietary laws
-            - KOSHER: Follows Jewish dietary laws
-            - NUT: Contains nuts (mark for allergy awareness)
-            - NONE: No special dietary considerations
-            
-            IMPORTANT: Response must be ONLY a JSON array with detailed menu items."""
-
-            price_range = "low-cost" if price_level <= 1 else "mid-range" if price_level == 2 else "high-end"
-            base_price = {
-                "appetizer": {"low-cost": 8, "mid-range": 12, "high-end": 18},
-                "main": {"low-cost": 15, "mid-range": 25, "high-end": 40},
-                "dessert": {"low-cost": 6, "mid-range": 10, "high-end": 15},
-                "drink": {"low-cost": 4, "mid-range": 8, "high-end": 12}
-            }
-            
-            user_prompt = f"""Create a diverse menu for '{restaurant_name}' ({price_range}).
-            Include items for different dietary needs and preferences.
-            Return a JSON array where each item has:
-            {{
-                "name": "item name",
-                "description": "detailed description with specific ingredients",
-                "price": number,
-                "category": "category name",
-                "dietary_info": ["DIETARY_RESTRICTION1", "DIETARY_RESTRICTION2", etc]
-            }}
-            
-            Guidelines:
-            1. Include 8-10 items across different categories
-            2. Price ranges for {price_range}:
-            - Appetizers: ${base_price['appetizer'][price_range]}-${base_price['appetizer'][price_range]+4}
-            - Mains: ${base_price['main'][price_range]}-${base_price['main'][price_range]+15}
-            - Desserts: ${base_price['dessert'][price_range]}-${base_price['dessert'][price_range]+4}
-            - Drinks: ${base_price['drink'][price_range]}-${base_price['drink'][price_range]+4}
-            3. Include:
-            - At least 2 vegetarian options
-            - At least 1 vegan option
-            - At least 1 gluten-free option
-            - Clear ingredient listings for allergen identification
-            
-            RESPOND WITH ONLY THE JSON ARRAY, NO OTHER TEXT."""
+    @timed()
+    def generate_menu_with_ai(self, restaurant_name: str, price_level: int, place_id: str = "") -> List[MenuItem]:
+        """Generate menu items using AI, memoized per place and price level."""
+        price_range = price_range_for(price_level)
+        cache_key = generated_menu_key(restaurant_name, price_level, place_id)
+        cache = get_cache()
 
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    response = openai.chat.completions.create(
-                        model="gpt-4o",
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        temperature=0.3,
-                        max_tokens=2000
-                    )
+        cached_items = cache.get(GENERATED_MENU_NAMESPACE, cache_key)
+        if cached_items:
+            logger.info(f"Using stored generated menu for {restaurant_name}")
+            return [menu_item_from_dict(item) for item in cached_items]
 
-                    content = response.choices[0].message.content.strip()
-                    
-                    # Clean the response
-                    content = content.replace('```json', '').replace('```', '').strip()
-                    if not content.startswith('['):
-                        match = re.search(r'\[.*\]', content, re.DOTALL)
-                        if match:
-                            content = match.group()
-                    
-                    try:
-                        menu_data = json.loads(content)
-                        if isinstance(menu_data, list) and len(menu_data) > 0:
-                            menu_items = []
-                            for item in menu_data:
-                                # Process dietary restrictions for each item
-                                restrictions = self.analyze_dietary_restrictions(
-                                    item.get('name', ''),
-                                    item.get('description', ''),
-                                    item.get('dietary_info', [])
-                                )
-                                
-                                menu_items.append(MenuItem(
-                                    name=item.get('name', ''),
-                                    description=item.get('description', ''),
-                                    price=float(item.get('price', 0)),
-                                    category=item.get('category', 'Uncategorized'),
-                                    dietary_info=item.get('dietary_info', []),
-                                    restrictions=restrictions
-                                ))
-                            return menu_items
-
-                    except json.JSONDecodeError as e:
-                        logger.error(f"JSON decode error on attempt {attempt + 1}: {e}")
-                        if attempt == max_retries - 1:
-                            break
-                
-                except Exception as e:
-                    logger.error(f"OpenAI API error on attempt {attempt + 1}: {e}")
-                    if attempt == max_retries - 1:
-                        break
-                
-                time.sleep(1)  # Brief pause between retries
+        with _generation_backoff_lock:
+            failures, retry_at = _generation_backoff.get(cache_key, (0, 0.0))
+        if time.time() < retry_at:
+            logger.info(f"Menu generation for {restaurant_name} backing off, using default menu")
+            return self.fallback_menu(restaurant_name, price_range)
 
-            # Fallback menu if all attempts fail
-            logger.warning(f"Falling back to default menu for {restaurant_name}")
-            fallback_items = [
-                MenuItem(
-                    name=f"{restaurant_name} House Special",
-                    description="Our signature dish prepared with fresh ingredients. Please ask server for dietary information.",
-                    price=base_price['main'][price_range],
-                    category="House Specials",
-                    dietary_info=["Please ask server for details"],
-                    restrictions={DietaryRestriction.NONE}
-                ),
+        user_prompt = f"""Restaurant: {restaurant_name}
+Price range: {price_range}"""
+
+        try:
+            generated = self.llm.parse(
+                "generate_menu",
+                [
+                    {"role": "system", "content": MENU_GENERATION_SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt}
+                ],
+                response_format=GeneratedMenu,
+                validate=require_items,
+                temperature=0.3,
+                max_tokens=2000
+            )
+
+            menu_items = [
                 MenuItem(
-                    name="Vegetarian Garden Plate",
-                    description="Fresh seasonal vegetables with house-made sauce. Vegetarian friendly.",
-                    price=base_price['main'][price_range] - 5,
-                    category="Mains",
-                    dietary_info=["VEGETARIAN"],
-                    restrictions={DietaryRestriction.VEGETARIAN}
+                    name=item.name,
+                    description=item.description,
+                    price=item.price,
+                    category=item.category,
+                    dietary_info=item.dietary_info,
+                    restrictions=set(item.restrictions) or {DietaryRestriction.NONE}
                 )
+                for item in generated.items
             ]
-            return fallback_items
+            cache.set(GENERATED_MENU_NAMESPACE, cache_key, [menu_item_to_dict(item) for item in menu_items])
+            with _generation_backoff_lock:
+                _generation_backoff.pop(cache_key, None)
+            return menu_items
 
         except Exception as e:
-            logger.error(f"Critical error in menu generation for {restaurant_name}: {e}")
-            return [MenuItem(
-                name="Daily Special",
-                description="Please ask server for today's special and dietary information.",
-                price=base_price['main'][price_range],
-                category="Specials",
+            delay = min(GENERATION_BACKOFF_BASE * (2 ** failures), GENERATION_BACKOFF_MAX)
+            with _generation_backoff_lock:
+                _generation_backoff[cache_key] = (failures + 1, time.time() + delay)
+            logger.error(f"Menu generation failed for {restaurant_name} (attempt {failures + 1}, retry in {delay:.0f}s): {e}")
+            logger.warning(f"Falling back to default menu for {restaurant_name}")
+            return self.fallback_menu(restaurant_name, price_range)
+
+    def fallback_menu(self, restaurant_name: str, price_range: str) -> List[MenuItem]:
+        return [
+            MenuItem(
+                name=f"{restaurant_name} House Special",
+                description="Our signature dish prepared with fresh ingredients. Please ask server for dietary information.",
+                price=BASE_PRICE['main'][price_range],
+                category="House Specials",
                 dietary_info=["Please ask server for details"],
                 restrictions={DietaryRestriction.NONE}
-            )]
-    def process_with_ai(self, text_content: str, restaurant_name: str) -> List[MenuItem]:
+            ),
+            MenuItem(
+                name="Vegetarian Garden Plate",
+                description="Fresh seasonal vegetables with house-made sauce. Vegetarian friendly.",
+                price=BASE_PRICE['main'][price_range] - 5,
+                category="Mains",
+                dietary_info=["VEGETARIAN"],
+                restrictions={DietaryRestriction.VEGETARIAN}
+            )
+        ]
+
+    @timed()
+    def process_with_ai(self, text_content: str, restaurant_name: str) -> Optional[List[MenuItem]]:
+        """Menu items extracted from page text; [] if it holds no menu, None if extraction failed."""
         if not text_content:
             return []
 
         try:
-            system_prompt = """You are an expert at identifying menu items from restaurant websites. 
-            Extract clear menu items with detailed information."""
-
-            user_prompt = f"""
-            Extract menu items from this {restaurant_name} website text.
-            Format as a JSON array with:
-            - name: Item name
-            - description: Description
-            - price: Number (0 if unknown)
-            - category: Category name
-            - dietary_info: Array of dietary notes
-
-            Text: {text_content[:4000]}
-            """
-
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
+            user_prompt = f"""Restaurant: {restaurant_name}
+
+Text: {text_content[:4000]}"""
+
+            content = self.llm.complete(
+                "extract_menu",
+                [
+                    {"role": "system", "content": MENU_EXTRACTION_SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt}
                 ],
+                validate=parse_menu_items,
                 temperature=0.3,
                 max_tokens=2000
             )
-
-            content = response.choices[0].message.content.strip()
-            try:
-                menu_data = json.loads(content)
-            except json.JSONDecodeError:
-                json_match = re.search(r'\[.*\]', content, re.DOTALL)
-                if json_match:
-                    menu_data = json.loads(json_match.group())
-                else:
-                    return []
-
-            return self.process_menu_items_with_restrictions(menu_data)
+            return self.process_menu_items_with_restrictions(parse_menu_items(content))
 
         except Exception as e:
             logger.error(f"Error processing with AI: {e}")
-            return []
+            return None
 
+    def scrape_menu(self, restaurant: Restaurant, cancelled: Optional[threading.Event] = None) -> Optional[List[Dict]]:
+        """Scrape and classify the restaurant's menu.
+
+        [] means the page was read and has no menu. None means the scrape was
+        cancelled or the fetch or extraction failed, so nothing gets cached and
+        the next request tries again.
+        """
+        content = self.fetch_website_content(restaurant.website, restaurant.name)
+        if cancelled is not None and cancelled.is_set():
+            return None
+        if not content:
+            logger.info(f"Could not fetch website for {restaurant.name}")
+            return None
+        menu_content = self.extract_menu_content(content, restaurant.name)
+        if cancelled is not None and cancelled.is_set():
+            return None
+        items = self.process_with_ai(menu_content, restaurant.name)
+        if items is None:
+            return None
+        return [menu_item_to_dict(item) for item in items]
+
+    def scrape_menu_cached(self, restaurant: Restaurant, cancelled: Optional[threading.Event] = None) -> Optional[List[Dict]]:
+        if not restaurant.place_id:
+            return self.scrape_menu(restaurant, cancelled)
+        return get_cache().get_or_compute(
+            SCRAPED_MENU_NAMESPACE,
+            restaurant.place_id,
+            lambda: self.scrape_menu(restaurant, cancelled),
+            ttl=SCRAPED_MENU_TTL
+        )
+
+    def generate_menu(self, restaurant: Restaurant) -> List[MenuItem]:
+        return self.generate_menu_with_ai(restaurant.name, restaurant.price_level, restaurant.place_id)
+
+    @timed()
+    def hedged_menu(self, restaurant: Restaurant, delay: float) -> List[MenuItem]:
+        """Scrape, but if that hasn't finished after delay seconds, race it against a cached or generated menu.
+
+        The first usable menu wins. A losing scrape is told to stop at its next
+        stage, before spending LLM calls; one already blocked on the network
+        finishes in the background.
+        """
+        cancelled = threading.Event()
+        scrape = _scrape_executor.submit(in_context(self.scrape_menu_cached), restaurant, cancelled)
+        done, _ = concurrent.futures.wait([scrape], timeout=delay)
+        if done:
+            scraped_items = scrape_result(scrape, restaurant)
+            if scraped_items:
+                return [menu_item_from_dict(item) for item in scraped_items]
+            logger.info(f"No menu found on website for {restaurant.name}, generating menu")
+            return self.generate_menu(restaurant)
+
+        logger.info(f"Scraping {restaurant.name} is taking over {delay}s, hedging with a generated menu")
+        generate = _generate_executor.submit(in_context(self.generate_menu), restaurant)
+        pending = {scrape, generate}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            if scrape in done:
+                scraped_items = scrape_result(scrape, restaurant)
+                if scraped_items:
+                    generate.cancel()
+                    logger.info(f"Scrape won the hedge for {restaurant.name}")
+                    return [menu_item_from_dict(item) for item in scraped_items]
+            if generate in done:
+                cancelled.set()
+                scrape.cancel()
+                logger.info(f"Generated menu won the hedge for {restaurant.name}")
+                return generate.result()
+
+    @timed()
     def process_restaurant(self, restaurant: Restaurant) -> Restaurant:
         if not restaurant.website:
             logger.info(f"No website for {restaurant.name}, generating menu")
-            restaurant.menu_items = self.generate_menu_with_ai(restaurant.name, restaurant.price_level)
+            restaurant.menu_items = self.generate_menu(restaurant)
             return restaurant
 
         logger.info(f"Processing {restaurant.name}")
-        
-        content = self.fetch_website_content(restaurant.website, restaurant.name)
-        if content:
-            menu_content = self.extract_menu_content(content, restaurant.name)
-            found_menu_items = self.process_with_ai(menu_content, restaurant.name)
-            if found_menu_items:
-                restaurant.menu_items = found_menu_items
-            else:
-                logger.info(f"No menu found on website for {restaurant.name}, generating menu")
-                restaurant.menu_items = self.generate_menu_with_ai(restaurant.name, restaurant.price_level)
+
+        if MENU_HEDGE_DELAY >= 0:
+            restaurant.menu_items = self.hedged_menu(restaurant, MENU_HEDGE_DELAY)
+            return restaurant
+
+        scraped_items = self.scrape_menu_cached(restaurant)
+        if scraped_items:
+            restaurant.menu_items = [menu_item_from_dict(item) for item in scraped_items]
         else:
-            logger.info(f"Could not fetch website for {restaurant.name}, generating menu")
-            restaurant.menu_items = self.generate_menu_with_ai(restaurant.name, restaurant.price_level)
+            logger.info(f"No menu found on website for {restaurant.name}, generating menu")
+            restaurant.menu_items = self.generate_menu(restaurant)
         
         return restaurant
 
-    def find_restaurant_menus(self, latitude: float, longitude: float, radius: int = 100) -> List[Restaurant]:
+    def has_cached_menu(self, restaurant: Restaurant) -> bool:
+        cache = get_cache()
+        if restaurant.place_id and restaurant.website and cache.get(SCRAPED_MENU_NAMESPACE, restaurant.place_id):
+            return True
+        key = generated_menu_key(restaurant.name, restaurant.price_level, restaurant.place_id)
+        return cache.get(GENERATED_MENU_NAMESPACE, key) is not None
+
+    def rank_restaurants(self, restaurants: List[Restaurant]) -> List[Restaurant]:
+        """Cached menus first (they return instantly), then by rating, then cheapest."""
+        return sorted(restaurants, key=lambda r: (not self.has_cached_menu(r), -r.rating, r.price_level))
+
+    @timed()
+    def find_restaurant_menus(self, latitude: float, longitude: float, radius: int = 100,
+                              coverage: Optional[Dict[str, int]] = None) -> List[Restaurant]:
+        """Process nearby restaurants in priority order.
+
+        coverage maps a Restrictions group to the number of compatible menu items
+        the planner needs. Once every group is covered, pending restaurants are
+        cancelled and the ones finished so far are returned.
+        """
         try:
-            restaurants = self.get_nearby_restaurants(latitude, longitude, radius)
+            restaurants = self.rank_restaurants(self.get_nearby_restaurants(latitude, longitude, radius))
             logger.info(f"Found {len(restaurants)} restaurants")
 
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                processed_restaurants = list(executor.map(self.process_restaurant, restaurants))
+            executor = ThreadPoolExecutor(max_workers=10)
+            rank = {}
+            futures = []
+            for position, restaurant in enumerate(restaurants):
+                future = executor.submit(in_context(self.process_restaurant), restaurant)
+                rank[future] = position
+                futures.append(future)
+
+            processed = []
+            counts: Dict[str, int] = {}
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        restaurant = future.result()
+                    except Exception as e:
+                        logger.error(f"Error processing restaurant: {e}")
+                        continue
+                    processed.append((rank[future], restaurant))
+
+                    if coverage:
+                        for item in restaurant.menu_items or []:
+                            restrictions = [r.name for r in item.restrictions]
+                            for group in coverage:
+                                if item_satisfies(group, restrictions):
+                                    counts[group] = counts.get(group, 0) + 1
+                        if coverage_met(coverage, counts):
+                            logger.info(f"Coverage reached after {len(processed)} of {len(restaurants)} restaurants")
+                            break
+            finally:
+                # Restaurants already being processed finish in the background and still warm the cache
+                executor.shutdown(wait=False, cancel_futures=True)
 
-            return processed_restaurants
+            return [restaurant for _, restaurant in sorted(processed, key=lambda p: p[0])]
 
         except Exception as e:
             logger.error(f"Error in find_restaurant_menus: {e}")
             return []
     
-def get_restaurant_menus(longitude: float, latitude: float) -> List[Dict]:
-    finder = RestaurantMenuFinder(os.getenv("GOOGLE_API_KEY"), os.getenv("OPENAI_API_KEY"))
-    restaurants = finder.find_restaurant_menus(latitude, longitude)
-    
-    with open('restaurant_menus.json', 'w') as f:
-        json.dump( [{
-        'name': r.name,
-        'address': r.address,
-        'rating': r.rating,
-        'price_level': r.price_level,
-        'website': r.website,
-        'menu_items': [{
-            'name': i.name,
-            'description': i.description,
-            'price': i.price,
-            'category': i.category,
-            'restrictions': [r.name for r in i.restrictions] if i.restrictions else ["NONE"]
-        } for i in (r.menu_items or [])]
-    } for r in restaurants], f, indent=2)
+@timed()
+def get_restaurant_menus(longitude: float, latitude: float, coverage: Optional[Dict[str, int]] = None) -> List[Dict]:
+    finder = RestaurantMenuFinder()
+    restaurants = finder.find_restaurant_menus(latitude, longitude, coverage=coverage)
     
-    return [{
+    results = [{
+        'place_id': r.place_id,
         'name': r.name,
         'address': r.address,
         'rating': r.rating,
@@ -542,6 +733,10 @@ def get_restaurant_menus(longitude: float, latitude: float) -> List[Dict]:
         } for i in (r.menu_items or [])]
     } for r in restaurants]
 
+    get_snapshot().append(results)
+    
+    return results
+
 def concurrent_find_restaurant_menus(longitude: float, latitude: float):
     # Generate variations for wider coverage
     variations = [
@@ -580,10 +775,6 @@ def concurrent_find_restaurant_menus(longitude: float, latitude: float):
             seen.add(key)
             unique_results.append(restaurant)
     
-    # Save results to file
-    with open('restaurant_menus.json', 'w') as f:
-        json.dump(unique_results, f, indent=2)
-    
     return unique_results
 
 
@@ -1,5 +1,5 @@
 import json
-from haystack import Pipeline, PredefinedPipeline
+from haystack import Pipeline, PredefinedPipeline, component
 import urllib.request
 
 from haystack.components.builders import PromptBuilder
@@ -8,8 +8,27 @@ from haystack.components.generators import OpenAIGenerator
 import pandas as pd
 from pydantic import BaseModel
 
+from haystack.core.errors import PipelineMaxComponentRuns
 from validator import OutputValidator
-from typing import Optional
+from routing import get_router
+from usage import record_response_usage
+from typing import Dict, List, Optional
+import queue
+import time
+
+
+@component
+class AccountedGenerator(OpenAIGenerator):
+    """OpenAIGenerator that records token usage under the "detect_columns" stage."""
+
+    @component.output_types(replies=List[str], meta=List[Dict])
+    def run(self, prompt: str, system_prompt: Optional[str] = None, generation_kwargs: Optional[Dict] = None):
+        start = time.perf_counter()
+        # @component rebuilds the class, so zero-argument super() is unavailable here
+        result = OpenAIGenerator.run(self, prompt, system_prompt=system_prompt, generation_kwargs=generation_kwargs)
+        meta = result["meta"][0] if result.get("meta") else {}
+        record_response_usage("detect_columns", meta.get("model", self.model), meta.get("usage"), time.perf_counter() - start)
+        return result
 
 class DietFields(BaseModel):
     gluten: Optional[str]
@@ -25,51 +44,37 @@ class DietOutput(BaseModel):
     single_dietary_field: Optional[str]
     dietary_fields: DietFields
 
-def find_diet_columns(cols: pd.Index):
-    """
-    Feeds the columns into OpenAI and haystack and returns which ones are relevant for dietary restrictions.
-
-    output structure:
-        {
-            "is_single_dietary_field": bool,
-            # if it not a dietary field, then these will map to corresponding columns
-            "dietary_fields": {
-                "gluten": str | None,
-                "lactose": str | None,
-                "vegan": str | None,
-                "vegetarian": str | None,
-                "halal": str | None,
-                "kosher": str | None,
-                "nut": str | None
-            }
-        }
-    """
-
-    columns = cols.tolist()
-
-    generator = OpenAIGenerator()
-    output_validator = OutputValidator(pydantic_model=DietOutput)
-    json_schema = DietOutput.model_json_schema()
-
-    prompt_template = """
+# Static instructions and schema first, the columns last, so retries and
+# other uploads share the cached prompt prefix
+COLUMN_PROMPT_TEMPLATE = """
     Create a JSON object from the following input, which is a list of columns read from a csv file. You need to indicate whether or not the list of columns include any fields where the column records dietary restriction or food allergy:
     Indicate "is_single_dietary_field" as true if there is only one column that records dietary restrictions or food allergies. If there are multiple columns that record dietary restrictions or food allergies, indicate "is_single_dietary_field" as false.
     "single_dietary_field" should be the name of the column that records dietary restrictions or food allergies if "is_single_dietary_field" is true. If "is_single_dietary_field" is false, "single_dietary_field" should be null.
     The "dietary_fields" object should contain the following fields: "gluten", "lactose", "vegan", "vegetarian", "halal", "kosher", and "nut". Each field should contain the name of the column that records the corresponding dietary restriction or food allergy. If a column does not record a particular dietary restriction or food allergy, the field should be null.
-    {{passage}}.
 
     Only use information that is present in the passage. Follow this JSON schema, but only return the actual instances without any additional schema definition:
     {{schema}}
     Make sure your response is a dict and not a list.
+
+    {{passage}}.
     {% if invalid_replies and error_message %}
     You already created the following output in a previous attempt: {{invalid_replies}}
     However, this doesn't comply with the format requirements from above and triggered this Python exception: {{error_message}}
     Correct the output and try again. Just return the corrected output without any extra explanations.
     {% endif %}
     """
-    prompt_builder = PromptBuilder(template=prompt_template)
 
-    pipeline = Pipeline(max_runs_per_component=5)
+
+# LLM attempts per model before the router escalates to the next one
+COLUMN_MAX_RUNS = 3
+
+
+def build_pipeline(model: str) -> Pipeline:
+    generator = AccountedGenerator(model=model)
+    output_validator = OutputValidator(pydantic_model=DietOutput)
+    prompt_builder = PromptBuilder(template=COLUMN_PROMPT_TEMPLATE)
+
+    pipeline = Pipeline(max_runs_per_component=COLUMN_MAX_RUNS)
 
     pipeline.add_component(instance=prompt_builder, name="prompt_builder")
     pipeline.add_component(instance=generator, name="llm")
@@ -81,21 +86,65 @@ def find_diet_columns(cols: pd.Index):
         "output_validator.invalid_replies", "prompt_builder.invalid_replies"
     )
     pipeline.connect("output_validator.error_message", "prompt_builder.error_message")
+    return pipeline
 
-    result = pipeline.run(
-        data={
-            "prompt_builder": {
-                "passage": "The following columns are present in the dataset: "
-                + ", ".join(columns),
-                "schema": json_schema,
-            },
-        }
-    )
+
+# Pipeline.run keeps per-run visit counts on the pipeline itself, so each
+# concurrent call checks out its own; idle ones are reused, clients and all
+_idle_pipelines: Dict[str, "queue.SimpleQueue[Pipeline]"] = {}
+
+
+def checkout_pipeline(model: str) -> Pipeline:
+    try:
+        return _idle_pipelines.setdefault(model, queue.SimpleQueue()).get_nowait()
+    except queue.Empty:
+        return build_pipeline(model)
+
+
+def run_pipeline(model: str, columns: List[str]) -> Dict:
+    pipeline = checkout_pipeline(model)
+    try:
+        result = pipeline.run(
+            data={
+                "prompt_builder": {
+                    "passage": "The following columns are present in the dataset: "
+                    + ", ".join(columns),
+                    "schema": DietOutput.model_json_schema(),
+                },
+            }
+        )
+    except PipelineMaxComponentRuns as e:
+        # Out of re-prompts: a validation failure, so the router can escalate
+        raise ValueError(str(e)) from e
+    finally:
+        _idle_pipelines[model].put(pipeline)
 
     valid_reply = result["output_validator"]["valid_replies"][0]
-    valid_json = json.loads(valid_reply)
+    return json.loads(valid_reply)
+
+
+def find_diet_columns(cols: pd.Index):
+    """
+    Feeds the columns into OpenAI and haystack and returns which ones are relevant for dietary restrictions.
 
-    return valid_json
+    output structure:
+        {
+            "is_single_dietary_field": bool,
+            # if it not a dietary field, then these will map to corresponding columns
+            "dietary_fields": {
+                "gluten": str | None,
+                "lactose": str | None,
+                "vegan": str | None,
+                "vegetarian": str | None,
+                "halal": str | None,
+                "kosher": str | None,
+                "nut": str | None
+            }
+        }
+    """
+
+    columns = cols.tolist()
+    return get_router().call("detect_columns", lambda model: run_pipeline(model, columns))
 
 
 if __name__ == "__main__":
@@ -2,20 +2,42 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-import openai
+from fastapi.responses import JSONResponse, PlainTextResponse
+import hmac
 import os
-import pandas as pd
 import logging
-import io
 from pydantic import BaseModel
-from llm import find_diet_columns
 from enum import IntEnum
-from googlemap import get_restaurant_menus
-from typing import List, Dict
+from admission import AdmissionController, AdmittedStreamingResponse, Overloaded
+from usage import recent_requests, track_request, usage_report
+from routing import get_router
+from profiling import PROFILE_MAX_SECONDS, ProfilerBusy, profile_event_loop, sample_stacks, timed, timing_report
+from planner import (
+    GenerateMealResponse,
+    PlanUpdateRequest,
+    StoredMealPlan,
+    cached_plan,
+    coverage_target,
+    create_plan,
+    find_stored_plan,
+    generate_batch,
+    generate_fallback_meal_plan,
+    load_plan,
+    plan_cache_stats,
+    remember_plan,
+    save_plan,
+    simplify_menu,
+    update_plan,
+)
+from typing import List, Dict, Optional
 import random
 import json
+import asyncio
+
+# openai, pandas, Haystack (llm.py) and the scraping stack (googlemap.py) are
+# imported inside the routes that need them, so importing this module stays cheap
 
  
 # Create a logger
@@ -38,7 +60,16 @@ logger.addHandler(file_handler)
 logger.addHandler(stream_handler)
 
 app = FastAPI(title="AI Food Game Backend")
-client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+def get_llm():
+    from providers import get_providers
+
+    return get_providers().llm
+
+# Per-endpoint concurrency limits and wait queues, overridable with ADMISSION_<NAME>_* env vars
+generate_meal_admission = AdmissionController.from_env("generate_meal", max_concurrent=4, max_queue=16, queue_timeout=10)
+generate_meals_csv_admission = AdmissionController.from_env("generate_meals_csv", max_concurrent=4, max_queue=8, queue_timeout=5)
+generate_meals_batch_admission = AdmissionController.from_env("generate_meals_batch", max_concurrent=1, max_queue=2, queue_timeout=5)
 
 app.add_middleware(
     CORSMiddleware,
@@ -46,8 +77,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+@app.middleware("http")
+async def track_usage(request: Request, call_next):
+    """Attribute the LLM tokens spent while serving a request to its X-Request-ID."""
+    if request.url.path.startswith(("/usage", "/admin")):
+        return await call_next(request)
+    with track_request(request.headers.get("X-Request-ID")) as request_id:
+        response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # # Combined Enums
   
 # class RestrictionType(str, Enum):
@@ -82,21 +124,6 @@ app.add_middleware(
 # NORMAL 100
 
 
-class Restrictions(BaseModel):
-    GLUTEN: int
-    LACTOSE: int
-    VEGAN: int
-    VEGETARIAN: int
-    HALAL: int
-    NUT: int
-    NORMAL: int
-
-class GenerateMealResponse(BaseModel):
-    restrictions: Restrictions
-    days: int
-    long: float
-    lat: float
-    
 class MenuItem(BaseModel):
     name: str
     description: str
@@ -109,193 +136,169 @@ class MealPlan(BaseModel):
     meals: Dict[str, List[Dict[str, any]]]
 
 
-from pydantic import BaseModel
-from typing import List
-
-# Define the meal item structure
-class MealItem(BaseModel):
-    dietary_restriction: str
-    restaurant: str
-    item: str
-    price: float
-    people_count: int
-    is_special_request: bool
-
-# Define the structure for each meal time
-class MealTimeItems(BaseModel):
-    breakfast: List[MealItem]
-    lunch: List[MealItem]
-    dinner: List[MealItem]
-
-# Define the structure for each day's meal plan
-class DayPlan(BaseModel):
-    day: int
-    meals: MealTimeItems
-
-# Define the overall meal plan structure
-class MealPlanResponse(BaseModel):
-    meal_plans: List[DayPlan]
+def overloaded(e: Overloaded) -> HTTPException:
+    logger.warning(f"Shedding request: {e.reason}")
+    return HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
 
 @app.post("/generate-meal")
 async def generate_meal_schedule(response: GenerateMealResponse):
     try:
-        restaurantData = get_restaurant_menus(response.long, response.lat)
-        
-        # Simplify restaurant data
-        simplified_menu = []
-        for restaurant in restaurantData:
-            menu_items = []
-            for item in restaurant["menu_items"]:
-                menu_items.append({
-                    "name": item["name"],
-                    "price": item["price"],
-                    "restrictions": item["restrictions"],
-                    "category": item["category"]
-                })
-            
-            simplified_menu.append({
-                "name": restaurant["name"],
-                "menu_items": menu_items
-            })
-
-        prompt = f"""Create a {response.days}-day meal plan with 3 meals per day.
-People count per restriction:
-- GLUTEN: {response.restrictions.GLUTEN}
-- LACTOSE: {response.restrictions.LACTOSE}
-- VEGAN: {response.restrictions.VEGAN}
-- VEGETARIAN: {response.restrictions.VEGETARIAN}
-- HALAL: {response.restrictions.HALAL}
-- NUT: {response.restrictions.NUT}
-- NO RESTRICTIONS: {response.restrictions.NORMAL}
-
-Rules:
-1. Use existing menu items or create reasonable alternatives
-2. Mark created items with "(Special Request)"
-3. Ensure each person gets breakfast, lunch, and dinner
-4. Price ranges: Breakfast $8-15, Lunch $12-25, Dinner $15-35
-
-Available Restaurants:
-{json.dumps(simplified_menu, indent=2)}"""
-
-        completion = await client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {"role": "system", "content": "You are a meal planning assistant that creates detailed meal plans based on restaurant data and dietary restrictions."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format=MealPlanResponse
-        )
-        return completion.choices[0].message.parsed
+        async with generate_meal_admission.admit():
+            return await plan_meal_schedule(response)
+    except Overloaded as e:
+        # Degraded mode: serve the last plan stored for an equivalent request
+        stored_plan = find_stored_plan(response)
+        if stored_plan is not None:
+            return JSONResponse(stored_plan.model_dump(), headers={"X-Degraded": "stored-plan"})
+        raise overloaded(e)
+
+@timed()
+async def plan_meal_schedule(response: GenerateMealResponse):
+    try:
+        stored_plan = cached_plan(response)
+        if stored_plan is not None:
+            logger.info(f"Serving cached plan {stored_plan.plan_id}")
+            return stored_plan
+
+        from googlemap import get_restaurant_menus
+
+        restaurantData = await asyncio.to_thread(get_restaurant_menus, response.long, response.lat, coverage_target(response))
+        simplified_menu = simplify_menu(restaurantData)
+
+        plan = await create_plan(get_llm(), response.restrictions.model_dump(), response.days, simplified_menu)
+        plan_id = save_plan(response, simplified_menu, plan)
+        remember_plan(response, plan_id, restaurantData)
+        return StoredMealPlan(plan_id=plan_id, meal_plans=plan.meal_plans)
 
     except Exception as e:
         logger.error(f"Error generating meal plan: {str(e)}")
         fallback_plan = generate_fallback_meal_plan(response)
         return fallback_plan
-    
-def generate_fallback_meal_plan(response):
-    """Generate a basic meal plan when the API fails"""
-    meal_plans = []
-    for day in range(response.days):
-        meals = {
-            "breakfast": [],
-            "lunch": [],
-            "dinner": []
-        }
-        
-        for restriction, count in response.restrictions.dict().items():
-            if count > 0:
-                for meal_type in meals:
-                    price = 12 if meal_type == "breakfast" else 18 if meal_type == "lunch" else 25
-                    meals[meal_type].append({
-                        "dietary_restriction": restriction,
-                        "restaurant": "Tim Hortons",  # Safe fallback
-                        "item": f"{restriction.title()} Friendly {meal_type.title()} (Special Request)",
-                        "price": price,
-                        "people_count": count,
-                        "is_special_request": True
-                    })
-                    
-        meal_plans.append({
-            "day": day + 1,
-            "meals": meals
-        })
-    
-    return {"meal_plans": meal_plans}
+
+@app.post("/generate-meals-batch")
+async def generate_meals_batch(events: List[GenerateMealResponse]):
+    """Stream one NDJSON line per event as its plan completes; menus are fetched once per location cell."""
+    from googlemap import get_restaurant_menus
+
+    try:
+        admitted_at = await generate_meals_batch_admission.acquire()
+    except Overloaded as e:
+        raise overloaded(e)
+
+    async def stream():
+        async for result in generate_batch(get_llm(), events, get_restaurant_menus):
+            yield json.dumps(result) + "\n"
+
+    return AdmittedStreamingResponse(stream(), generate_meals_batch_admission, admitted_at, media_type="application/x-ndjson")
+
+@app.get("/plans/{plan_id}")
+async def get_plan(plan_id: str):
+    stored = load_plan(plan_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return StoredMealPlan(plan_id=plan_id, **stored["plan"])
+
+@app.patch("/plans/{plan_id}")
+async def patch_plan(plan_id: str, update: PlanUpdateRequest):
+    """Recompute only the restriction groups and days that changed, against the plan's menu snapshot."""
+    plan = await update_plan(get_llm(), plan_id, update)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return plan
+
+@app.get("/usage")
+async def get_usage():
+    """Token counts, cache hit rate and LLM latency per stage since startup, plus totals for recent requests.
+
+    routing gives each call site's model chain, escalation rate and which models served it;
+    plan_cache gives hits, misses and invalidations of the finished-plan cache.
+    """
+    return {
+        "process": usage_report(),
+        "routing": get_router().stats(),
+        "plan_cache": plan_cache_stats(),
+        "requests": recent_requests()
+    }
+
+@app.get("/usage/{request_id}")
+async def get_request_usage(request_id: str):
+    report = usage_report(request_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="No usage recorded for this request")
+    return report
+
+# Admin routes exist only when ADMIN_TOKEN is set, and require it in X-Admin-Token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_worker(seconds: float = 10, mode: str = "sample", include_idle: bool = False):
+    """Profile this worker for a number of seconds.
+
+    mode=sample samples every thread's stack and returns collapsed stacks
+    (feed to flamegraph.pl or speedscope); mode=cprofile runs cProfile on the
+    event loop thread and returns pstats output.
+    """
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}]")
+    try:
+        if mode == "sample":
+            output = await asyncio.to_thread(sample_stacks, seconds, include_idle=include_idle)
+        elif mode == "cprofile":
+            output = await profile_event_loop(seconds)
+        else:
+            raise HTTPException(status_code=400, detail="mode must be 'sample' or 'cprofile'")
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(output)
+
+@app.get("/admin/timings", dependencies=[Depends(require_admin)])
+async def get_timings():
+    """Wall-time histograms (calls, percentiles, buckets) for the hot functions, since startup."""
+    return timing_report()
 
 @app.post("/generate-meals-csv")
-async def generate_meals_csv(csv_file: UploadFile = File(...), count: int = Form(...)):
-    print("FIlE", csv_file, "COUNT", count)
+async def generate_meals_csv(csv_file: UploadFile = File(...), count: int = Form(...), breakdown: bool = Form(False)):
+    try:
+        async with generate_meals_csv_admission.admit():
+            return await count_csv_restrictions(csv_file, count, breakdown)
+    except Overloaded as e:
+        raise overloaded(e)
+
+@timed()
+async def count_csv_restrictions(csv_file: UploadFile, count: int, breakdown: bool = False):
+    """Count attendees per restriction group, streaming the upload in chunks.
+
+    Returns the flat counts the Restrictions model expects, with combined
+    groups ("NUT+VEGAN") for attendees who have several restrictions, or with
+    breakdown set, the per-column counts and raw combinations as well.
+    """
     if csv_file.content_type == 'text/csv':
-        # Read the CSV file
-        contents = await csv_file.read()
-        csv_data = contents.decode("utf-8")
-        df = pd.read_csv(io.StringIO(csv_data))
-
-        # Count how many instances of each restriction type in the column with the food
-        # items' restrictions
-        restriction_words = ["GLUTEN", "LACTOSE", "VEGAN", "VEGETARIAN", "HALAL", "KOSHER", "NUT"]
-        restriction_count = {word: 0 for word in restriction_words}
-
-        # GLUTEN: 2 
-        # LACTOSE: 0 
-
-        # [random shit] [restriction column]
-        # The restriction column can contain any of the strings "GLUTEN, LACTOSE ... " 
-
-        # AI pipeline
-        llm_response = find_diet_columns(df.columns)
-        array = df.values
-        array2 = pd.read_csv(io.StringIO(csv_data), header=None).values
-        # Check that the column json has the property is_single_dietary_field set to true
-        #{
-        # "is_single_dietary_field": false,
-        # "single_dietary_field": null,
-        # "dietary_fields": {
-        #     "gluten": "GLUTEN",
-        #     "lactose": "LACTOSE",
-        #     "vegan": "VEGAN",
-        #     "vegetarian": "VEGETARIAN",
-        #     "halal": "HALAL",
-        #     "kosher": "KOSHER",
-        #     "nut": null
-        # }
-
-        # {
-        # gluten: 10
-        # personCount: 100 
-        # nut: 12
-        # }
-
-        foundColumn = 0 
-        for row in array2: 
-            columnCount = 0
-            for entry in row: 
-                if str(entry) in llm_response["single_dietary_field"]: 
-                    foundColumn = columnCount
-                columnCount += 1
-        print("FOUND COLUMN", foundColumn)
-        
-        personCount = 0; 
-        if llm_response["is_single_dietary_field"]:  
-            for row in array: 
-                columnCount = 0
-                for entry in row: 
-                    print("ENTRY ", entry, " COUNT", columnCount)
-                    if (str(entry).strip().upper() in restriction_words) and columnCount == foundColumn: 
-                        restriction_count[entry.strip()] += 1
-                    elif (columnCount == foundColumn): 
-                        personCount += 1 
-                    columnCount += 1
-        else: 
-            print("Several fields, we will not handle this in the demo ;)") # we arent doing this yet! 
-
-        restriction_count["NORMAL"] = personCount
-        # print out the list of restriction types and their counts
-        return restriction_count
+        from csv_counts import count_restrictions, read_columns
+        from llm import find_diet_columns
+
+        try:
+            # AI pipeline: which column(s) hold the dietary restrictions. It blocks on
+            # the LLM (and any re-asks), so keep it off the event loop
+            llm_response = await asyncio.to_thread(find_diet_columns, read_columns(csv_file.file))
+            counter = await asyncio.to_thread(count_restrictions, csv_file.file, llm_response)
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Could not count restrictions: {e}")
+        logger.info(f"Counted restrictions for {counter.people} people in {csv_file.filename}")
+        return counter.breakdown() if breakdown else counter.restrictions()
     else:
         raise HTTPException(status_code=400, detail="Invalid file format. Please upload a CSV file.")
 
-
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # WEB_CONCURRENCY > 1 launches N worker processes that share the SQLite cache (see cache.py)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), workers=workers)
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), reload=True)
\ No newline at end of file
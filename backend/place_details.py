@@ -0,0 +1,82 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from cache import Cache, get_cache
+
+logger = logging.getLogger(__name__)
+
+PLACE_DETAILS_NAMESPACE = "place_details"
+# Details fields the app actually reads; everything else comes from nearby search
+DETAIL_FIELDS = ["website"]
+# How long each field stays fresh, overridable with PLACE_FIELD_TTL_<FIELD>
+DEFAULT_FIELD_TTL = float(os.getenv("PLACE_FIELD_TTL", str(30 * 24 * 3600)))
+FIELD_TTLS = {
+    "website": float(os.getenv("PLACE_FIELD_TTL_WEBSITE", str(DEFAULT_FIELD_TTL))),
+}
+# Records untouched for this long are dropped from the store
+PLACE_DETAILS_TTL = float(os.getenv("PLACE_DETAILS_TTL", str(90 * 24 * 3600)))
+
+
+class PlaceDetailsStore:
+    """Place Details fields per place_id, each with its own fetch time.
+
+    A field missing from a Details response (a place without a website, say)
+    is stored as None, so "known to be absent" stays fresh too and isn't
+    re-requested on every search.
+    """
+
+    def __init__(self, cache: Cache, field_ttls: Optional[Dict[str, float]] = None):
+        self.cache = cache
+        self.field_ttls = field_ttls or FIELD_TTLS
+        self._lock = threading.Lock()
+        self.fetched_fields = 0
+        self.skipped_places = 0
+
+    def get(self, place_id: str) -> Dict[str, List]:
+        """The stored record: field -> [value, fetched_at]."""
+        return self.cache.get(PLACE_DETAILS_NAMESPACE, place_id) or {}
+
+    def stale_fields(self, record: Dict[str, List], fields: List[str], now: Optional[float] = None) -> List[str]:
+        now = now if now is not None else time.time()
+        return [
+            field for field in fields
+            if field not in record or now - record[field][1] >= self.field_ttls.get(field, DEFAULT_FIELD_TTL)
+        ]
+
+    def update(self, place_id: str, fetched: Dict[str, Any], fields: List[str]) -> Dict[str, List]:
+        """Merge a Details result for the requested fields into the stored record."""
+        now = time.time()
+        record = {**self.get(place_id), **{field: [fetched.get(field), now] for field in fields}}
+        self.cache.set(PLACE_DETAILS_NAMESPACE, place_id, record, ttl=PLACE_DETAILS_TTL)
+        with self._lock:
+            self.fetched_fields += len(fields)
+        return record
+
+    def note_skipped(self):
+        with self._lock:
+            self.skipped_places += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"fetched_fields": self.fetched_fields, "skipped_places": self.skipped_places}
+
+
+def field_value(record: Dict[str, List], field: str, default: Any = None) -> Any:
+    entry = record.get(field)
+    return entry[0] if entry and entry[0] is not None else default
+
+
+_place_details: Optional[PlaceDetailsStore] = None
+_place_details_lock = threading.Lock()
+
+
+def get_place_details_store() -> PlaceDetailsStore:
+    global _place_details
+    if _place_details is None:
+        with _place_details_lock:
+            if _place_details is None:
+                _place_details = PlaceDetailsStore(get_cache())
+    return _place_details
@@ -0,0 +1,165 @@
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from cache import Cache, get_cache
+
+logger = logging.getLogger(__name__)
+
+PLACES_NAMESPACE = "places"
+PLACE_SWEEPS_NAMESPACE = "place_sweeps"
+# ~55m of latitude per cell, about half the default search radius
+PLACE_CELL_DEGREES = float(os.getenv("PLACE_CELL_DEGREES", "0.0005"))
+# A cell is stale once its last live search is older than this
+PLACE_REFRESH_TTL = float(os.getenv("PLACE_REFRESH_TTL", str(7 * 24 * 3600)))
+# Places not seen by any search for this long are forgotten
+PLACE_TTL = float(os.getenv("PLACE_TTL", str(30 * 24 * 3600)))
+# Fewer local results than this counts as sparse coverage...
+PLACE_MIN_RESULTS = int(os.getenv("PLACE_MIN_RESULTS", "3"))
+# ...and is re-checked live once the covering searches are older than this
+PLACE_SPARSE_RECHECK = float(os.getenv("PLACE_SPARSE_RECHECK", str(24 * 3600)))
+# How often a worker re-reads a cell to pick up other workers' searches
+PLACE_RELOAD_INTERVAL = float(os.getenv("PLACE_RELOAD_INTERVAL", "60"))
+
+METERS_PER_DEGREE = 111320.0
+
+Cell = Tuple[int, int]
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Equirectangular approximation; well within a meter at search radii."""
+    dy = (lat2 - lat1) * METERS_PER_DEGREE
+    dx = (lng2 - lng1) * METERS_PER_DEGREE * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(dx, dy)
+
+
+class PlaceIndex:
+    """Grid index over every restaurant seen so far, answering radius queries without a Places call.
+
+    Each live nearby search (a sweep) stores its places under their grid cell
+    and records the cells it covered in the shared SQLite cache, so every
+    worker benefits. A worker loads a cell into memory the first time it
+    needs it and re-reads it every PLACE_RELOAD_INTERVAL seconds; in between,
+    lookups touch only memory.
+    """
+
+    def __init__(self, cache: Cache, cell_degrees: float = PLACE_CELL_DEGREES):
+        self.cache = cache
+        self.cell_degrees = cell_degrees
+        # Each cell's dict is replaced rather than mutated, so queries can read without the lock
+        self._places: Dict[Cell, Dict[str, Dict]] = {}
+        self._swept: Dict[Cell, float] = {}
+        self._loaded: Dict[Cell, float] = {}
+        self._lock = threading.Lock()
+
+    def cell_of(self, lat: float, lng: float) -> Cell:
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def _cell_key(self, cell: Cell) -> str:
+        return f"{cell[0]},{cell[1]}"
+
+    def _cells_in_box(self, lat: float, lng: float, radius: float) -> List[Cell]:
+        dlat = radius / METERS_PER_DEGREE
+        dlng = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        low_lat, low_lng = self.cell_of(lat - dlat, lng - dlng)
+        high_lat, high_lng = self.cell_of(lat + dlat, lng + dlng)
+        return [(i, j) for i in range(low_lat, high_lat + 1) for j in range(low_lng, high_lng + 1)]
+
+    def cells_covered_by(self, lat: float, lng: float, radius: float) -> List[Cell]:
+        """Cells whose centre lies within the circle, plus the cell holding its centre."""
+        half = self.cell_degrees / 2
+        cells = {
+            cell for cell in self._cells_in_box(lat, lng, radius)
+            if distance_m(lat, lng, cell[0] * self.cell_degrees + half, cell[1] * self.cell_degrees + half) <= radius
+        }
+        cells.add(self.cell_of(lat, lng))
+        return list(cells)
+
+    def _ensure_loaded(self, cell: Cell, now: float):
+        """Re-read a cell from the shared cache when our copy is older than PLACE_RELOAD_INTERVAL."""
+        if now - self._loaded.get(cell, float("-inf")) < PLACE_RELOAD_INTERVAL:
+            return
+        key = self._cell_key(cell)
+        shared_sweep = self.cache.get(PLACE_SWEEPS_NAMESPACE, key)
+        places = {place["place_id"]: place for _, place in self.cache.scan(PLACES_NAMESPACE, f"{key}|")}
+        with self._lock:
+            self._places[cell] = {**self._places.get(cell, {}), **places}
+            if shared_sweep is not None and shared_sweep > self._swept.get(cell, float("-inf")):
+                self._swept[cell] = shared_sweep
+            self._loaded[cell] = now
+
+    def query(self, lat: float, lng: float, radius: float) -> List[Dict]:
+        """Known places within radius meters, nearest first."""
+        ky = METERS_PER_DEGREE
+        kx = METERS_PER_DEGREE * math.cos(math.radians(lat))
+        limit = radius * radius
+        found = []
+        for cell in self._cells_in_box(lat, lng, radius):
+            for place in self._places.get(cell, {}).values():
+                dy = (place["lat"] - lat) * ky
+                dx = (place["lng"] - lng) * kx
+                squared = dx * dx + dy * dy
+                if squared <= limit:
+                    found.append((squared, place))
+        found.sort(key=lambda entry: entry[0])
+        return [place for _, place in found]
+
+    def lookup(self, lat: float, lng: float, radius: float) -> Optional[List[Dict]]:
+        """Answer a nearby search locally, or return None when the area is stale or sparsely covered."""
+        now = time.time()
+        for cell in self._cells_in_box(lat, lng, radius):
+            self._ensure_loaded(cell, now)
+        swept = [self._swept.get(cell) for cell in self.cells_covered_by(lat, lng, radius)]
+        if any(swept_at is None or now - swept_at >= PLACE_REFRESH_TTL for swept_at in swept):
+            return None
+        places = self.query(lat, lng, radius)
+        if len(places) < PLACE_MIN_RESULTS and now - min(swept) >= PLACE_SPARSE_RECHECK:
+            return None
+        return places
+
+    def add_sweep(self, lat: float, lng: float, radius: float, places: List[Dict]):
+        """Record the result of a live search: its places, and the cells it covered."""
+        now = time.time()
+        by_cell: Dict[Cell, Dict[str, Dict]] = {}
+        for place in places:
+            if "lat" not in place:
+                continue
+            by_cell.setdefault(self.cell_of(place["lat"], place["lng"]), {})[place["place_id"]] = place
+        covered = self.cells_covered_by(lat, lng, radius)
+
+        with self._lock:
+            for cell, cell_places in by_cell.items():
+                self._places[cell] = {**self._places.get(cell, {}), **cell_places}
+            for cell in covered:
+                self._swept[cell] = now
+
+        self.cache.set_many(PLACES_NAMESPACE, {
+            f"{self._cell_key(cell)}|{place_id}": place
+            for cell, cell_places in by_cell.items()
+            for place_id, place in cell_places.items()
+        }, ttl=PLACE_TTL)
+        self.cache.set_many(PLACE_SWEEPS_NAMESPACE, {self._cell_key(cell): now for cell in covered}, ttl=PLACE_REFRESH_TTL)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "cells": len(self._places),
+                "places": sum(len(places) for places in self._places.values()),
+                "swept_cells": len(self._swept)
+            }
+
+
+_place_index: Optional[PlaceIndex] = None
+_place_index_lock = threading.Lock()
+
+
+def get_place_index() -> PlaceIndex:
+    global _place_index
+    if _place_index is None:
+        with _place_index_lock:
+            if _place_index is None:
+                _place_index = PlaceIndex(get_cache())
+    return _place_index
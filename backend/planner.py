@@ -0,0 +1,573 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from cache import LRUCache, get_cache
+from catalog import dedupe_items
+from profiling import timed
+from snapshot import get_snapshot, restaurant_key
+
+logger = logging.getLogger(__name__)
+
+PLAN_NAMESPACE = "plans"
+PLAN_INDEX_NAMESPACE = "plan_index"
+PLAN_TTL = float(os.getenv("PLAN_TTL", str(30 * 24 * 3600)))
+MEAL_TYPES = ("breakfast", "lunch", "dinner")
+PLAN_CONCURRENCY = int(os.getenv("PLAN_CONCURRENCY", "8"))
+MENU_FETCH_CONCURRENCY = int(os.getenv("MENU_FETCH_CONCURRENCY", "4"))
+LOCATION_CELL_PRECISION = int(os.getenv("LOCATION_CELL_PRECISION", "3"))
+# Opt-in: plans of at least this many days are generated one day per LLM call (0, the default, disables)
+PARALLEL_PLAN_MIN_DAYS = int(os.getenv("PARALLEL_PLAN_MIN_DAYS", "0"))
+SHORTLIST_SIZE = int(os.getenv("SHORTLIST_SIZE", "60"))
+PRICE_RANGES = {"breakfast": (8, 15), "lunch": (12, 25), "dinner": (15, 35)}
+PLAN_RESULT_CACHE_SIZE = int(os.getenv("PLAN_RESULT_CACHE_SIZE", "512"))
+PLAN_RESULT_TTL = float(os.getenv("PLAN_RESULT_TTL", str(3600)))
+
+# Process-wide limits shared by every endpoint that calls the planner or fetches menus
+_plan_semaphore = asyncio.Semaphore(PLAN_CONCURRENCY)
+_menu_semaphore = asyncio.Semaphore(MENU_FETCH_CONCURRENCY)
+
+# Static instructions only, so every plan request shares this prefix; the
+# user message puts the menu (shared by the per-day calls of one plan) before
+# the counts and day numbering that differ between calls.
+PLAN_SYSTEM_PROMPT = """You are a meal planning assistant that creates detailed meal plans based on restaurant data and dietary restrictions.
+
+Rules:
+1. Use existing menu items or create reasonable alternatives
+2. Mark created items with "(Special Request)"
+3. Ensure each person gets breakfast, lunch, and dinner
+4. Price ranges: Breakfast $8-15, Lunch $12-25, Dinner $15-35
+5. Set dietary_restriction to one of the restriction names in the people counts, using NORMAL for people with no restrictions
+6. A restriction name joining several with "+" (like NUT+VEGAN) counts people who need all of them; their items must suit every one"""
+
+# request_signature -> plan_id plus the snapshot records its menu came from. The
+# plan itself is read from the shared cache on each hit, so a PATCH handled by
+# another worker is seen here too.
+_plan_results = LRUCache(PLAN_RESULT_CACHE_SIZE, PLAN_RESULT_TTL)
+# Entries found but dropped because their menus or stored plan changed (counted as LRU hits)
+_plan_results_invalidated = 0
+
+
+# Restrictions fields that can be combined into one group ("NUT+VEGAN")
+DIETARY_GROUPS = ["GLUTEN", "LACTOSE", "VEGAN", "VEGETARIAN", "HALAL", "KOSHER", "NUT"]
+
+
+def combined_label(label: str) -> Optional[str]:
+    """Canonical name of a combined group, or None unless it joins two or more dietary groups."""
+    parts = {part.strip().upper() for part in label.split("+")}
+    if len(parts) < 2 or not parts <= set(DIETARY_GROUPS):
+        return None
+    return "+".join(sorted(parts))
+
+
+class Restrictions(BaseModel):
+    """People per restriction group.
+
+    Beyond the fixed fields, a combined group such as "NUT+VEGAN" counts people
+    who need all of its restrictions at once; it is kept as an extra field so
+    model_dump() lists it alongside the single groups.
+    """
+    model_config = ConfigDict(extra="allow")
+
+    GLUTEN: int = Field(ge=0)
+    LACTOSE: int = Field(ge=0)
+    VEGAN: int = Field(ge=0)
+    VEGETARIAN: int = Field(ge=0)
+    HALAL: int = Field(ge=0)
+    NUT: int = Field(ge=0)
+    NORMAL: int = Field(ge=0)
+    # Optional so existing clients and stored request signatures are unaffected
+    KOSHER: int = Field(0, ge=0)
+
+    @model_validator(mode="before")
+    @classmethod
+    def combined_groups(cls, data):
+        if not isinstance(data, dict):
+            return data
+        groups = {}
+        for key, value in data.items():
+            if key in cls.model_fields:
+                groups[key] = value
+            elif "+" in key:
+                label = combined_label(key)
+                if label is None:
+                    raise ValueError(f"{key!r} is not a combination of {', '.join(DIETARY_GROUPS)}")
+                if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                    raise ValueError(f"{key!r} must be a non-negative integer")
+                groups[label] = groups.get(label, 0) + value
+        return groups
+
+class GenerateMealResponse(BaseModel):
+    restrictions: Restrictions
+    days: int = Field(ge=1)
+    long: float
+    lat: float
+
+# Define the meal item structure
+class MealItem(BaseModel):
+    dietary_restriction: str
+    restaurant: str
+    item: str
+    price: float
+    people_count: int
+    is_special_request: bool
+
+# Define the structure for each meal time
+class MealTimeItems(BaseModel):
+    breakfast: List[MealItem]
+    lunch: List[MealItem]
+    dinner: List[MealItem]
+
+# Define the structure for each day's meal plan
+class DayPlan(BaseModel):
+    day: int
+    meals: MealTimeItems
+
+# Define the overall meal plan structure
+class MealPlanResponse(BaseModel):
+    meal_plans: List[DayPlan]
+
+# A persisted plan, returned with the ID used for incremental updates
+class StoredMealPlan(MealPlanResponse):
+    plan_id: str
+
+class PlanUpdateRequest(BaseModel):
+    restrictions: Optional[Restrictions] = None
+    days: Optional[int] = Field(None, ge=1)
+
+
+@timed()
+def simplify_menu(restaurant_data: List[Dict]) -> List[Dict]:
+    simplified_menu = []
+    for restaurant in restaurant_data:
+        menu_items = []
+        for item in dedupe_items(restaurant["menu_items"]):
+            menu_items.append({
+                "name": item["name"],
+                "price": item["price"],
+                "restrictions": item["restrictions"],
+                "category": item["category"]
+            })
+
+        simplified_menu.append({
+            "name": restaurant["name"],
+            "menu_items": menu_items
+        })
+    return simplified_menu
+
+
+def item_satisfies(group: str, restrictions: List[str]) -> bool:
+    """Whether a menu item tagged with restrictions can be served to people in a Restrictions group."""
+    if group == "NORMAL":
+        return True
+    if "+" in group:
+        return all(item_satisfies(part, restrictions) for part in group.split("+"))
+    if group == "NUT":
+        # NUT tags items that contain nuts
+        return "NUT" not in restrictions
+    return group in restrictions
+
+
+def coverage_target(request: GenerateMealResponse) -> Dict[str, int]:
+    """Compatible menu items needed per restriction group: one per meal slot per day, so no dish repeats."""
+    return {
+        group: len(MEAL_TYPES) * request.days
+        for group, count in request.restrictions.model_dump().items()
+        if count > 0
+    }
+
+
+@timed()
+def build_plan_prompt(restrictions: Dict[str, int], days: int, menu: List[Dict], start_day: int = 1) -> str:
+    counts = "\n".join(
+        f"- {'NO RESTRICTIONS' if group == 'NORMAL' else group}: {count}"
+        for group, count in restrictions.items()
+    )
+    day_numbering = f"\nNumber the days starting at day {start_day}." if start_day != 1 else ""
+    return f"""Available Restaurants:
+{json.dumps(menu, separators=(",", ":"))}
+
+People count per restriction:
+{counts}
+
+Create a {days}-day meal plan with 3 meals per day.{day_numbering}"""
+
+
+def check_plan_days(days: int):
+    def check(plan: MealPlanResponse):
+        if len(plan.meal_plans) < days:
+            raise ValueError(f"plan covers {len(plan.meal_plans)} days, expected {days}")
+    return check
+
+
+async def request_plan(llm, restrictions: Dict[str, int], days: int, menu: List[Dict], start_day: int = 1) -> MealPlanResponse:
+    async with _plan_semaphore:
+        plan = await llm.aparse(
+            "plan",
+            [
+                {"role": "system", "content": PLAN_SYSTEM_PROMPT},
+                {"role": "user", "content": build_plan_prompt(restrictions, days, menu, start_day)}
+            ],
+            response_format=MealPlanResponse,
+            validate=check_plan_days(days)
+        )
+    plan.meal_plans = plan.meal_plans[:days]
+    for offset, day_plan in enumerate(plan.meal_plans):
+        day_plan.day = start_day + offset
+    return plan
+
+
+def build_shortlist(menu: List[Dict], restrictions: Dict[str, int]) -> List[Dict]:
+    """Trim the menu to the items that serve the most active restriction groups, in menu format."""
+    groups = [group for group, count in restrictions.items() if count > 0]
+    scored = []
+    for restaurant in menu:
+        for item in restaurant["menu_items"]:
+            served = sum(1 for group in groups if item_satisfies(group, item["restrictions"]))
+            if served:
+                scored.append((served, restaurant["name"], item))
+    scored.sort(key=lambda entry: entry[0], reverse=True)
+
+    shortlist: Dict[str, List[Dict]] = {}
+    for _, restaurant_name, item in scored[:SHORTLIST_SIZE]:
+        shortlist.setdefault(restaurant_name, []).append(item)
+    return [{"name": name, "menu_items": items} for name, items in shortlist.items()]
+
+
+def enforce_plan_constraints(day_plans: List[DayPlan], menu: List[Dict]):
+    """Merge pass for independently generated days.
+
+    Replaces menu items that repeat for the same restriction group across days,
+    or that exceed the meal's price range, with an unused compatible item from
+    the menu when one exists. Special requests, and items whose
+    dietary_restriction doesn't name a known group, are left alone.
+    """
+    candidates = [
+        (restaurant["name"], item)
+        for restaurant in menu
+        for item in restaurant["menu_items"]
+    ]
+    used = set()
+    for day_plan in day_plans:
+        for meal_type in MEAL_TYPES:
+            _, max_price = PRICE_RANGES[meal_type]
+            items = getattr(day_plan.meals, meal_type)
+            for index, item in enumerate(items):
+                if item.is_special_request:
+                    continue
+                group = group_of(item.dietary_restriction)
+                if group is None:
+                    continue
+                key = (group, item.restaurant, item.item)
+                if key not in used and item.price <= max_price:
+                    used.add(key)
+                    continue
+                replacement = next((
+                    (restaurant_name, candidate) for restaurant_name, candidate in candidates
+                    if (group, restaurant_name, candidate["name"]) not in used
+                    and candidate["price"] <= max_price
+                    and item_satisfies(group, candidate["restrictions"])
+                ), None)
+                if replacement is None:
+                    used.add(key)
+                    continue
+                restaurant_name, candidate = replacement
+                items[index] = item.model_copy(update={
+                    "restaurant": restaurant_name,
+                    "item": candidate["name"],
+                    "price": candidate["price"]
+                })
+                used.add((group, restaurant_name, candidate["name"]))
+
+
+async def request_plan_per_day(llm, restrictions: Dict[str, int], days: int, menu: List[Dict]) -> MealPlanResponse:
+    """Generate each day concurrently against a shared shortlist, then run the merge pass."""
+    shortlist = build_shortlist(menu, restrictions) or menu
+    day_plans = await asyncio.gather(*(
+        plan_days(llm, restrictions, 1, shortlist, start_day=day)
+        for day in range(1, days + 1)
+    ))
+    merged = [
+        single_day[0] if single_day else DayPlan(**fallback_days(restrictions, 1, day)[0])
+        for day, single_day in enumerate(day_plans, start=1)
+    ]
+    enforce_plan_constraints(merged, shortlist)
+    return MealPlanResponse(meal_plans=merged)
+
+
+async def create_plan(llm, restrictions: Dict[str, int], days: int, menu: List[Dict]) -> MealPlanResponse:
+    if PARALLEL_PLAN_MIN_DAYS and days >= PARALLEL_PLAN_MIN_DAYS:
+        return await request_plan_per_day(llm, restrictions, days, menu)
+    return await request_plan(llm, restrictions, days, menu)
+
+
+def fallback_days(restrictions: Dict[str, int], days: int, start_day: int = 1) -> List[Dict]:
+    meal_plans = []
+    for day in range(days):
+        meals = {
+            "breakfast": [],
+            "lunch": [],
+            "dinner": []
+        }
+
+        for restriction, count in restrictions.items():
+            if count > 0:
+                for meal_type in meals:
+                    price = 12 if meal_type == "breakfast" else 18 if meal_type == "lunch" else 25
+                    meals[meal_type].append({
+                        "dietary_restriction": restriction,
+                        "restaurant": "Tim Hortons",  # Safe fallback
+                        "item": f"{restriction.title()} Friendly {meal_type.title()} (Special Request)",
+                        "price": price,
+                        "people_count": count,
+                        "is_special_request": True
+                    })
+
+        meal_plans.append({
+            "day": start_day + day,
+            "meals": meals
+        })
+    return meal_plans
+
+
+def generate_fallback_meal_plan(response: GenerateMealResponse) -> Dict:
+    """Generate a basic meal plan when the API fails"""
+    return {"meal_plans": fallback_days(response.restrictions.model_dump(), response.days)}
+
+
+def group_of(dietary_restriction: str) -> Optional[str]:
+    """Map a plan item's dietary_restriction label back to its Restrictions field."""
+    label = dietary_restriction.strip().upper()
+    groups = Restrictions.model_fields.keys()
+    if label in groups:
+        return label
+    if label in ("NONE", "NO RESTRICTIONS", "NO RESTRICTION"):
+        return "NORMAL"
+    if "+" in label:
+        parts = {group_of(part) for part in label.split("+")}
+        if None in parts or "NORMAL" in parts:
+            return None
+        return "+".join(sorted(parts)) if len(parts) > 1 else parts.pop()
+    for group in groups:
+        if group in label:
+            return group
+    return None
+
+
+def request_signature(request: GenerateMealResponse) -> str:
+    """Hash of the normalized request: restriction counts, days and the rounded location cell."""
+    normalized = {
+        "restrictions": request.restrictions.model_dump(exclude_defaults=True),
+        "days": request.days,
+        "cell": location_cell(request.lat, request.long)
+    }
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def save_plan(request: GenerateMealResponse, menu: List[Dict], plan: MealPlanResponse, plan_id: Optional[str] = None) -> str:
+    plan_id = plan_id or uuid.uuid4().hex
+    cache = get_cache()
+    cache.set(PLAN_NAMESPACE, plan_id, {
+        "request": request.model_dump(),
+        "menu": menu,
+        "plan": plan.model_dump()
+    }, ttl=PLAN_TTL)
+    cache.set(PLAN_INDEX_NAMESPACE, request_signature(request), plan_id, ttl=PLAN_TTL)
+    return plan_id
+
+
+def load_plan(plan_id: str) -> Optional[Dict]:
+    return get_cache().get(PLAN_NAMESPACE, plan_id)
+
+
+def find_stored_plan(request: GenerateMealResponse) -> Optional[StoredMealPlan]:
+    """Most recent stored plan for an equivalent request, regardless of age; used when shedding load."""
+    signature = request_signature(request)
+    plan_id = get_cache().get(PLAN_INDEX_NAMESPACE, signature)
+    stored = load_plan(plan_id) if plan_id else None
+    # A PATCHed plan keeps its id but now answers a different request
+    if stored is None or request_signature(GenerateMealResponse(**stored["request"])) != signature:
+        return None
+    return StoredMealPlan(plan_id=plan_id, **stored["plan"])
+
+
+def cached_plan(request: GenerateMealResponse) -> Optional[StoredMealPlan]:
+    """Plan for an equivalent request whose restaurants' menus haven't changed since it was made."""
+    global _plan_results_invalidated
+    signature = request_signature(request)
+    entry = _plan_results.get(signature)
+    if entry is None:
+        return None
+    snapshot = get_snapshot()
+    snapshot.refresh()
+    if entry["version"] != snapshot.version:
+        if snapshot.record_crcs(list(entry["menus"])) != entry["menus"]:
+            logger.info(f"Menus changed since plan {entry['plan_id']} was made, dropping it")
+            _plan_results_invalidated += 1
+            _plan_results.delete(signature)
+            return None
+        entry["version"] = snapshot.version
+    stored = load_plan(entry["plan_id"])
+    # Expired, or PATCHed (possibly by another worker) so it now answers a different request
+    if stored is None or request_signature(GenerateMealResponse(**stored["request"])) != signature:
+        _plan_results_invalidated += 1
+        _plan_results.delete(signature)
+        return None
+    return StoredMealPlan(plan_id=entry["plan_id"], **stored["plan"])
+
+
+def plan_cache_stats() -> Dict:
+    stats = _plan_results.stats()
+    return {**stats, "invalidated": _plan_results_invalidated, "served": stats["hits"] - _plan_results_invalidated}
+
+
+def remember_plan(request: GenerateMealResponse, plan_id: str, restaurants: List[Dict]):
+    """Cache a saved plan's id against the snapshot records of the restaurants it was planned from."""
+    if not restaurants:
+        return
+    snapshot = get_snapshot()
+    _plan_results.set(request_signature(request), {
+        "plan_id": plan_id,
+        "version": snapshot.version,
+        "menus": snapshot.record_crcs([restaurant_key(r) for r in restaurants])
+    })
+
+
+async def plan_days(llm, restrictions: Dict[str, int], days: int, menu: List[Dict], start_day: int = 1) -> List[DayPlan]:
+    try:
+        plan = await request_plan(llm, restrictions, days, menu, start_day)
+        return plan.meal_plans
+    except Exception as e:
+        logger.error(f"Error generating days {start_day}-{start_day + days - 1}: {e}")
+        return [DayPlan(**day) for day in fallback_days(restrictions, days, start_day)]
+
+
+async def update_plan(llm, plan_id: str, update: PlanUpdateRequest) -> Optional[StoredMealPlan]:
+    """Apply a restriction-count or day-count change to a stored plan.
+
+    Resized groups only get their people_count rewritten and removed groups or
+    days are dropped; the LLM is only asked for newly added groups on existing
+    days and for added days, against the stored menu snapshot.
+    """
+    stored = load_plan(plan_id)
+    if stored is None:
+        return None
+
+    old_request = GenerateMealResponse(**stored["request"])
+    new_request = old_request.model_copy(update={
+        k: v for k, v in (("restrictions", update.restrictions), ("days", update.days)) if v is not None
+    })
+    menu = stored["menu"]
+    plan = MealPlanResponse(**stored["plan"])
+
+    old_counts = old_request.restrictions.model_dump()
+    new_counts = new_request.restrictions.model_dump()
+    added_groups = {g: n for g, n in new_counts.items() if n > 0 and old_counts.get(g, 0) == 0}
+    removed_groups = {g for g, n in old_counts.items() if n > 0 and new_counts.get(g, 0) == 0}
+    resized_groups = {g for g, n in new_counts.items() if n > 0 and old_counts.get(g, 0) > 0 and n != old_counts[g]}
+
+    kept_days = plan.meal_plans[:min(old_request.days, new_request.days)]
+    if removed_groups or resized_groups:
+        for day_plan in kept_days:
+            for meal_type in MEAL_TYPES:
+                items = []
+                for item in getattr(day_plan.meals, meal_type):
+                    group = group_of(item.dietary_restriction)
+                    if group in removed_groups:
+                        continue
+                    if group in resized_groups:
+                        item = item.model_copy(update={"people_count": new_counts[group]})
+                    items.append(item)
+                setattr(day_plan.meals, meal_type, items)
+
+    tasks = []
+    if added_groups and kept_days:
+        tasks.append(plan_days(llm, added_groups, len(kept_days), menu))
+    added_days = new_request.days - old_request.days
+    if added_days > 0:
+        tasks.append(plan_days(llm, new_counts, added_days, menu, start_day=old_request.days + 1))
+    generated = await asyncio.gather(*tasks)
+
+    if added_groups and kept_days:
+        for day_plan, extra in zip(kept_days, generated[0]):
+            for meal_type in MEAL_TYPES:
+                getattr(day_plan.meals, meal_type).extend(getattr(extra.meals, meal_type))
+    if added_days > 0:
+        kept_days = kept_days + list(generated[-1])
+
+    updated = MealPlanResponse(meal_plans=kept_days)
+    save_plan(new_request, menu, updated, plan_id)
+    old_signature = request_signature(old_request)
+    if old_signature != request_signature(new_request):
+        cache = get_cache()
+        if cache.get(PLAN_INDEX_NAMESPACE, old_signature) == plan_id:
+            cache.delete(PLAN_INDEX_NAMESPACE, old_signature)
+    _plan_results.delete(old_signature)
+    return StoredMealPlan(plan_id=plan_id, meal_plans=updated.meal_plans)
+
+
+def location_cell(lat: float, long: float) -> Tuple[float, float]:
+    return (round(lat, LOCATION_CELL_PRECISION), round(long, LOCATION_CELL_PRECISION))
+
+
+async def generate_batch(llm, requests: List[GenerateMealResponse],
+                         fetch_menus: Callable[[float, float, Dict[str, int]], List[Dict]]) -> AsyncIterator[Dict]:
+    """Plan many events, yielding each result as soon as it is ready.
+
+    Events are grouped by location cell so each area's menus are fetched once,
+    and every plan goes through the shared planner and menu-fetch limits.
+    Each result carries the index of its event in the request list.
+    """
+    cells: Dict[Tuple[float, float], List[Tuple[int, GenerateMealResponse]]] = {}
+    for index, request in enumerate(requests):
+        cells.setdefault(location_cell(request.lat, request.long), []).append((index, request))
+    logger.info(f"Planning {len(requests)} events across {len(cells)} location cells")
+
+    async def fetch_cell(cell: Tuple[float, float]) -> Tuple[List[Dict], List[Dict]]:
+        lat, long = cell
+        coverage: Dict[str, int] = {}
+        for _, request in cells[cell]:
+            for group, needed in coverage_target(request).items():
+                coverage[group] = max(coverage.get(group, 0), needed)
+        async with _menu_semaphore:
+            restaurants = await asyncio.to_thread(fetch_menus, long, lat, coverage)
+        return restaurants, simplify_menu(restaurants)
+
+    cached = {index: cached_plan(request) for index, request in enumerate(requests)}
+    cells = {
+        cell: [(index, request) for index, request in events if cached[index] is None]
+        for cell, events in cells.items()
+    }
+    menu_tasks = {cell: asyncio.create_task(fetch_cell(cell)) for cell, events in cells.items() if events}
+
+    async def plan_event(index: int, request: GenerateMealResponse, cell: Tuple[float, float]) -> Dict:
+        try:
+            restaurants, menu = await menu_tasks[cell]
+            plan = await create_plan(llm, request.restrictions.model_dump(), request.days, menu)
+            plan_id = save_plan(request, menu, plan)
+            remember_plan(request, plan_id, restaurants)
+            return {"index": index, **StoredMealPlan(plan_id=plan_id, meal_plans=plan.meal_plans).model_dump()}
+        except Exception as e:
+            logger.error(f"Error generating meal plan for batch event {index}: {e}")
+            return {"index": index, **generate_fallback_meal_plan(request)}
+
+    plan_tasks = [
+        asyncio.create_task(plan_event(index, request, cell))
+        for cell, events in cells.items()
+        for index, request in events
+    ]
+    try:
+        for index, plan in cached.items():
+            if plan is not None:
+                yield {"index": index, **plan.model_dump()}
+        for next_done in asyncio.as_completed(plan_tasks):
+            yield await next_done
+    finally:
+        for task in plan_tasks + list(menu_tasks.values()):
+            task.cancel()
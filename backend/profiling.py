@@ -0,0 +1,197 @@
+import asyncio
+import bisect
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest profile an admin can ask for, in seconds
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+# Upper bucket bounds in seconds: 0.1ms doubling up to ~105s, then overflow
+BUCKET_BOUNDS = [0.0001 * 2 ** i for i in range(21)]
+
+# Leaf frames of threads parked waiting for work; dropped from samples unless asked for
+# (thread.py's _worker blocks in C, on its work queue's SimpleQueue.get)
+IDLE_LEAVES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"), ("thread.py", "_worker")}
+
+
+class Histogram:
+    """Wall-time histogram with fixed log-spaced buckets; recording is a bisect and a few adds."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        bucket = bisect.bisect_left(BUCKET_BOUNDS, seconds)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, counts: List[int], q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (the max for the overflow bucket)."""
+        target = q * sum(counts)
+        seen = 0
+        for bucket, count in enumerate(counts):
+            seen += count
+            if count and seen >= target:
+                return BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else self.max
+        return 0.0
+
+    def report(self) -> Dict:
+        with self._lock:
+            counts = list(self.counts)
+            total, maximum = self.total, self.max
+        calls = sum(counts)
+        return {
+            "calls": calls,
+            "avg_ms": round(total / calls * 1000, 3) if calls else 0.0,
+            "p50_ms": round(self.percentile(counts, 0.5) * 1000, 3),
+            "p90_ms": round(self.percentile(counts, 0.9) * 1000, 3),
+            "p99_ms": round(self.percentile(counts, 0.99) * 1000, 3),
+            "max_ms": round(maximum * 1000, 3),
+            "buckets_ms": {
+                (f"<={BUCKET_BOUNDS[bucket] * 1000:g}" if bucket < len(BUCKET_BOUNDS) else "overflow"): count
+                for bucket, count in enumerate(counts) if count
+            }
+        }
+
+
+_histograms: Dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def histogram(name: str) -> Histogram:
+    found = _histograms.get(name)
+    if found is None:
+        with _histograms_lock:
+            found = _histograms.setdefault(name, Histogram())
+    return found
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """Record every call's wall time (including time spent waiting) in the named histogram."""
+
+    def decorate(fn: Callable) -> Callable:
+        hist = histogram(name or fn.__qualname__)
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    hist.add(time.perf_counter() - start)
+            return timed_async
+
+        @functools.wraps(fn)
+        def timed_sync(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.add(time.perf_counter() - start)
+        return timed_sync
+
+    return decorate
+
+
+def timing_report() -> Dict[str, Dict]:
+    with _histograms_lock:
+        histograms = list(_histograms.items())
+    return {name: hist.report() for name, hist in sorted(histograms)}
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+# One profile at a time per worker: two samplers would just measure each other
+_profile_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_label(name: str) -> str:
+    # Pool threads are named <pool>_<n>; fold them together so pools read as one root
+    return re.sub(r"_\d+$", "", name)
+
+
+def sample_stacks(seconds: float, interval: float = PROFILE_SAMPLE_INTERVAL, include_idle: bool = False) -> str:
+    """Sample every thread's stack for seconds; returns collapsed stacks for flamegraph.pl or speedscope.
+
+    Each line is "thread;outer;...;leaf count". Samples of threads parked
+    waiting for work are dropped unless include_idle is set.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running on this worker")
+    try:
+        own = threading.get_ident()
+        samples: Counter = Counter()
+        deadline = time.perf_counter() + seconds
+        names = {}
+        while time.perf_counter() < deadline:
+            frames = sys._current_frames()
+            if frames.keys() - names.keys():
+                names = {thread.ident: _thread_label(thread.name) for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if not include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                samples[";".join(reversed(stack))] += 1
+            del frames
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+    logger.info(f"Sampled {sum(samples.values())} stacks over {seconds}s")
+    return "\n".join(f"{stack} {count}" for stack, count in samples.most_common())
+
+
+async def profile_event_loop(seconds: float, sort: str = "cumulative", limit: int = 60) -> str:
+    """cProfile the event loop thread for seconds; returns pstats text.
+
+    cProfile only sees the thread it's enabled on, so this covers route
+    handlers and other coroutines, not work handed to thread pools; use
+    sample_stacks for those.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running on this worker")
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+    finally:
+        _profile_lock.release()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+    return out.getvalue()
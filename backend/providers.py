@@ -0,0 +1,453 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import typing
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from usage import record, record_response_usage
+
+logger = logging.getLogger(__name__)
+
+FIXTURE_DIR = os.getenv("FIXTURE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+
+PLACES_BASE_URL = "https://maps.googleapis.com/maps/api/place"
+FETCH_TIMEOUT = 15
+
+
+class ProviderError(Exception):
+    pass
+
+
+class PlacesProvider(ABC):
+    """Google Places nearbysearch/details, returning the raw JSON responses."""
+
+    @abstractmethod
+    def nearby_search(self, latitude: float, longitude: float, radius: int) -> Dict:
+        ...
+
+    @abstractmethod
+    def place_details(self, place_id: str, fields: str) -> Dict:
+        ...
+
+
+class WebFetcher(ABC):
+    """Fetches a restaurant website, returning its HTML or "" when it can't be fetched."""
+
+    @abstractmethod
+    def fetch(self, url: str) -> str:
+        ...
+
+
+class LLMProvider(ABC):
+    """Chat completion. site names the call site (e.g. "classify_item") for fakes, routing and accounting."""
+
+    @abstractmethod
+    def complete(self, site: str, messages: List[Dict], model: str, **kwargs) -> str:
+        ...
+
+    @abstractmethod
+    def parse(self, site: str, messages: List[Dict], model: str, response_format: Type[BaseModel], **kwargs) -> BaseModel:
+        ...
+
+    @abstractmethod
+    async def aparse(self, site: str, messages: List[Dict], model: str, response_format: Type[BaseModel], **kwargs) -> BaseModel:
+        ...
+
+
+class LivePlaces(PlacesProvider):
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+
+    def _get(self, endpoint: str, params: Dict) -> Dict:
+        import requests
+
+        response = requests.get(f"{PLACES_BASE_URL}/{endpoint}/json", params={**params, 'key': self.api_key})
+        response.raise_for_status()
+        return response.json()
+
+    def nearby_search(self, latitude: float, longitude: float, radius: int) -> Dict:
+        return self._get("nearbysearch", {
+            'location': f"{latitude},{longitude}",
+            'radius': radius,
+            'type': 'restaurant'
+        })
+
+    def place_details(self, place_id: str, fields: str) -> Dict:
+        return self._get("details", {'place_id': place_id, 'fields': fields})
+
+
+class LiveFetcher(WebFetcher):
+    """cloudscraper first, then a plain requests session. Clients are created once, on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scraper = None
+        self._session = None
+        self._user_agent = None
+
+    def _clients(self):
+        if self._scraper is None:
+            with self._lock:
+                if self._scraper is None:
+                    import cloudscraper
+                    import requests
+                    from fake_useragent import UserAgent
+
+                    self._session = requests.Session()
+                    self._user_agent = UserAgent()
+                    self._scraper = cloudscraper.create_scraper()
+        return self._scraper, self._session, self._user_agent
+
+    def fetch(self, url: str) -> str:
+        scraper, session, user_agent = self._clients()
+        headers = {
+            'User-Agent': user_agent.random,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1'
+        }
+
+        try:
+            response = scraper.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+            if response.status_code == 200:
+                return response.text
+
+            response = session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+            if response.status_code == 200:
+                return response.text
+
+        except Exception as e:
+            logger.error(f"Error fetching website {url}: {e}")
+
+        return ""
+
+
+class LiveLLM(LLMProvider):
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+
+    def _sync(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import openai
+                    self._client = openai.OpenAI(api_key=self.api_key)
+        return self._client
+
+    def _async(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import openai
+                    self._async_client = openai.AsyncOpenAI(api_key=self.api_key)
+        return self._async_client
+
+    def complete(self, site: str, messages: List[Dict], model: str, **kwargs) -> str:
+        start = time.perf_counter()
+        response = self._sync().chat.completions.create(model=model, messages=messages, **kwargs)
+        record_response_usage(site, model, response.usage, time.perf_counter() - start)
+        return response.choices[0].message.content.strip()
+
+    def parse(self, site: str, messages: List[Dict], model: str, response_format: Type[BaseModel], **kwargs) -> BaseModel:
+        start = time.perf_counter()
+        completion = self._sync().beta.chat.completions.parse(
+            model=model, messages=messages, response_format=response_format, **kwargs
+        )
+        record_response_usage(site, model, completion.usage, time.perf_counter() - start)
+        return completion.choices[0].message.parsed
+
+    async def aparse(self, site: str, messages: List[Dict], model: str, response_format: Type[BaseModel], **kwargs) -> BaseModel:
+        start = time.perf_counter()
+        completion = await self._async().beta.chat.completions.parse(
+            model=model, messages=messages, response_format=response_format, **kwargs
+        )
+        record_response_usage(site, model, completion.usage, time.perf_counter() - start)
+        return completion.choices[0].message.parsed
+
+
+class Simulation:
+    """Latency and failure injection for the fake providers, seeded for reproducible runs.
+
+    Configured with FAKE_LATENCY_MS (mean), FAKE_JITTER_MS and FAKE_FAILURE_RATE.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Simulation":
+        return cls(
+            float(os.getenv("FAKE_LATENCY_MS", "0")),
+            float(os.getenv("FAKE_JITTER_MS", "0")),
+            float(os.getenv("FAKE_FAILURE_RATE", "0")),
+            int(os.getenv("FAKE_SEED", "0"))
+        )
+
+    def _draw(self):
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            failed = self._rng.random() < self.failure_rate
+        return delay, failed
+
+    def run(self, what: str):
+        delay, failed = self._draw()
+        time.sleep(delay)
+        if failed:
+            raise ProviderError(f"simulated failure: {what}")
+
+    async def arun(self, what: str):
+        delay, failed = self._draw()
+        await asyncio.sleep(delay)
+        if failed:
+            raise ProviderError(f"simulated failure: {what}")
+
+
+def _stable_int(*parts: Any) -> int:
+    return int(hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _load_fixture(*path: str) -> Optional[Any]:
+    full_path = os.path.join(FIXTURE_DIR, *path)
+    if not os.path.exists(full_path):
+        return None
+    with open(full_path) as f:
+        return json.load(f)
+
+
+class FixturePlaces(PlacesProvider):
+    """Serves places/nearby.json and places/details.json from the fixture directory.
+
+    Without fixtures, it synthesizes a deterministic set of places per location.
+    """
+
+    def __init__(self, simulation: Simulation):
+        self.simulation = simulation
+
+    def nearby_search(self, latitude: float, longitude: float, radius: int) -> Dict:
+        self.simulation.run("places.nearby_search")
+        fixture = _load_fixture("places", "nearby.json")
+        if fixture is not None:
+            return fixture
+        seed = _stable_int(round(latitude, 3), round(longitude, 3))
+        return {"status": "OK", "results": [{
+            "place_id": f"fake-{seed:x}-{i}",
+            "name": f"Fake Restaurant {seed % 1000}-{i}",
+            "vicinity": f"{i + 1} Fixture St",
+            "geometry": {"location": {
+                "lat": round(latitude, 3) + ((seed >> i) % 17 - 8) * 0.0001,
+                "lng": round(longitude, 3) + ((seed >> (i + 4)) % 17 - 8) * 0.0001
+            }},
+            "rating": round(3.5 + (seed >> i) % 15 / 10, 1),
+            "price_level": (seed >> i) % 4
+        } for i in range(8)]}
+
+    def place_details(self, place_id: str, fields: str) -> Dict:
+        self.simulation.run("places.place_details")
+        details = _load_fixture("places", "details.json") or {}
+        if place_id in details:
+            return {"status": "OK", "result": details[place_id]}
+        has_site = _stable_int(place_id) % 2 == 0
+        return {"status": "OK", "result": {"website": f"https://{place_id}.example.com/menu" if has_site else ""}}
+
+
+class FixtureFetcher(WebFetcher):
+    """Serves sites/<sha1 of url>.html from the fixture directory, else a small synthetic menu page."""
+
+    def __init__(self, simulation: Simulation):
+        self.simulation = simulation
+
+    def fetch(self, url: str) -> str:
+        try:
+            self.simulation.run("fetch")
+        except ProviderError as e:
+            logger.error(f"Error fetching website {url}: {e}")
+            return ""
+        path = os.path.join(FIXTURE_DIR, "sites", hashlib.sha1(url.encode("utf-8")).hexdigest() + ".html")
+        if os.path.exists(path):
+            with open(path) as f:
+                return f.read()
+        seed = _stable_int(url)
+        items = "".join(
+            f'<li class="menu-item">Dish {seed % 100}-{i} - fresh seasonal ingredients ${8 + (seed >> i) % 20}.00</li>'
+            for i in range(6)
+        )
+        return f'<html><body><ul class="menu">{items}</ul></body></html>'
+
+
+def synthesize(annotation: Any, seed: int, name: str = "value") -> Any:
+    """Build a deterministic value for a type annotation, including nested pydantic models."""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        return synthesize(next(a for a in args if a is not type(None)), seed, name)
+    if origin in (list, List):
+        return [synthesize(args[0], _stable_int(seed, name, i), name) for i in range(2 + seed % 3)]
+    if origin in (dict, Dict):
+        return {}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation(**{
+            field_name: synthesize(field.annotation, _stable_int(seed, field_name), field_name)
+            for field_name, field in annotation.model_fields.items()
+        })
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        members = list(annotation)
+        return members[seed % len(members)]
+    if annotation is bool:
+        return seed % 2 == 0
+    if annotation is int:
+        return 1 + seed % 10
+    if annotation is float:
+        return float(5 + seed % 30)
+    return f"{name.replace('_', ' ').title()} {seed % 1000}"
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+class PrefixCache:
+    """Approximates provider-side prompt caching for the fakes.
+
+    Like OpenAI's, it only applies to prompts of at least CACHE_MIN_TOKENS
+    and matches exact prefixes in CACHE_BLOCK_TOKENS increments, so prompts
+    whose variable content comes first never hit.
+    """
+
+    CACHE_MIN_TOKENS = 1024
+    CACHE_BLOCK_TOKENS = 128
+    MAX_ENTRIES = 100000
+
+    def __init__(self):
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, messages: List[Dict]) -> Tuple[int, int]:
+        """Return (prompt tokens, cached tokens) and remember this prompt's prefixes."""
+        text = "".join(f"{m['role']}:{m['content']}" for m in messages)
+        prompt_tokens = estimate_tokens(text)
+        if prompt_tokens < self.CACHE_MIN_TOKENS:
+            return prompt_tokens, 0
+        boundaries = range(self.CACHE_MIN_TOKENS, prompt_tokens + 1, self.CACHE_BLOCK_TOKENS)
+        digests = [(tokens, hashlib.sha1(text[:tokens * 4].encode("utf-8")).digest()) for tokens in boundaries]
+        with self._lock:
+            cached = max((tokens for tokens, digest in digests if digest in self._prefixes), default=0)
+            if len(self._prefixes) > self.MAX_ENTRIES:
+                self._prefixes.clear()
+            self._prefixes.update(digest for _, digest in digests)
+        return prompt_tokens, cached
+
+
+class FakeLLM(LLMProvider):
+    """Deterministic completions.
+
+    complete() serves llm/<site>.json from the fixture directory (the JSON is
+    returned as the reply text) or a built-in reply per site; parse()
+    synthesizes an instance of response_format seeded by the prompt.
+    Token usage is estimated and recorded like the live provider's, with a
+    simulated prefix cache (see PrefixCache).
+    """
+
+    DEFAULT_REPLIES = {
+        "classify_item": lambda seed: json.dumps([["VEGETARIAN"], ["VEGAN", "GLUTEN"], ["NONE"], ["HALAL"], ["NUT", "VEGETARIAN"]][seed % 5]),
+        "extract_menu": lambda seed: json.dumps([{
+            "name": f"Dish {seed % 100}-{i}",
+            "description": "Fresh seasonal ingredients",
+            "price": 8 + (seed >> i) % 20,
+            "category": "Mains",
+            "dietary_info": []
+        } for i in range(4)]),
+    }
+
+    def __init__(self, simulation: Simulation):
+        self.simulation = simulation
+        self.prefix_cache = PrefixCache()
+
+    def _record(self, site: str, model: str, messages: List[Dict], reply: str, latency: float):
+        prompt_tokens, cached_tokens = self.prefix_cache.lookup(messages)
+        record(site, model, prompt_tokens, cached_tokens, estimate_tokens(reply), latency)
+
+    def complete(self, site: str, messages: List[Dict], model: str, **kwargs) -> str:
+        start = time.perf_counter()
+        self.simulation.run(f"llm.{site}")
+        fixture = _load_fixture("llm", f"{site}.json")
+        if fixture is not None:
+            reply = json.dumps(fixture)
+        else:
+            seed = _stable_int(site, json.dumps(messages))
+            default = self.DEFAULT_REPLIES.get(site)
+            reply = default(seed) if default else "[]"
+        self._record(site, model, messages, reply, time.perf_counter() - start)
+        return reply
+
+    def parse(self, site: str, messages: List[Dict], model: str, response_format: Type[BaseModel], **kwargs) -> BaseModel:
+        start = time.perf_counter()
+        self.simulation.run(f"llm.{site}")
+        parsed = synthesize(response_format, _stable_int(site, json.dumps(messages)))
+        self._record(site, model, messages, parsed.model_dump_json(), time.perf_counter() - start)
+        return parsed
+
+    async def aparse(self, site: str, messages: List[Dict], model: str, response_format: Type[BaseModel], **kwargs) -> BaseModel:
+        start = time.perf_counter()
+        await self.simulation.arun(f"llm.{site}")
+        parsed = synthesize(response_format, _stable_int(site, json.dumps(messages)))
+        self._record(site, model, messages, parsed.model_dump_json(), time.perf_counter() - start)
+        return parsed
+
+
+class Providers:
+    def __init__(self, places: PlacesProvider, fetcher: WebFetcher, llm: LLMProvider):
+        self.places = places
+        self.fetcher = fetcher
+        self.llm = llm
+
+
+def build_providers() -> Providers:
+    """Pick live or fake providers per deployment.
+
+    PROVIDERS=live|fake sets the default; PLACES_PROVIDER, FETCH_PROVIDER and
+    LLM_PROVIDER override it for one dependency. The LLM is wrapped in the
+    model router, which picks the model for each call site.
+    """
+    default = os.getenv("PROVIDERS", "live")
+    simulation = Simulation.from_env()
+
+    def kind(name: str) -> str:
+        return os.getenv(f"{name}_PROVIDER", default)
+
+    places = FixturePlaces(simulation) if kind("PLACES") == "fake" else LivePlaces(os.getenv("GOOGLE_API_KEY"))
+    fetcher = FixtureFetcher(simulation) if kind("FETCH") == "fake" else LiveFetcher()
+    llm = FakeLLM(simulation) if kind("LLM") == "fake" else LiveLLM(os.getenv("OPENAI_API_KEY"))
+    # Imported here: routing builds on LLMProvider
+    from routing import RoutedLLM
+    return Providers(places, fetcher, RoutedLLM(llm))
+
+
+_providers: Optional[Providers] = None
+_providers_lock = threading.Lock()
+
+
+def get_providers() -> Providers:
+    global _providers
+    if _providers is None:
+        with _providers_lock:
+            if _providers is None:
+                _providers = build_providers()
+    return _providers
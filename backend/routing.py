@@ -0,0 +1,198 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+from providers import LLMProvider
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Tier name -> model, overridable with MODEL_TIER_<NAME>
+MODEL_TIERS = {
+    "small": os.getenv("MODEL_TIER_SMALL", "gpt-4o-mini"),
+    "large": os.getenv("MODEL_TIER_LARGE", "gpt-4o-2024-08-06"),
+}
+
+# Call site -> tiers to try in order, overridable with MODEL_ROUTE_<SITE>="small,large".
+# High-volume sites with short, checkable replies start small and escalate
+# only when the reply fails validation.
+DEFAULT_ROUTES = {
+    "classify_item": ["small", "large"],
+    "extract_menu": ["small", "large"],
+    "detect_columns": ["small", "large"],
+    "generate_menu": ["small", "large"],
+    "plan": ["large"],
+}
+
+
+class SiteStats:
+    def __init__(self):
+        self.calls = 0
+        self.escalations = 0
+        self.failures = 0
+        self.latency = 0.0
+        self.served_by: Dict[str, int] = {}
+
+    def report(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "escalations": self.escalations,
+            "escalation_rate": round(self.escalations / self.calls, 3) if self.calls else 0.0,
+            "failures": self.failures,
+            "avg_latency": round(self.latency / self.calls, 3) if self.calls else 0.0,
+            "served_by": dict(self.served_by)
+        }
+
+
+class ModelRouter:
+    """Picks the model for each LLM call site and escalates to the next tier when a reply fails validation.
+
+    Validation failures are ValueErrors (including pydantic's ValidationError)
+    raised by the call or by the site's validate function; any other error is
+    an infrastructure problem and is raised straight away.
+    """
+
+    def __init__(self, routes: Dict[str, List[str]], tiers: Dict[str, str]):
+        self.routes = routes
+        self.tiers = tiers
+        self._stats: Dict[str, SiteStats] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        routes = {}
+        for site, tiers in DEFAULT_ROUTES.items():
+            override = os.getenv(f"MODEL_ROUTE_{site.upper()}")
+            routes[site] = [tier.strip() for tier in override.split(",")] if override else tiers
+        return cls(routes, MODEL_TIERS)
+
+    def models(self, site: str) -> List[str]:
+        tiers = self.routes.get(site, ["large"])
+        return [self.tiers.get(tier, tier) for tier in tiers]
+
+    def _record(self, site: str, model: Optional[str], attempts: int, failed: bool, latency: float):
+        with self._lock:
+            stats = self._stats.setdefault(site, SiteStats())
+            stats.calls += 1
+            stats.escalations += 1 if attempts > 1 else 0
+            stats.failures += 1 if failed else 0
+            stats.latency += latency
+            if model is not None:
+                stats.served_by[model] = stats.served_by.get(model, 0) + 1
+
+    def call(self, site: str, attempt: Callable[[str], T], validate: Optional[Callable[[T], Any]] = None,
+             models: Optional[List[str]] = None) -> T:
+        models = models or self.models(site)
+        start = time.perf_counter()
+        for index, model in enumerate(models):
+            try:
+                result = attempt(model)
+                if validate is not None:
+                    validate(result)
+            except ValueError as e:
+                if index == len(models) - 1:
+                    self._record(site, None, index + 1, True, time.perf_counter() - start)
+                    raise
+                logger.warning(f"{site}: reply from {model} failed validation ({e}), escalating to {models[index + 1]}")
+                continue
+            except Exception:
+                self._record(site, None, index + 1, True, time.perf_counter() - start)
+                raise
+            self._record(site, model, index + 1, False, time.perf_counter() - start)
+            return result
+
+    async def acall(self, site: str, attempt: Callable[[str], Awaitable[T]], validate: Optional[Callable[[T], Any]] = None,
+                    models: Optional[List[str]] = None) -> T:
+        models = models or self.models(site)
+        start = time.perf_counter()
+        for index, model in enumerate(models):
+            try:
+                result = await attempt(model)
+                if validate is not None:
+                    validate(result)
+            except ValueError as e:
+                if index == len(models) - 1:
+                    self._record(site, None, index + 1, True, time.perf_counter() - start)
+                    raise
+                logger.warning(f"{site}: reply from {model} failed validation ({e}), escalating to {models[index + 1]}")
+                continue
+            except Exception:
+                self._record(site, None, index + 1, True, time.perf_counter() - start)
+                raise
+            self._record(site, model, index + 1, False, time.perf_counter() - start)
+            return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                site: {"models": self.models(site), **stats.report()}
+                for site, stats in self._stats.items()
+            }
+
+
+def require_parsed(parsed: Optional[BaseModel]):
+    if parsed is None:
+        raise ValueError("no parsed reply (refusal or empty response)")
+
+
+class RoutedLLM(LLMProvider):
+    """LLMProvider that lets the router choose the model for each call.
+
+    Passing model pins the call to that model; validate is an optional check
+    on the reply that raises ValueError to trigger escalation.
+    """
+
+    def __init__(self, llm: LLMProvider, router: Optional[ModelRouter] = None):
+        self.llm = llm
+        self.router = router or get_router()
+
+    def complete(self, site: str, messages: List[Dict], model: Optional[str] = None,
+                 validate: Optional[Callable[[str], Any]] = None, **kwargs) -> str:
+        return self.router.call(
+            site, lambda chosen: self.llm.complete(site, messages, chosen, **kwargs), validate,
+            [model] if model else None
+        )
+
+    def parse(self, site: str, messages: List[Dict], model: Optional[str] = None,
+              response_format: Type[BaseModel] = None, validate: Optional[Callable[[BaseModel], Any]] = None,
+              **kwargs) -> BaseModel:
+        def check(parsed):
+            require_parsed(parsed)
+            if validate is not None:
+                validate(parsed)
+
+        return self.router.call(
+            site, lambda chosen: self.llm.parse(site, messages, chosen, response_format, **kwargs), check,
+            [model] if model else None
+        )
+
+    async def aparse(self, site: str, messages: List[Dict], model: Optional[str] = None,
+                     response_format: Type[BaseModel] = None, validate: Optional[Callable[[BaseModel], Any]] = None,
+                     **kwargs) -> BaseModel:
+        def check(parsed):
+            require_parsed(parsed)
+            if validate is not None:
+                validate(parsed)
+
+        return await self.router.acall(
+            site, lambda chosen: self.llm.aparse(site, messages, chosen, response_format, **kwargs), check,
+            [model] if model else None
+        )
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter.from_env()
+    return _router
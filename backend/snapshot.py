@@ -0,0 +1,281 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv("MENU_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "restaurant_menus.snap"))
+
+# File layout (little endian):
+#   header: MAGIC, u16 format version
+#   records, appended one after another:
+#     u32 payload length, u16 key length, u32 crc32 of key + payload, key (utf-8), payload
+# The payload is a compact JSON restaurant whose menu item restrictions are
+# stored as a bitmask over RESTRICTION_BITS. A later record for the same key
+# supersedes earlier ones; compact() drops the superseded records.
+# Appends hold an exclusive flock on the file and first cut off any torn
+# record a crashed writer left at the end, so every record starts where
+# the previous one ends.
+MAGIC = b"HSNP"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sH")
+RECORD_HEADER = struct.Struct("<IHI")
+
+RESTRICTION_BITS = ["GLUTEN", "LACTOSE", "VEGAN", "VEGETARIAN", "HALAL", "KOSHER", "NUT", "NONE"]
+
+
+def restrictions_to_mask(restrictions: List[str]) -> int:
+    mask = 0
+    for restriction in restrictions:
+        if restriction in RESTRICTION_BITS:
+            mask |= 1 << RESTRICTION_BITS.index(restriction)
+    return mask
+
+
+def mask_to_restrictions(mask: int) -> List[str]:
+    restrictions = [name for bit, name in enumerate(RESTRICTION_BITS) if mask & (1 << bit)]
+    return restrictions or ["NONE"]
+
+
+def restaurant_key(restaurant: Dict) -> str:
+    return restaurant.get('place_id') or f"{restaurant['name']}|{restaurant.get('address', '')}"
+
+
+def encode_restaurant(restaurant: Dict) -> bytes:
+    compact = dict(restaurant)
+    compact['menu_items'] = [
+        {**item, 'restrictions': restrictions_to_mask(item.get('restrictions', ["NONE"]))}
+        for item in restaurant.get('menu_items', [])
+    ]
+    return json.dumps(compact, separators=(',', ':')).encode('utf-8')
+
+
+def decode_restaurant(payload: bytes) -> Dict:
+    restaurant = json.loads(payload)
+    for item in restaurant.get('menu_items', []):
+        item['restrictions'] = mask_to_restrictions(item['restrictions'])
+    return restaurant
+
+
+def encode_record(key: str, payload: bytes) -> bytes:
+    key_bytes = key.encode('utf-8')
+    crc = zlib.crc32(key_bytes + payload)
+    return RECORD_HEADER.pack(len(payload), len(key_bytes), crc) + key_bytes + payload
+
+
+class MenuSnapshot:
+    """Append-only, memory-mapped store of restaurant menus.
+
+    Opening a snapshot walks the records, checking each checksum, to build a
+    key -> offset index; a restaurant's payload is decoded the first time it
+    is read.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # (index, mmap) is swapped as one tuple so readers never need the lock
+        self._view: Tuple[Dict[str, Tuple[int, int, int]], Optional[mmap.mmap]] = ({}, None)
+        self._indexed_size = 0
+        self._inode = None
+        self._ensure_header()
+        with self._append_lock() as fd:
+            self._truncate_torn_tail(fd)
+
+    def _ensure_header(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, 'ab') as f:
+                if f.tell() == 0:
+                    f.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+
+    @property
+    def version(self) -> Tuple[Optional[int], int]:
+        """Changes whenever records are appended or the file is compacted."""
+        return (self._inode, self._indexed_size)
+
+    def refresh(self):
+        """Index any records appended (by this or another process) since the last refresh."""
+        with self._lock:
+            stat = os.stat(self.path)
+            if stat.st_ino == self._inode and stat.st_size == self._indexed_size:
+                return
+            index, _ = self._view
+            offset = self._indexed_size
+            if stat.st_ino != self._inode:
+                # First load, or the file was compacted and replaced
+                index, offset = {}, 0
+
+            with open(self.path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            size = len(mapped)
+
+            if offset == 0:
+                magic, version = HEADER.unpack_from(mapped, 0)
+                if magic != MAGIC or version != FORMAT_VERSION:
+                    mapped.close()
+                    raise ValueError(f"{self.path} is not a version {FORMAT_VERSION} menu snapshot")
+                offset = HEADER.size
+
+            index = dict(index)
+            while offset + RECORD_HEADER.size <= size:
+                payload_len, key_len, crc = RECORD_HEADER.unpack_from(mapped, offset)
+                key_start = offset + RECORD_HEADER.size
+                end = key_start + key_len + payload_len
+                if end > size or zlib.crc32(mapped[key_start:end]) != crc:
+                    # A record still being appended, or one torn by a crashed writer
+                    # (cut off by the next append); either way, stop here for now
+                    break
+                key = mapped[key_start:key_start + key_len].decode('utf-8')
+                index[key] = (key_start + key_len, payload_len, crc)
+                offset = end
+
+            self._view = (index, mapped)
+            self._indexed_size = offset
+            self._inode = stat.st_ino
+
+    @contextmanager
+    def _append_lock(self) -> Iterator[int]:
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield fd
+        finally:
+            os.close(fd)
+
+    def _truncate_torn_tail(self, fd: int):
+        """With the append lock held, nothing is mid-write, so bytes past the last valid record are torn."""
+        self.refresh()
+        stat = os.fstat(fd)
+        if stat.st_ino == self._inode and stat.st_size > self._indexed_size:
+            logger.warning(f"Truncating {stat.st_size - self._indexed_size} torn bytes from {self.path}")
+            os.ftruncate(fd, self._indexed_size)
+
+    def keys(self) -> List[str]:
+        return list(self._view[0])
+
+    def __len__(self) -> int:
+        return len(self._view[0])
+
+    def get(self, key: str) -> Optional[Dict]:
+        index, mapped = self._view
+        entry = index.get(key)
+        if entry is None:
+            return None
+        start, length, crc = entry
+        payload = mapped[start:start + length]
+        if zlib.crc32(key.encode('utf-8') + payload) != crc:
+            logger.error(f"Corrupt snapshot record for {key}")
+            return None
+        return decode_restaurant(payload)
+
+    def _stored_payload(self, key: str) -> Optional[bytes]:
+        index, mapped = self._view
+        entry = index.get(key)
+        if entry is None:
+            return None
+        start, length, _ = entry
+        return mapped[start:start + length]
+
+    def record_crcs(self, keys: List[str]) -> Dict[str, Optional[int]]:
+        """Checksum of each restaurant's current record (None if absent); changes whenever its menu does."""
+        index = self._view[0]
+        return {key: index[key][2] if key in index else None for key in keys}
+
+    def restaurants(self) -> Iterator[Dict]:
+        for key in self.keys():
+            restaurant = self.get(key)
+            if restaurant is not None:
+                yield restaurant
+
+    def append(self, restaurants: List[Dict]):
+        """Append one record per changed restaurant, under the append lock.
+
+        A failed or interrupted write is truncated away before the error is raised.
+        """
+        if not restaurants:
+            return
+        records = []
+        for restaurant in restaurants:
+            key = restaurant_key(restaurant)
+            payload = encode_restaurant(restaurant)
+            if self._stored_payload(key) != payload:
+                records.append(encode_record(key, payload))
+        if not records:
+            # Nothing changed, so the version stays put and plans built on these menus stay valid
+            return
+        data = memoryview(b"".join(records))
+        with self._append_lock() as fd:
+            self._truncate_torn_tail(fd)
+            start = os.fstat(fd).st_size
+            try:
+                while data:
+                    written = os.write(fd, data)
+                    data = data[written:]
+            except BaseException:
+                os.ftruncate(fd, start)
+                raise
+        self.refresh()
+
+    def compact(self):
+        """Rewrite the file keeping only the latest record for each restaurant.
+
+        Run this offline: records appended by other processes while compacting are lost.
+        """
+        with self._lock:
+            index, mapped = self._view
+            records = [encode_record(key, mapped[start:start + length])
+                       for key, (start, length, _) in index.items()]
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+                f.write(b"".join(records))
+            os.replace(tmp_path, self.path)
+        self.refresh()
+
+
+def import_json(json_path: str, snapshot: "MenuSnapshot"):
+    with open(json_path) as f:
+        snapshot.append(json.load(f))
+
+
+def export_json(snapshot: "MenuSnapshot", json_path: str):
+    tmp_path = f"{json_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(list(snapshot.restaurants()), f, indent=2)
+    os.replace(tmp_path, json_path)
+
+
+_snapshot: Optional[MenuSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> MenuSnapshot:
+    global _snapshot
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = MenuSnapshot()
+    return _snapshot
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python snapshot.py import|export|compact [json path]
+    command = sys.argv[1] if len(sys.argv) > 1 else "compact"
+    json_path = sys.argv[2] if len(sys.argv) > 2 else "restaurant_menus.json"
+    snapshot = get_snapshot()
+    if command == "import":
+        import_json(json_path, snapshot)
+    elif command == "export":
+        export_json(snapshot, json_path)
+    else:
+        snapshot.compact()
+    print(f"{len(snapshot)} restaurants in {snapshot.path}")
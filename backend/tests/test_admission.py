@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from backend.admission import AdmissionController, AdmittedStreamingResponse, Overloaded
+
+async def hold(controller, seconds):
+    async with controller.admit():
+        await asyncio.sleep(seconds)
+    return "served"
+
+async def attempt(controller, seconds):
+    try:
+        return await hold(controller, seconds)
+    except Overloaded as e:
+        return e.status_code
+
+def test_rejects_when_queue_is_full():
+    async def run():
+        controller = AdmissionController("test", max_concurrent=1, max_queue=1, queue_timeout=1)
+        return await asyncio.gather(*(attempt(controller, 0.05) for _ in range(4)))
+
+    assert asyncio.run(run()) == ["served", "served", 429, 429]
+
+def test_times_out_in_queue():
+    async def run():
+        controller = AdmissionController("test", max_concurrent=1, max_queue=5, queue_timeout=0.05)
+        results = await asyncio.gather(attempt(controller, 0.3), attempt(controller, 0.01))
+        return results, controller.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == ["served", 503]
+    assert stats["timed_out"] == 1 and stats["active"] == 0
+
+def test_retry_after_is_positive():
+    controller = AdmissionController("test", max_concurrent=2, max_queue=0, queue_timeout=1)
+    assert controller.retry_after() >= 1
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("ADMISSION_GENERATE_MEAL_CONCURRENCY", "7")
+    controller = AdmissionController.from_env("generate_meal", max_concurrent=2, max_queue=3, queue_timeout=4)
+    assert (controller.max_concurrent, controller.max_queue, controller.queue_timeout) == (7, 3, 4.0)
+
+def test_streaming_response_releases_slot_when_cancelled_before_streaming():
+    async def run():
+        controller = AdmissionController("test", max_concurrent=1, max_queue=0, queue_timeout=0.05)
+        started = []
+
+        async def body():
+            started.append(True)
+            yield b"line\n"
+
+        async def client_gone():
+            return {"type": "http.disconnect"}
+
+        async def stalled_send(message):
+            await asyncio.sleep(10)
+
+        response = AdmittedStreamingResponse(body(), controller, await controller.acquire())
+        await response({"type": "http"}, client_gone, stalled_send)
+        return started, await attempt(controller, 0)
+
+    started, retry = asyncio.run(run())
+    assert started == [] and retry == "served"
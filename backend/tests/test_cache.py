@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from backend.cache import Cache, LRUCache
+
+@pytest.fixture
+def cache(tmp_path):
+    return Cache(str(tmp_path / "cache.sqlite3"))
+
+def test_set_and_get(cache):
+    cache.set("menus", "place-1", [{"name": "Soup"}])
+    assert cache.get("menus", "place-1") == [{"name": "Soup"}]
+    assert cache.get("menus", "place-2") is None
+
+def test_expired_entries_are_ignored(cache):
+    cache.set("menus", "place-1", [], ttl=-1)
+    assert cache.get("menus", "place-1") is None
+
+def test_entries_are_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    Cache(path).set("places", "cell", {"count": 3})
+    assert Cache(path).get("places", "cell") == {"count": 3}
+
+def test_get_or_compute_runs_once(cache):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"items": 2}
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(lambda _: cache.get_or_compute("menus", "place-1", compute), range(6)))
+
+    assert results == [{"items": 2}] * 6
+    assert len(calls) == 1
+
+def test_get_or_compute_does_not_store_none(cache):
+    assert cache.get_or_compute("places", "cell", lambda: None) is None
+    assert cache.get_or_compute("places", "cell", lambda: [1]) == [1]
+
+def test_lru_cache_evicts_and_expires():
+    lru = LRUCache(max_entries=2, ttl=0.05)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b") is None and lru.get("a") == 1
+    time.sleep(0.06)
+    assert lru.get("c") is None and len(lru) == 1
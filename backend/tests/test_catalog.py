@@ -0,0 +1,65 @@
+from backend.catalog import ItemCatalog, dedupe_items, normalize
+
+def test_normalize():
+    assert normalize("  Pad-Thai (GF)!! ") == "pad thai gf"
+
+def test_near_duplicates_share_a_canonical_entry():
+    catalog = ItemCatalog()
+    first = catalog.add("Margherita Pizza", "Tomato sauce, fresh mozzarella and basil", ["VEGETARIAN"])
+    again = catalog.add("MARGHERITA PIZZA!", "Tomato sauce, fresh mozzarella and basil.", ["NONE"])
+
+    assert again is first
+    assert again.restrictions == ["VEGETARIAN"]
+    assert first.count == 2
+    assert len(catalog) == 1
+
+def test_different_dishes_stay_separate():
+    catalog = ItemCatalog()
+    catalog.add("Chicken Burger", "Grilled chicken on a brioche bun", ["NONE"])
+    catalog.add("Veggie Burger", "Black bean patty on a brioche bun", ["VEGETARIAN"])
+
+    assert len(catalog) == 2
+    assert catalog.match("Lentil Soup", "Red lentils and cumin") is None
+
+def test_dedupe_items_keeps_first():
+    items = [
+        {"name": "Caesar Salad", "description": "Romaine, croutons, parmesan"},
+        {"name": "caesar salad", "description": "Romaine, croutons, parmesan"},
+        {"name": "Greek Salad", "description": "Feta, olives, cucumber"},
+    ]
+    assert [item["name"] for item in dedupe_items(items)] == ["Caesar Salad", "Greek Salad"]
+
+def test_dietary_variants_never_match():
+    catalog = ItemCatalog()
+    catalog.add("Chocolate Cake", "Rich chocolate sponge", ["VEGETARIAN"])
+    assert catalog.match("Chocolate Cake GF", "Rich chocolate sponge") is None
+    assert catalog.match("Vegan Chocolate Cake", "Rich chocolate sponge") is None
+    assert catalog.match("Chocolate Cake (dairy-free)", "Rich chocolate sponge") is None
+    assert catalog.match("Chocolate cake", "Rich chocolate sponge") is not None
+
+def test_dedupe_keeps_items_with_different_restrictions():
+    items = [
+        {"name": "Chocolate Cake", "description": "", "restrictions": ["VEGETARIAN"]},
+        {"name": "Chocolate Cake GF", "description": "", "restrictions": ["GLUTEN", "VEGETARIAN"]},
+        {"name": "Chicken Burrito", "description": "", "restrictions": ["NONE"]},
+        {"name": "Chicken Burrito Bowl", "description": "", "restrictions": ["GLUTEN"]},
+        {"name": "Chocolate  Cake", "description": "", "restrictions": ["NUT", "VEGETARIAN"]},
+    ]
+    assert [item["name"] for item in dedupe_items(items)] == [item["name"] for item in items]
+
+def test_ingredient_variants_never_match():
+    catalog = ItemCatalog()
+    catalog.add("Pad Thai", "Rice noodles, tofu, bean sprouts, crushed peanuts", ["NUT"])
+    catalog.add("Cheese Pizza", "Tomato, mozzarella, pepperoni", ["NONE"])
+
+    assert catalog.match("Pad Thai", "Rice noodles, tofu, bean sprouts") is None
+    assert catalog.match("Cheese Pizza", "Tomato, mozzarella") is None
+    assert catalog.match("Pad Thai", "Rice noodles, tofu, bean sprouts, crushed peanuts.") is not None
+
+def test_classification_needs_the_same_description():
+    catalog = ItemCatalog()
+    first = catalog.add("House Noodles", "Rice noodles with tofu and bean sprouts", ["VEGAN"])
+
+    assert catalog.classified("HOUSE NOODLES", "Rice noodles with tofu and bean sprouts.") is first
+    assert catalog.match("House Noodles", "Rice noodles with tofu and sprouts") is first
+    assert catalog.classified("House Noodles", "Rice noodles with tofu and sprouts") is None
@@ -0,0 +1,50 @@
+import io
+
+from backend.csv_counts import count_restrictions
+from backend.planner import Restrictions
+
+MULTI_FIELD = {
+    "is_single_dietary_field": False,
+    "single_dietary_field": None,
+    "dietary_fields": {"gluten": "Gluten Free", "lactose": None, "vegan": "Vegan", "vegetarian": "Vegetarian",
+                       "halal": None, "kosher": None, "nut": "Nut Allergy"}
+}
+
+def test_multi_field_counts_each_person_once():
+    csv = io.StringIO(
+        "Name,Gluten Free,Vegan,Vegetarian,Nut Allergy\n"
+        "a,no,yes,yes,yes\n"
+        "b,No,YES,,\n"
+        "c,,,,\n"
+        "d,1,0,0,0\n"
+        "e,x,,true,\n"
+    )
+    counter = count_restrictions(csv, MULTI_FIELD, chunk_size=2)
+    restrictions = counter.restrictions()
+
+    assert counter.people == 5
+    assert sum(restrictions.values()) == 5
+    # Person a's nut allergy stays with their diet; vegan already covers vegetarian
+    assert restrictions["NUT+VEGAN"] == 1 and restrictions["GLUTEN+VEGETARIAN"] == 1
+    assert restrictions["VEGAN"] == 1 and restrictions["NUT"] == 0 and restrictions["VEGETARIAN"] == 0
+    assert restrictions["GLUTEN"] == 1 and restrictions["NORMAL"] == 1
+    assert counter.combinations()["NUT+VEGAN+VEGETARIAN"] == 1
+    breakdown = counter.breakdown()
+    assert breakdown["columns"]["VEGAN"] == {"column": "Vegan", "count": 2}
+    assert Restrictions(**restrictions).model_dump() == restrictions
+
+def test_single_field_words():
+    csv = io.StringIO("Name,Diet\na,Vegan\nb,nuts; gluten\nc,\nd,none\n")
+    diet_columns = {"is_single_dietary_field": True, "single_dietary_field": "Diet", "dietary_fields": {}}
+    restrictions = count_restrictions(csv, diet_columns).restrictions()
+
+    assert restrictions["VEGAN"] == 1 and restrictions["GLUTEN+NUT"] == 1
+    assert restrictions["NUT"] == 0 and restrictions["GLUTEN"] == 0 and restrictions["NORMAL"] == 2
+
+def test_kosher_attendees_reach_the_planner():
+    csv = io.StringIO('Name,Diet\na,Kosher\nb,"kosher, nut"\nc,\n')
+    diet_columns = {"is_single_dietary_field": True, "single_dietary_field": "Diet", "dietary_fields": {}}
+    restrictions = count_restrictions(csv, diet_columns).restrictions()
+
+    assert restrictions["KOSHER"] == 1 and restrictions["KOSHER+NUT"] == 1
+    assert Restrictions(**restrictions).KOSHER == 1
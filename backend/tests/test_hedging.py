@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from backend import googlemap
+from backend.cache import Cache
+from backend.catalog import ItemCatalog
+from backend.googlemap import Restaurant, RestaurantMenuFinder
+from backend.providers import FakeLLM, FixtureFetcher, FixturePlaces, Providers, Simulation
+from backend.routing import RoutedLLM
+
+class SlowFetcher(FixtureFetcher):
+    def __init__(self, delay):
+        super().__init__(Simulation())
+        self.delay = delay
+
+    def fetch(self, url):
+        time.sleep(self.delay)
+        return super().fetch(url)
+
+class CountingLLM(FakeLLM):
+    def __init__(self):
+        super().__init__(Simulation())
+        self.sites = []
+
+    def complete(self, site, messages, model, **kwargs):
+        self.sites.append(site)
+        return super().complete(site, messages, model, **kwargs)
+
+    def parse(self, site, messages, model, response_format, **kwargs):
+        self.sites.append(site)
+        return super().parse(site, messages, model, response_format, **kwargs)
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    test_cache = Cache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(googlemap, "get_cache", lambda: test_cache)
+    monkeypatch.setattr(googlemap, "get_catalog", lambda: ItemCatalog())
+    return test_cache
+
+def process(fetch_delay, hedge_delay):
+    llm = CountingLLM()
+    simulation = Simulation()
+    finder = RestaurantMenuFinder(Providers(FixturePlaces(simulation), SlowFetcher(fetch_delay), RoutedLLM(llm)))
+    restaurant = Restaurant(name="Cafe", address="", rating=4.0, price_level=2,
+                            website="https://cafe.example.com", place_id="cafe")
+    start = time.perf_counter()
+    finder.hedged_menu(restaurant, hedge_delay)
+    return time.perf_counter() - start, llm.sites
+
+def test_fast_scrape_wins_without_generating(cache):
+    elapsed, sites = process(fetch_delay=0, hedge_delay=1)
+    assert "generate_menu" not in sites and "extract_menu" in sites
+    assert cache.get(googlemap.SCRAPED_MENU_NAMESPACE, "cafe")
+
+def test_slow_scrape_is_hedged_and_cancelled(cache):
+    elapsed, sites = process(fetch_delay=0.5, hedge_delay=0.05)
+    assert elapsed < 0.4
+    assert sites == ["generate_menu"]
+    time.sleep(0.6)
+    # The cancelled scrape stops before its LLM calls and caches nothing
+    assert sites == ["generate_menu"]
+    assert cache.get(googlemap.SCRAPED_MENU_NAMESPACE, "cafe") is None
+
+def test_hedge_is_not_queued_behind_stuck_scrapes(cache, monkeypatch):
+    stuck_pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(googlemap, "_scrape_executor", stuck_pool)
+    release = threading.Event()
+    for _ in range(2):
+        stuck_pool.submit(release.wait, 5)
+    try:
+        elapsed, sites = process(fetch_delay=0, hedge_delay=0.05)
+    finally:
+        release.set()
+        stuck_pool.shutdown()
+    assert elapsed < 0.4
+    assert sites == ["generate_menu"]
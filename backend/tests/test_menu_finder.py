@@ -0,0 +1,142 @@
+import threading
+
+import pytest
+from backend import googlemap
+from backend.cache import Cache
+from backend.catalog import ItemCatalog
+from backend.googlemap import DietaryRestriction, MenuItem, Restaurant, RestaurantMenuFinder
+from backend.providers import FakeLLM, FixtureFetcher, FixturePlaces, Providers, Simulation
+from backend.routing import RoutedLLM
+
+class StubbedFinder(RestaurantMenuFinder):
+    """Finder whose first restaurant is served at once; the rest block until released."""
+
+    def __init__(self, restaurants):
+        simulation = Simulation()
+        super().__init__(Providers(FixturePlaces(simulation), FixtureFetcher(simulation), RoutedLLM(FakeLLM(simulation))))
+        self.restaurants = restaurants
+        self.release = threading.Event()
+        self.started = []
+        self._lock = threading.Lock()
+
+    def get_nearby_restaurants(self, latitude, longitude, radius=100):
+        return list(self.restaurants)
+
+    def process_restaurant(self, restaurant):
+        with self._lock:
+            self.started.append(restaurant.name)
+        if restaurant.name != "Fast":
+            self.release.wait(5)
+        restaurant.menu_items = [MenuItem(name=f"Salad {n}", restrictions={DietaryRestriction.VEGAN}) for n in range(3)]
+        return restaurant
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    test_cache = Cache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(googlemap, "get_cache", lambda: test_cache)
+    monkeypatch.setattr(googlemap, "get_catalog", lambda: ItemCatalog())
+    return test_cache
+
+def restaurant(name, rating, price_level=2, website="", place_id=""):
+    return Restaurant(name=name, address="", rating=rating, price_level=price_level,
+                      website=website, place_id=place_id or name.lower())
+
+def test_cached_menus_rank_first(cache):
+    finder = StubbedFinder([])
+    cached = restaurant("Cached", 3.0)
+    cache.set(googlemap.GENERATED_MENU_NAMESPACE, googlemap.generated_menu_key("Cached", 2, "cached"),
+              [googlemap.menu_item_to_dict(MenuItem(name="Soup"))])
+    scraped = restaurant("Scraped", 2.5, website="https://scraped.example.com")
+    cache.set(googlemap.SCRAPED_MENU_NAMESPACE, "scraped", [googlemap.menu_item_to_dict(MenuItem(name="Stew"))])
+    best = restaurant("Best", 4.8, price_level=3)
+    cheap = restaurant("Cheap", 4.8, price_level=1)
+
+    ranked = finder.rank_restaurants([best, scraped, cheap, cached])
+
+    assert [r.name for r in ranked] == ["Cached", "Scraped", "Cheap", "Best"]
+
+def test_coverage_cancels_pending_restaurants(cache):
+    restaurants = [restaurant("Fast", 5.0)] + [restaurant(f"Slow {n}", 4.0 - n * 0.1) for n in range(14)]
+    finder = StubbedFinder(restaurants)
+
+    try:
+        found = finder.find_restaurant_menus(0.0, 0.0, coverage={"VEGAN": 2})
+    finally:
+        finder.release.set()
+
+    assert [r.name for r in found] == ["Fast"]
+    # The slow restaurants hold every other worker, so the tail of the queue was cancelled unstarted
+    assert "Slow 13" not in finder.started
+    assert len(finder.started) <= 11
+
+class CountingLLM(FakeLLM):
+    def __init__(self):
+        super().__init__(Simulation())
+        self.calls = 0
+        self.offline = False
+
+    def complete(self, site, messages, model, **kwargs):
+        self.calls += 1
+        if self.offline:
+            raise ConnectionError("offline")
+        return super().complete(site, messages, model, **kwargs)
+
+    def parse(self, site, messages, model, response_format, **kwargs):
+        self.calls += 1
+        if self.offline:
+            raise ConnectionError("offline")
+        return super().parse(site, messages, model, response_format, **kwargs)
+
+def generating_finder(monkeypatch):
+    monkeypatch.setattr(googlemap, "_generation_backoff", {})
+    llm = CountingLLM()
+    simulation = Simulation()
+    finder = RestaurantMenuFinder(Providers(FixturePlaces(simulation), FixtureFetcher(simulation), RoutedLLM(llm)))
+    return finder, llm
+
+def test_generated_menus_are_memoized(cache, monkeypatch):
+    finder, llm = generating_finder(monkeypatch)
+
+    first = finder.generate_menu_with_ai("Cafe", 2, "cafe")
+    calls = llm.calls
+    second = finder.generate_menu_with_ai("Cafe", 2, "cafe")
+
+    assert calls >= 1 and llm.calls == calls
+    assert [item.name for item in second] == [item.name for item in first]
+    assert [item.restrictions for item in second] == [item.restrictions for item in first]
+
+def test_failed_generation_backs_off(cache, monkeypatch):
+    finder, llm = generating_finder(monkeypatch)
+    llm.offline = True
+    key = googlemap.generated_menu_key("Cafe", 2, "cafe")
+
+    first = finder.generate_menu_with_ai("Cafe", 2, "cafe")
+    calls = llm.calls
+    second = finder.generate_menu_with_ai("Cafe", 2, "cafe")
+
+    fallback = [item.name for item in finder.fallback_menu("Cafe", googlemap.price_range_for(2))]
+    assert calls == 1 and llm.calls == 1
+    assert [item.name for item in first] == [item.name for item in second] == fallback
+    assert cache.get(googlemap.GENERATED_MENU_NAMESPACE, key) is None
+
+    # Once the backoff expires the next request tries the LLM again and stores its menu
+    llm.offline = False
+    googlemap._generation_backoff[key] = (1, 0.0)
+    finder.generate_menu_with_ai("Cafe", 2, "cafe")
+    assert llm.calls > 1
+    assert key not in googlemap._generation_backoff
+
+def test_failed_scrapes_are_not_cached(cache, monkeypatch):
+    finder, llm = generating_finder(monkeypatch)
+    cafe = restaurant("Cafe", 4.0, website="https://cafe.example.com")
+
+    finder.fetcher = FixtureFetcher(Simulation(failure_rate=1.0))
+    assert finder.scrape_menu_cached(cafe) is None
+    finder.fetcher = FixtureFetcher(Simulation())
+    llm.offline = True
+    assert finder.scrape_menu_cached(cafe) is None
+    assert cache.get(googlemap.SCRAPED_MENU_NAMESPACE, "cafe") is None
+
+    llm.offline = False
+    assert finder.scrape_menu_cached(cafe)
+    assert cache.get(googlemap.SCRAPED_MENU_NAMESPACE, "cafe")
@@ -0,0 +1,45 @@
+from backend import googlemap
+from backend.cache import Cache
+from backend.googlemap import RestaurantMenuFinder
+from backend.place_details import PlaceDetailsStore
+from backend.providers import FakeLLM, FixtureFetcher, FixturePlaces, Providers, Simulation
+
+class CountingPlaces(FixturePlaces):
+    def __init__(self):
+        super().__init__(Simulation())
+        self.details_calls = []
+        self.offline = False
+
+    def place_details(self, place_id, fields):
+        self.details_calls.append(fields)
+        if self.offline:
+            raise ConnectionError("offline")
+        return super().place_details(place_id, fields)
+
+def make_finder(tmp_path, monkeypatch, field_ttls=None):
+    store = PlaceDetailsStore(Cache(str(tmp_path / "cache.sqlite3")), field_ttls)
+    monkeypatch.setattr(googlemap, "get_place_details_store", lambda: store)
+    places = CountingPlaces()
+    simulation = Simulation()
+    return RestaurantMenuFinder(Providers(places, FixtureFetcher(simulation), FakeLLM(simulation))), places, store
+
+def test_fresh_places_skip_details_calls(tmp_path, monkeypatch):
+    finder, places, store = make_finder(tmp_path, monkeypatch)
+    first = finder.search_nearby_places(43.4723, -80.5449, 100)
+    assert len(places.details_calls) == 8
+    assert set(places.details_calls) == {"website"}
+
+    second = finder.search_nearby_places(43.4723, -80.5449, 100)
+    assert len(places.details_calls) == 8
+    assert store.stats()["skipped_places"] == 8
+    assert sorted(p["website"] for p in first) == sorted(p["website"] for p in second)
+
+def test_stale_fields_are_refetched_and_served_stale_on_failure(tmp_path, monkeypatch):
+    finder, places, store = make_finder(tmp_path, monkeypatch, field_ttls={"website": 0})
+    first = finder.search_nearby_places(43.4723, -80.5449, 100)
+    finder.search_nearby_places(43.4723, -80.5449, 100)
+    assert len(places.details_calls) == 16
+
+    places.offline = True
+    offline = finder.search_nearby_places(43.4723, -80.5449, 100)
+    assert sorted(p["website"] for p in offline) == sorted(p["website"] for p in first)
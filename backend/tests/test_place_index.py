@@ -0,0 +1,36 @@
+import time
+
+from backend import place_index
+from backend.cache import Cache
+from backend.place_index import PlaceIndex
+
+def place(place_id, lat, lng):
+    return {"place_id": place_id, "name": place_id, "address": "", "rating": 4.0, "price_level": 2,
+            "website": "", "lat": lat, "lng": lng}
+
+def test_radius_query_after_sweep(tmp_path):
+    index = PlaceIndex(Cache(str(tmp_path / "cache.sqlite3")))
+    assert index.lookup(43.4723, -80.5449, 100) is None
+
+    index.add_sweep(43.4723, -80.5449, 150, [
+        place("near", 43.4725, -80.5450),
+        place("edge", 43.4731, -80.5449),
+        place("far", 43.4760, -80.5449),
+        place("other", 43.4720, -80.5446),
+    ])
+
+    found = index.lookup(43.4723, -80.5449, 100)
+    assert [p["place_id"] for p in found] == ["near", "other", "edge"]
+    # Outside the swept area: needs a live search
+    assert index.lookup(43.4800, -80.5449, 100) is None
+
+def test_sweeps_are_shared_and_sparse_cells_rechecked(tmp_path, monkeypatch):
+    cache = Cache(str(tmp_path / "cache.sqlite3"))
+    PlaceIndex(cache).add_sweep(43.4723, -80.5449, 150, [place("near", 43.4725, -80.5450)])
+
+    other_worker = PlaceIndex(cache)
+    assert [p["place_id"] for p in other_worker.lookup(43.4723, -80.5449, 100)] == ["near"]
+
+    monkeypatch.setattr(place_index, "PLACE_SPARSE_RECHECK", 0.01)
+    time.sleep(0.02)
+    assert other_worker.lookup(43.4723, -80.5449, 100) is None
@@ -0,0 +1,272 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+from backend import planner
+from backend.cache import Cache, LRUCache
+from backend.providers import FakeLLM, Simulation
+from backend.routing import DEFAULT_ROUTES, MODEL_TIERS, ModelRouter, RoutedLLM
+from backend.snapshot import MenuSnapshot
+from backend.planner import (
+    GenerateMealResponse,
+    MealPlanResponse,
+    PlanUpdateRequest,
+    Restrictions,
+    cached_plan,
+    find_stored_plan,
+    generate_fallback_meal_plan,
+    group_of,
+    load_plan,
+    remember_plan,
+    save_plan,
+    update_plan,
+)
+
+class RecordingLLM:
+    """LLM provider that fails every call, so the planner falls back per group."""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def aparse(self, site, messages, model=None, response_format=None, **kwargs):
+        self.prompts.append(messages[1]["content"])
+        raise RuntimeError("offline")
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    test_cache = Cache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(planner, "get_cache", lambda: test_cache)
+    test_snapshot = MenuSnapshot(str(tmp_path / "menus.snap"))
+    monkeypatch.setattr(planner, "get_snapshot", lambda: test_snapshot)
+    monkeypatch.setattr(planner, "_plan_results", LRUCache(8, 60))
+    return test_snapshot
+
+def make_request(days=2, **counts):
+    values = {"GLUTEN": 0, "LACTOSE": 0, "VEGAN": 0, "VEGETARIAN": 0, "HALAL": 0, "NUT": 0, "NORMAL": 0}
+    values.update(counts)
+    return GenerateMealResponse(restrictions=Restrictions(**values), days=days, long=0.0, lat=0.0)
+
+def stored_plan(request):
+    plan = MealPlanResponse(**generate_fallback_meal_plan(request))
+    return save_plan(request, [], plan)
+
+def test_group_of():
+    assert group_of("vegan") == "VEGAN"
+    assert group_of("No Restrictions") == "NORMAL"
+    assert group_of("GLUTEN-FREE") == "GLUTEN"
+    assert group_of("paleo") is None
+
+def test_resizing_a_group_makes_no_llm_calls():
+    plan_id = stored_plan(make_request(VEGAN=5, NORMAL=10))
+    llm = RecordingLLM()
+    update = PlanUpdateRequest(restrictions=make_request(VEGAN=7, NORMAL=10).restrictions)
+
+    plan = asyncio.run(update_plan(llm, plan_id, update))
+
+    assert llm.prompts == []
+    counts = {item.dietary_restriction: item.people_count for item in plan.meal_plans[0].meals.lunch}
+    assert counts == {"VEGAN": 7, "NORMAL": 10}
+    assert load_plan(plan_id)["request"]["restrictions"]["VEGAN"] == 7
+
+def test_added_group_and_day_only_request_what_changed():
+    plan_id = stored_plan(make_request(days=2, VEGAN=5))
+    llm = RecordingLLM()
+    update = PlanUpdateRequest(restrictions=make_request(VEGAN=5, GLUTEN=2).restrictions, days=3)
+
+    plan = asyncio.run(update_plan(llm, plan_id, update))
+
+    assert len(llm.prompts) == 2
+    assert "2-day" in llm.prompts[0] and "VEGAN" not in llm.prompts[0]
+    assert "1-day" in llm.prompts[1] and "starting at day 3" in llm.prompts[1]
+    assert [day.day for day in plan.meal_plans] == [1, 2, 3]
+    assert {item.dietary_restriction for item in plan.meal_plans[0].meals.dinner} == {"VEGAN", "GLUTEN"}
+
+def test_patched_plan_no_longer_answers_the_original_request():
+    original = make_request(days=2, VEGAN=5)
+    plan_id = stored_plan(original)
+    assert find_stored_plan(original).plan_id == plan_id
+
+    asyncio.run(update_plan(RecordingLLM(), plan_id, PlanUpdateRequest(days=5)))
+
+    assert find_stored_plan(original) is None
+    assert len(find_stored_plan(make_request(days=5, VEGAN=5)).meal_plans) == 5
+
+def test_unknown_plan():
+    assert asyncio.run(update_plan(RecordingLLM(), "missing", PlanUpdateRequest(days=1))) is None
+
+def test_merge_pass_replaces_repeats_and_over_budget_items():
+    menu = [{"name": "Cafe", "menu_items": [
+        {"name": "Tofu Bowl", "price": 14.0, "restrictions": ["VEGAN"], "category": "Mains"},
+        {"name": "Lentil Soup", "price": 10.0, "restrictions": ["VEGAN", "GLUTEN"], "category": "Soups"},
+        {"name": "Truffle Risotto", "price": 60.0, "restrictions": ["VEGAN"], "category": "Mains"},
+        {"name": "Chickpea Salad", "price": 12.0, "restrictions": ["VEGAN"], "category": "Salads"},
+    ]}]
+
+    def day(number, item, price):
+        meal = [planner.MealItem(dietary_restriction="VEGAN", restaurant="Cafe", item=item, price=price,
+                                 people_count=3, is_special_request=False)]
+        return planner.DayPlan(day=number, meals=planner.MealTimeItems(breakfast=[], lunch=meal, dinner=[]))
+
+    days = [day(1, "Tofu Bowl", 14.0), day(2, "Tofu Bowl", 14.0), day(3, "Truffle Risotto", 60.0)]
+    planner.enforce_plan_constraints(days, menu)
+
+    assert [d.meals.lunch[0].item for d in days] == ["Tofu Bowl", "Lentil Soup", "Chickpea Salad"]
+    assert days[2].meals.lunch[0].price == 12.0
+
+def test_merge_pass_leaves_unknown_groups_alone():
+    menu = [{"name": "Cafe", "menu_items": [{"name": "Peanut Noodles", "price": 12.0, "restrictions": ["NUT"], "category": "Mains"}]}]
+    meal = [planner.MealItem(dietary_restriction="PALEO", restaurant="Cafe", item="Steak Salad", price=40.0,
+                             people_count=2, is_special_request=False)]
+    days = [planner.DayPlan(day=1, meals=planner.MealTimeItems(breakfast=[], lunch=list(meal), dinner=[]))]
+
+    planner.enforce_plan_constraints(days, menu)
+
+    assert days[0].meals.lunch[0].item == "Steak Salad"
+
+def test_per_day_mode_is_opt_in(monkeypatch):
+    llm = RecordingLLM()
+    with pytest.raises(RuntimeError):
+        asyncio.run(planner.create_plan(llm, {"VEGAN": 2}, 5, []))
+    assert len(llm.prompts) == 1 and "5-day" in llm.prompts[0]
+
+    monkeypatch.setattr(planner, "PARALLEL_PLAN_MIN_DAYS", 3)
+    llm = RecordingLLM()
+    asyncio.run(planner.create_plan(llm, {"VEGAN": 2}, 3, []))
+    assert len(llm.prompts) == 3
+
+def test_per_day_mode_falls_back_per_day():
+    llm = RecordingLLM()
+    plan = asyncio.run(planner.request_plan_per_day(llm, {"VEGAN": 2, "NORMAL": 0}, 3, []))
+
+    assert len(llm.prompts) == 3
+    assert all("1-day" in prompt for prompt in llm.prompts)
+    assert [d.day for d in plan.meal_plans] == [1, 2, 3]
+
+def test_cached_plan_is_dropped_when_its_menus_change(isolated_cache):
+    snapshot = isolated_cache
+    cafe = {"place_id": "cafe", "name": "Cafe", "address": "1 Main St", "menu_items": [
+        {"name": "Falafel Wrap", "price": 12.0, "restrictions": ["VEGAN"]}
+    ]}
+    diner = {"place_id": "diner", "name": "Diner", "address": "2 Main St", "menu_items": []}
+    snapshot.append([cafe, diner])
+    request = make_request(VEGAN=2)
+    plan_id = stored_plan(request)
+    remember_plan(request, plan_id, [cafe])
+
+    assert cached_plan(request).plan_id == plan_id
+    assert cached_plan(make_request(VEGAN=3)) is None
+
+    # Unchanged menus are not re-appended, and other restaurants don't matter
+    version = snapshot.version
+    snapshot.append([cafe, {**diner, "menu_items": cafe["menu_items"]}])
+    assert snapshot.version != version
+    assert cached_plan(request).plan_id == plan_id
+
+    snapshot.append([{**cafe, "menu_items": []}])
+    assert cached_plan(request) is None
+
+@pytest.mark.parametrize("update", [{"days": 0}, {"days": -1}, {"restrictions": {**make_request().restrictions.model_dump(), "VEGAN": -2}}])
+def test_plan_updates_are_validated(update):
+    with pytest.raises(ValidationError):
+        PlanUpdateRequest(**update)
+
+def test_plan_cache_stats_count_invalidations(isolated_cache):
+    cafe = {"place_id": "cafe", "name": "Cafe", "address": "", "menu_items": [{"name": "Soup", "price": 8.0, "restrictions": ["VEGAN"]}]}
+    isolated_cache.append([cafe])
+    request = make_request(VEGAN=1)
+    remember_plan(request, stored_plan(request), [cafe])
+    before = planner.plan_cache_stats()["invalidated"]
+
+    assert cached_plan(request) is not None
+    isolated_cache.append([{**cafe, "menu_items": []}])
+    assert cached_plan(request) is None
+
+    stats = planner.plan_cache_stats()
+    assert stats["hits"] == 2 and stats["invalidated"] == before + 1 and stats["entries"] == 0
+
+class FailingForHalal(FakeLLM):
+    """Fake LLM that fails plans for any event with HALAL attendees."""
+
+    async def aparse(self, site, messages, model, response_format, **kwargs):
+        if "HALAL: 0" not in messages[1]["content"]:
+            raise RuntimeError("offline")
+        return await super().aparse(site, messages, model, response_format, **kwargs)
+
+def test_generate_batch_fetches_menus_once_per_cell():
+    fetched = []
+
+    def fetch_menus(long, lat, coverage):
+        fetched.append((lat, long))
+        return [{"place_id": f"cafe-{lat}", "name": "Cafe", "address": "", "menu_items": [
+            {"name": "Soup", "description": "", "price": 9.0, "category": "Mains", "restrictions": ["VEGAN"]}
+        ]}]
+
+    def event(lat, long, **counts):
+        return make_request(days=1, **counts).model_copy(update={"lat": lat, "long": long})
+
+    events = [
+        event(43.4723, -80.5449, VEGAN=2),
+        event(43.4721, -80.5451, NORMAL=3),
+        event(45.5017, -73.5673, VEGAN=1),
+        event(45.5019, -73.5671, HALAL=4),
+    ]
+    llm = RoutedLLM(FailingForHalal(Simulation()), ModelRouter(DEFAULT_ROUTES, MODEL_TIERS))
+
+    async def collect():
+        return [result async for result in planner.generate_batch(llm, events, fetch_menus)]
+
+    results = asyncio.run(collect())
+
+    assert len(fetched) == 2
+    assert sorted(result["index"] for result in results) == [0, 1, 2, 3]
+    by_index = {result["index"]: result for result in results}
+    assert all("plan_id" in by_index[index] for index in (0, 1, 2))
+    assert "plan_id" not in by_index[3]
+    assert by_index[3] == {"index": 3, **generate_fallback_meal_plan(events[3])}
+
+def test_combined_groups_reach_the_plan_and_must_satisfy_every_restriction():
+    request = make_request(NORMAL=2, **{"vegan+nut": 3})
+    assert request.restrictions.model_dump()["NUT+VEGAN"] == 3
+    assert "- NUT+VEGAN: 3" in planner.build_plan_prompt(request.restrictions.model_dump(), 1, [])
+    assert planner.coverage_target(request) == {"NORMAL": 6, "NUT+VEGAN": 6}
+
+    assert planner.item_satisfies("NUT+VEGAN", ["VEGAN"])
+    assert not planner.item_satisfies("NUT+VEGAN", ["VEGAN", "NUT"])
+    assert not planner.item_satisfies("NUT+VEGAN", ["VEGETARIAN"])
+    assert group_of("Vegan + Nut-Free") == "NUT+VEGAN"
+
+    with pytest.raises(ValidationError):
+        make_request(**{"VEGAN+PALEO": 1})
+    with pytest.raises(ValidationError):
+        make_request(**{"NUT+VEGAN": -1})
+
+def test_resizing_a_combined_group_makes_no_llm_calls():
+    plan_id = stored_plan(make_request(NORMAL=4, **{"NUT+VEGAN": 2}))
+    llm = RecordingLLM()
+    update = PlanUpdateRequest(restrictions=make_request(NORMAL=4, **{"NUT+VEGAN": 5}).restrictions)
+
+    plan = asyncio.run(update_plan(llm, plan_id, update))
+
+    assert llm.prompts == []
+    counts = {item.dietary_restriction: item.people_count for item in plan.meal_plans[0].meals.lunch}
+    assert counts == {"NUT+VEGAN": 5, "NORMAL": 4}
+
+def test_cached_plan_sees_patches_from_other_workers(isolated_cache):
+    cafe = {"place_id": "cafe", "name": "Cafe", "address": "", "menu_items": [{"name": "Soup", "price": 8.0, "restrictions": ["VEGAN"]}]}
+    isolated_cache.append([cafe])
+    request = make_request(VEGAN=2, NORMAL=1)
+    plan_id = stored_plan(request)
+    remember_plan(request, plan_id, [cafe])
+    assert cached_plan(request).plan_id == plan_id
+
+    # Another worker PATCHes the plan: only the shared cache changes, this worker's LRU doesn't
+    update = PlanUpdateRequest(restrictions=make_request(VEGAN=5, NORMAL=1).restrictions)
+    local_results = planner._plan_results
+    planner._plan_results = LRUCache(8, 60)
+    try:
+        asyncio.run(update_plan(RecordingLLM(), plan_id, update))
+    finally:
+        planner._plan_results = local_results
+
+    assert cached_plan(request) is None
+    assert planner.plan_cache_stats()["entries"] == 0
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+from backend import profiling
+from backend.profiling import Histogram, ProfilerBusy, sample_stacks, timed
+
+def test_histogram_percentiles_use_bucket_bounds():
+    hist = Histogram()
+    for _ in range(90):
+        hist.add(0.0005)
+    for _ in range(10):
+        hist.add(0.05)
+    report = hist.report()
+    assert report["calls"] == 100
+    assert report["p50_ms"] == pytest.approx(0.8)
+    assert report["p99_ms"] == pytest.approx(51.2)
+    assert report["max_ms"] == pytest.approx(50.0)
+
+def test_timed_records_calls_even_when_they_raise():
+    @timed("test.flaky")
+    def flaky(fail):
+        if fail:
+            raise RuntimeError("boom")
+        return 1
+
+    assert flaky(False) == 1
+    with pytest.raises(RuntimeError):
+        flaky(True)
+    assert profiling.timing_report()["test.flaky"]["calls"] == 2
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+def test_sampler_collapses_busy_thread_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name="busy_1")
+    worker.start()
+    try:
+        collapsed = sample_stacks(0.2, interval=0.01)
+    finally:
+        stop.set()
+        worker.join()
+    busy = [line for line in collapsed.splitlines() if line.startswith("busy;")]
+    assert busy and all("busy_loop (test_profiling.py" in line for line in busy)
+    assert int(busy[0].rsplit(" ", 1)[1]) > 0
+
+def test_one_profile_at_a_time():
+    with profiling._profile_lock:
+        with pytest.raises(ProfilerBusy):
+            sample_stacks(0.01)
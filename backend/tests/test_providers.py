@@ -0,0 +1,36 @@
+import pytest
+from backend.planner import MealPlanResponse
+from backend.providers import FakeLLM, FixturePlaces, LLMProvider, ProviderError, Simulation, synthesize
+
+def test_synthesize_builds_valid_nested_models():
+    plan = synthesize(MealPlanResponse, seed=7)
+    assert isinstance(plan, MealPlanResponse)
+    assert plan.meal_plans and plan.meal_plans[0].meals.lunch
+    assert synthesize(MealPlanResponse, seed=7) == plan
+
+def test_fake_llm_is_deterministic():
+    llm = FakeLLM(Simulation())
+    messages = [{"role": "user", "content": "Falafel wrap"}]
+    first = llm.complete("classify_item", messages, model="any")
+    assert first == llm.complete("classify_item", messages, model="any")
+    assert first.startswith("[")
+
+def test_fake_places_synthesize_per_location():
+    places = FixturePlaces(Simulation())
+    here = places.nearby_search(43.0, -81.27, 100)
+    assert here["status"] == "OK" and len(here["results"]) == 8
+    assert here == places.nearby_search(43.0, -81.27, 100)
+    assert here != places.nearby_search(44.0, -80.0, 100)
+    assert "website" in places.place_details(here["results"][0]["place_id"], "website")["result"]
+
+def test_simulated_failures():
+    with pytest.raises(ProviderError):
+        Simulation(failure_rate=1.0).run("places.nearby_search")
+
+def test_incomplete_providers_fail_at_construction():
+    class CompleteOnly(LLMProvider):
+        def complete(self, site, messages, model, **kwargs):
+            return ""
+
+    with pytest.raises(TypeError):
+        CompleteOnly()
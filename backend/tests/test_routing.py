@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+from backend.routing import ModelRouter, RoutedLLM
+
+ROUTES = {"classify_item": ["small", "large"], "plan": ["large"]}
+TIERS = {"small": "mini", "large": "big"}
+
+class ScriptedLLM:
+    """Replies per model, recording which models were asked."""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.models = []
+
+    def complete(self, site, messages, model, **kwargs):
+        self.models.append(model)
+        return self.replies[model]
+
+    async def aparse(self, site, messages, model, response_format, **kwargs):
+        self.models.append(model)
+        return self.replies[model]
+
+def must_be_json_list(reply):
+    if not reply.startswith("["):
+        raise ValueError("not a list")
+
+def test_valid_cheap_reply_is_not_escalated():
+    router = ModelRouter(ROUTES, TIERS)
+    llm = ScriptedLLM({"mini": '["VEGAN"]', "big": '["VEGAN"]'})
+    assert RoutedLLM(llm, router).complete("classify_item", [], validate=must_be_json_list) == '["VEGAN"]'
+    assert llm.models == ["mini"]
+    assert router.stats()["classify_item"]["escalation_rate"] == 0.0
+
+def test_invalid_reply_escalates_to_next_tier():
+    router = ModelRouter(ROUTES, TIERS)
+    llm = ScriptedLLM({"mini": "Sure! It is vegan.", "big": '["VEGAN"]'})
+    routed = RoutedLLM(llm, router)
+    assert routed.complete("classify_item", [], validate=must_be_json_list) == '["VEGAN"]'
+    assert llm.models == ["mini", "big"]
+    stats = router.stats()["classify_item"]
+    assert stats["escalations"] == 1 and stats["served_by"] == {"big": 1}
+
+def test_last_tier_failure_raises_and_other_errors_are_not_escalated():
+    router = ModelRouter(ROUTES, TIERS)
+    llm = ScriptedLLM({"big": None})
+    with pytest.raises(ValueError):
+        asyncio.run(RoutedLLM(llm, router).aparse("plan", [], response_format=None))
+    assert router.stats()["plan"]["failures"] == 1
+
+    def offline(model):
+        raise ConnectionError("offline")
+    with pytest.raises(ConnectionError):
+        router.call("classify_item", offline)
+    assert router.stats()["classify_item"]["escalations"] == 0
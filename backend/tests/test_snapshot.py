@@ -0,0 +1,99 @@
+import os
+
+import pytest
+from backend import snapshot as snapshot_module
+from backend.snapshot import MenuSnapshot, encode_record, encode_restaurant, mask_to_restrictions, restrictions_to_mask
+
+def restaurant(name, restrictions=("VEGAN", "GLUTEN")):
+    return {
+        'name': name,
+        'address': "1 Main St",
+        'rating': 4.5,
+        'price_level': 1,
+        'website': "",
+        'menu_items': [{
+            'name': "Salad",
+            'description': "Greens",
+            'price': 9.0,
+            'category': "Mains",
+            'restrictions': list(restrictions)
+        }]
+    }
+
+def test_restriction_mask_round_trip():
+    assert set(mask_to_restrictions(restrictions_to_mask(["NUT", "VEGAN"]))) == {"NUT", "VEGAN"}
+    assert mask_to_restrictions(0) == ["NONE"]
+
+def test_append_and_reopen(tmp_path):
+    path = str(tmp_path / "menus.snap")
+    MenuSnapshot(path).append([restaurant("A"), restaurant("B")])
+
+    snapshot = MenuSnapshot(path)
+    assert len(snapshot) == 2
+    assert snapshot.get("A|1 Main St")['menu_items'][0]['restrictions'] == ["GLUTEN", "VEGAN"]
+
+def test_later_records_supersede_and_compact(tmp_path):
+    snapshot = MenuSnapshot(str(tmp_path / "menus.snap"))
+    snapshot.append([restaurant("A", ["VEGAN"])])
+    version = snapshot.version
+    snapshot.append([restaurant("A", ["HALAL"])])
+
+    assert snapshot.version != version
+    assert snapshot.get("A|1 Main St")['menu_items'][0]['restrictions'] == ["HALAL"]
+
+    snapshot.compact()
+    assert len(snapshot) == 1
+    assert snapshot.get("A|1 Main St")['menu_items'][0]['restrictions'] == ["HALAL"]
+
+def test_sees_appends_from_other_writers(tmp_path):
+    path = str(tmp_path / "menus.snap")
+    reader = MenuSnapshot(path)
+    MenuSnapshot(path).append([restaurant("A")])
+
+    assert reader.get("A|1 Main St") is None
+    reader.refresh()
+    assert reader.get("A|1 Main St") is not None
+
+def test_torn_tail_is_truncated_before_later_appends(tmp_path):
+    path = str(tmp_path / "menus.snap")
+    MenuSnapshot(path).append([restaurant("Cafe")])
+    intact_size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        # A writer crashed halfway through a record
+        f.write(encode_record("Torn|1 Main St", encode_restaurant(restaurant("Torn")))[:-7])
+
+    snapshot = MenuSnapshot(path)
+    assert snapshot.keys() == ["Cafe|1 Main St"]
+    assert os.path.getsize(path) == intact_size
+
+    snapshot.append([restaurant("Diner")])
+    assert sorted(MenuSnapshot(path).keys()) == ["Cafe|1 Main St", "Diner|1 Main St"]
+
+def test_short_writes_are_completed(tmp_path, monkeypatch):
+    path = str(tmp_path / "menus.snap")
+    snapshot = MenuSnapshot(path)
+    real_write = os.write
+    monkeypatch.setattr(snapshot_module.os, "write", lambda fd, data: real_write(fd, bytes(data[:10])))
+
+    snapshot.append([restaurant("Cafe"), restaurant("Diner")])
+
+    assert sorted(MenuSnapshot(path).keys()) == ["Cafe|1 Main St", "Diner|1 Main St"]
+
+def test_failed_write_leaves_no_torn_record(tmp_path, monkeypatch):
+    path = str(tmp_path / "menus.snap")
+    snapshot = MenuSnapshot(path)
+    snapshot.append([restaurant("Cafe")])
+    size = os.path.getsize(path)
+    real_write = os.write
+    calls = []
+
+    def disk_full(fd, data):
+        calls.append(fd)
+        if len(calls) > 1:
+            raise OSError(28, "No space left on device")
+        return real_write(fd, bytes(data[:10]))
+
+    monkeypatch.setattr(snapshot_module.os, "write", disk_full)
+    with pytest.raises(OSError):
+        snapshot.append([restaurant("Diner")])
+    assert os.path.getsize(path) == size
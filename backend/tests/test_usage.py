@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.providers import PrefixCache
+from backend.usage import in_context, record, track_request, usage_report
+
+STATIC_PREFIX = "Follow these instructions carefully. " * 150
+
+def test_request_report_spans_threads():
+    def classify(item):
+        record("classify_item", "gpt-4o", 1200, 1024, 5, 0.01)
+
+    with track_request() as request_id:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(in_context(classify), item) for item in ["Pad Thai", "Falafel Wrap", "Caesar Salad"]]
+            [future.result() for future in futures]
+    record("classify_item", "gpt-4o", 1200, 0, 5, 0.01)
+
+    stage = usage_report(request_id)["stages"]["classify_item"]
+    assert stage["calls"] == 3
+    assert stage["cached_tokens"] == 3 * 1024
+    assert stage["models"] == {"gpt-4o": 3}
+    assert usage_report()["stages"]["classify_item"]["calls"] >= 4
+    assert usage_report("unknown") is None
+
+def test_prefix_cache_rewards_static_prefixes():
+    cache = PrefixCache()
+    static_first = [[{"role": "system", "content": STATIC_PREFIX}, {"role": "user", "content": item}]
+                    for item in ["Pad Thai", "Falafel Wrap"]]
+    variable_first = [[{"role": "user", "content": item + STATIC_PREFIX}] for item in ["Pad Thai", "Falafel Wrap"]]
+
+    assert cache.lookup(static_first[0])[1] == 0
+    prompt_tokens, cached_tokens = cache.lookup(static_first[1])
+    assert 1024 <= cached_tokens <= prompt_tokens
+    assert [cache.lookup(messages)[1] for messages in variable_first] == [0, 0]
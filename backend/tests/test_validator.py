@@ -0,0 +1,26 @@
+import pytest
+from pydantic import ValidationError
+from backend.llm import DietOutput
+from backend.validator import OutputValidator, first_balanced_object, repair
+
+VALID = '{"is_single_dietary_field": true, "single_dietary_field": "Diet", "dietary_fields": {"gluten": null, "lactose": null, "vegan": null, "vegetarian": null, "halal": null, "kosher": null, "nut": null}}'
+
+def test_repairs_fenced_and_wrapped_replies():
+    assert repair(DietOutput, f"```json\n{VALID}\n```").single_dietary_field == "Diet"
+    assert repair(DietOutput, f"Here is the output: {VALID} Hope that helps {{!}}").is_single_dietary_field
+    assert repair(DietOutput, f"[{VALID}]").single_dietary_field == "Diet"
+
+def test_fills_missing_optional_fields():
+    output = repair(DietOutput, '{"is_single_dietary_field": false, "dietary_fields": {"vegan": "Vegan?"}}')
+    assert output.single_dietary_field is None
+    assert output.dietary_fields.vegan == "Vegan?" and output.dietary_fields.nut is None
+
+def test_balanced_object_ignores_braces_in_strings():
+    assert first_balanced_object('x {"a": "}{", "b": {"c": 1}} y') == '{"a": "}{", "b": {"c": 1}}'
+    assert first_balanced_object("no object {") is None
+
+def test_unrepairable_reply_is_sent_back():
+    with pytest.raises((ValueError, ValidationError)):
+        repair(DietOutput, '{"dietary_fields": {}}')
+    result = OutputValidator(pydantic_model=DietOutput).run(replies=["I could not find any columns"])
+    assert result["invalid_replies"] == ["I could not find any columns"]
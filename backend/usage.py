@@ -0,0 +1,144 @@
+import contextvars
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Reports for this many recent requests are kept in memory
+USAGE_REQUEST_HISTORY = int(os.getenv("USAGE_REQUEST_HISTORY", "200"))
+
+
+@dataclass
+class StageUsage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    models: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int, latency: float):
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.completion_tokens += completion_tokens
+        self.latency += latency
+        self.models[model] = self.models.get(model, 0) + 1
+
+    def report(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache_hit_rate": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            "latency": round(self.latency, 3),
+            "avg_latency": round(self.latency / self.calls, 3) if self.calls else 0.0,
+            "models": dict(self.models)
+        }
+
+
+class UsageLedger:
+    """Token counts and LLM latency per stage, where a stage is an LLM call site such as "classify_item"."""
+
+    def __init__(self):
+        self.stages: Dict[str, StageUsage] = {}
+        self._lock = threading.Lock()
+
+    def add(self, site: str, model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int, latency: float):
+        with self._lock:
+            self.stages.setdefault(site, StageUsage()).add(model, prompt_tokens, cached_tokens, completion_tokens, latency)
+
+    def report(self) -> Dict:
+        total = StageUsage()
+        with self._lock:
+            stages = {site: stage.report() for site, stage in self.stages.items()}
+            for stage in self.stages.values():
+                total.calls += stage.calls
+                total.prompt_tokens += stage.prompt_tokens
+                total.cached_tokens += stage.cached_tokens
+                total.completion_tokens += stage.completion_tokens
+                total.latency += stage.latency
+        total_report = total.report()
+        total_report.pop("models")
+        return {"total": total_report, "stages": stages}
+
+
+_process_ledger = UsageLedger()
+_request_ledgers: "OrderedDict[str, UsageLedger]" = OrderedDict()
+_request_lock = threading.Lock()
+_current_request: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("usage_request", default=None)
+
+
+@contextmanager
+def track_request(request_id: Optional[str] = None):
+    """Attribute every LLM call made in this context (and tasks/threads it spawns) to one request."""
+    request_id = request_id or uuid.uuid4().hex
+    with _request_lock:
+        _request_ledgers[request_id] = UsageLedger()
+        while len(_request_ledgers) > USAGE_REQUEST_HISTORY:
+            _request_ledgers.popitem(last=False)
+    token = _current_request.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _current_request.reset(token)
+
+
+def current_request() -> Optional[str]:
+    return _current_request.get()
+
+
+def in_context(fn: Callable) -> Callable:
+    """Bind fn to a copy of the caller's context, for work handed to a thread pool.
+
+    asyncio tasks and asyncio.to_thread copy the context themselves;
+    ThreadPoolExecutor.submit does not.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def record(site: str, model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int, latency: float):
+    _process_ledger.add(site, model, prompt_tokens, cached_tokens, completion_tokens, latency)
+    request_id = _current_request.get()
+    if request_id is not None:
+        with _request_lock:
+            ledger = _request_ledgers.get(request_id)
+        if ledger is not None:
+            ledger.add(site, model, prompt_tokens, cached_tokens, completion_tokens, latency)
+
+
+def _field(obj: Any, name: str) -> Any:
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def record_response_usage(site: str, model: str, usage: Any, latency: float):
+    """Record an OpenAI usage object (or its dict form, as Haystack returns it)."""
+    if usage is None:
+        record(site, model, 0, 0, 0, latency)
+        return
+    details = _field(usage, "prompt_tokens_details")
+    cached = _field(details, "cached_tokens") if details is not None else None
+    record(site, model, _field(usage, "prompt_tokens") or 0, cached or 0, _field(usage, "completion_tokens") or 0, latency)
+
+
+def usage_report(request_id: Optional[str] = None) -> Optional[Dict]:
+    """Per-stage report for one request, or for the whole process when request_id is None."""
+    if request_id is None:
+        return _process_ledger.report()
+    with _request_lock:
+        ledger = _request_ledgers.get(request_id)
+    return ledger.report() if ledger is not None else None
+
+
+def recent_requests() -> Dict[str, Dict]:
+    with _request_lock:
+        ledgers = list(_request_ledgers.items())
+    return {request_id: ledger.report()["total"] for request_id, ledger in ledgers}
@@ -1,34 +1,103 @@
 import json
+import re
+import typing
 import pydantic
 from pydantic import ValidationError
-from typing import Optional, List
+from typing import Any, Optional, List
 from colorama import Fore
 from haystack import component
 
+CODE_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+
+def first_balanced_object(text: str) -> Optional[str]:
+    """Return the first complete {...} in text, skipping braces inside JSON strings."""
+    start = text.find("{")
+    while start != -1:
+        depth, in_string, escaped = 0, False, False
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return text[start:index + 1]
+        start = text.find("{", start + 1)
+    return None
+
+
+def coerce(pydantic_model: pydantic.BaseModel, data: Any) -> Any:
+    """Nudge parsed JSON towards the model: unwrap a one-object list and fill missing optional fields with None."""
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        data = data[0]
+    if not isinstance(data, dict):
+        return data
+    coerced = dict(data)
+    for name, field in pydantic_model.model_fields.items():
+        annotation = field.annotation
+        if name not in coerced:
+            if type(None) in typing.get_args(annotation):
+                coerced[name] = None
+        elif isinstance(annotation, type) and issubclass(annotation, pydantic.BaseModel):
+            coerced[name] = coerce(annotation, coerced[name])
+    return coerced
+
+
+def repair(pydantic_model: pydantic.BaseModel, reply: str) -> pydantic.BaseModel:
+    """Validate a reply, repairing it locally first: strip code fences, take the first balanced object, coerce.
+
+    Raises ValueError or ValidationError when the reply can't be repaired.
+    """
+    text = reply.strip()
+    fenced = CODE_FENCE.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        candidate = first_balanced_object(text)
+        if candidate is None:
+            raise
+        data = json.loads(candidate)
+    return pydantic_model.model_validate(coerce(pydantic_model, data))
+
+
 @component
 class OutputValidator:
+    """Validates LLM replies against a pydantic model.
+
+    Stateless, so one instance can serve concurrent pipeline runs. Replies are
+    repaired locally when possible; only replies that can't be repaired are
+    routed back to the prompt builder for another LLM attempt.
+    """
+
     def __init__(self, pydantic_model: pydantic.BaseModel):
         self.pydantic_model = pydantic_model
-        self.iteration_counter = 0
 
     @component.output_types(valid_replies=List[str], invalid_replies=Optional[List[str]], error_message=Optional[str])
     def run(self, replies: List[str]):
-
-        self.iteration_counter += 1
-
         try:
-            output_dict = json.loads(replies[0])
-            self.pydantic_model.model_validate(output_dict)
+            output = repair(self.pydantic_model, replies[0])
             print(
                 Fore.GREEN
-                + f"OutputValidator at Iteration {self.iteration_counter}: Valid JSON from LLM - No need for looping: {replies[0]}"
+                + f"OutputValidator: Valid JSON from LLM - No need for looping: {replies[0]}"
             )
-            return {"valid_replies": replies}
+            return {"valid_replies": [output.model_dump_json()]}
         except (ValueError, ValidationError) as e:
             print(
                 Fore.RED
-                + f"OutputValidator at Iteration {self.iteration_counter}: Invalid JSON from LLM - Let's try again.\n"
+                + f"OutputValidator: Invalid JSON from LLM - Let's try again.\n"
                 f"Output from LLM:\n {replies[0]} \n"
                 f"Error from OutputValidator: {e}"
             )
-            return {"invalid_replies": replies, "error_message": str(e)}
\ No newline at end of file
+            return {"invalid_replies": replies, "error_message": str(e)}